@@ -23,6 +23,7 @@ setup(
             "predict=wildfire.cli.predict:predict",
             "download=wildfire.cli.download:download",
             "training-data=wildfire.cli.training_data:training_data",
+            "watch=wildfire.cli.watch:watch",
         ]
     },
 )
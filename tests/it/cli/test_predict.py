@@ -1,10 +1,13 @@
 import glob
+import json
 import os
 import tempfile
 
 from click.testing import CliRunner
+import numpy as np
 
 from wildfire.cli import predict
+from wildfire.models.dnn import inference
 
 
 def test_goes_threshold(goes_level_2):
@@ -23,3 +26,65 @@ def test_goes_threshold(goes_level_2):
         )
         assert actual.exit_code == 0
         assert len(glob.glob(os.path.join(temporary_directory, "*.json"))) == 1
+
+
+def test_goes_threshold_dry_run(goes_level_2):
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        actual = runner.invoke(
+            predict.goes_threshold,
+            [
+                "2019-10-27T20:01:00",
+                "2019-10-27T20:02:00",
+                "--satellite=noaa-goes17",
+                "--region=C",
+                f"--goes_directory={goes_level_2['level_1_directory']}",
+                f"--persist_directory={temporary_directory}",
+                "--adapt",
+                "--dry_run",
+            ],
+        )
+        assert actual.exit_code == 0
+        assert len(glob.glob(os.path.join(temporary_directory, "*.json"))) == 0
+
+
+def test_evaluate_goes_threshold(goes_level_2):
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        report_filepath = os.path.join(temporary_directory, "report.json")
+        actual = runner.invoke(
+            predict.evaluate_goes_threshold,
+            [
+                goes_level_2["level_1_directory"],
+                os.path.dirname(goes_level_2["level_2"]),
+                f"--report_file={report_filepath}",
+                "--tolerance=1",
+            ],
+        )
+        assert actual.exit_code == 0
+        with open(report_filepath) as buffer:
+            report = json.load(buffer)
+        assert report["counts"]["num_scans"] + report["counts"]["num_skipped"] == 1
+
+
+def test_goes_deep():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        model_filepath = os.path.join(temporary_directory, "model.npz")
+        inference.NumpyModel(weights=np.zeros(16), bias=100.0).save(model_filepath)
+        actual = runner.invoke(
+            predict.goes_deep,
+            [
+                "2019-12-01T10:27:00",
+                "2019-12-01T10:28:00",
+                model_filepath,
+                "--satellite=noaa-goes17",
+                "--region=M1",
+                "--goes_directory="
+                + os.path.join("tests", "resources", "goes_level_1_scan_no_wildfire"),
+                f"--persist_directory={temporary_directory}",
+                "--batch_size=16",
+            ],
+        )
+        assert actual.exit_code == 0
+        assert len(glob.glob(os.path.join(temporary_directory, "*.json"))) == 1
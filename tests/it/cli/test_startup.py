@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import pytest
+
+# dask.distributed is left out, since xarray imports it (through xarray.backends.locks)
+LAZY_MODULES = ("matplotlib.pyplot", "s3fs", "dask_jobqueue", "dask_mpi")
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "wildfire.cli.download",
+        "wildfire.cli.predict",
+        "wildfire.cli.training_data",
+        "wildfire.cli.watch",
+    ],
+)
+def test_lazy_imports(module):
+    output = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(*sorted(sys.modules))"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    imported = set(output.stdout.split())
+    assert module in imported
+    assert not imported.intersection(LAZY_MODULES)
@@ -0,0 +1,47 @@
+import datetime
+import glob
+import os
+import shutil
+import tempfile
+
+from click.testing import CliRunner
+
+from wildfire.cli import watch
+
+
+def test_goes_threshold(goes_level_1_filepaths_no_wildfire):
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        source_directory = os.path.join(temporary_directory, "bucket")
+        hour_directory = os.path.join(
+            source_directory,
+            "ABI-L1b-RadM",
+            "{:%Y/%j/%H}".format(datetime.datetime.utcnow()),
+        )
+        os.makedirs(hour_directory)
+        for filepath in goes_level_1_filepaths_no_wildfire:
+            shutil.copy(filepath, hour_directory)
+
+        actual = runner.invoke(
+            watch.goes_threshold,
+            [
+                "--satellite=noaa-goes17",
+                "--region=M1",
+                f"--goes_directory={temporary_directory}",
+                f"--persist_directory={temporary_directory}",
+                f"--source_directory={source_directory}",
+                "--max_polls=1",
+                "--since=2019-12-01",
+            ],
+        )
+        assert actual.exit_code == 0
+        assert len(glob.glob(os.path.join(temporary_directory, "*.json"))) == 0
+        assert (
+            len(
+                glob.glob(
+                    os.path.join(temporary_directory, "ABI-L1b-RadM", "**", "*.nc"),
+                    recursive=True,
+                )
+            )
+            == 16
+        )
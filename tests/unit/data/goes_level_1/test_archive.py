@@ -0,0 +1,92 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+from wildfire import multiprocessing
+from wildfire.data.goes_level_1 import archive
+
+
+def test_verify(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        hour_directory = os.path.join(
+            temporary_directory, "ABI-L1b-RadM", "2019", "335", "10"
+        )
+        os.makedirs(hour_directory)
+        local_filepaths = [
+            shutil.copy(filepath, hour_directory)
+            for filepath in goes_level_1_filepaths_no_wildfire
+        ]
+        verify_kwargs = {
+            "local_directory": temporary_directory,
+            "satellite": "noaa-goes17",
+            "region": "M1",
+            "start_time": datetime.datetime(2019, 12, 1, 10, 27),
+        }
+        assert set(archive.verify(**verify_kwargs).values()) == {"unrecorded"}
+
+        archive.record_files(local_filepaths=local_filepaths)
+        assert set(archive.verify(**verify_kwargs, use_checksum=True).values()) == {"ok"}
+
+        with open(local_filepaths[0], "r+b") as buffer:
+            buffer.truncate(100)
+        with open(local_filepaths[1], "r+b") as buffer:
+            buffer.seek(-1, os.SEEK_END)
+            last_byte = buffer.read(1)
+            buffer.seek(-1, os.SEEK_END)
+            buffer.write(bytes([last_byte[0] ^ 0xFF]))
+
+        actual = archive.verify(**verify_kwargs)
+        assert actual[local_filepaths[0]] == "partial"
+        assert actual[local_filepaths[1]] == "ok"  # same size, only a checksum can tell
+        actual = archive.verify(**verify_kwargs, use_checksum=True)
+        assert actual[local_filepaths[0]] == "partial"
+        assert actual[local_filepaths[1]] == "corrupt"
+        assert list(actual.values()).count("ok") == 14
+
+
+def test_verify_files_expected_sizes(goes_level_1_filepaths_no_wildfire):
+    filepath = goes_level_1_filepaths_no_wildfire[0]
+    actual = archive.verify_files(
+        local_filepaths=[filepath, "not_a_file.nc"],
+        expected_sizes={filepath: os.path.getsize(filepath) - 1},
+    )
+    assert actual == {filepath: "partial", "not_a_file.nc": "missing"}
+
+
+def test_record_files_without_checksum(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        filepath = shutil.copy(goes_level_1_filepaths_no_wildfire[0], temporary_directory)
+        archive.record_files(
+            local_filepaths=[filepath],
+            etags={filepath: "etag"},
+            sizes={filepath: os.path.getsize(filepath) + 1},
+            use_checksum=False,
+        )
+        assert archive.read_manifest(temporary_directory) == {
+            os.path.basename(filepath): {
+                "size": os.path.getsize(filepath) + 1,
+                "md5": "",
+                "etag": "etag",
+            }
+        }
+        # a download shorter than listed in Amazon S3 is partial
+        assert archive.verify_files([filepath], use_checksum=True) == {
+            filepath: "partial"
+        }
+
+
+def test_update_manifest_concurrently():
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        num_entries = 32
+        multiprocessing.map_function(
+            function=archive.update_manifest,
+            function_args=[
+                [temporary_directory] * num_entries,
+                [{f"{index}.nc": {"size": index}} for index in range(num_entries)],
+            ],
+            backend="processes",
+        )
+        assert archive.read_manifest(temporary_directory) == {
+            f"{index}.nc": {"size": index} for index in range(num_entries)
+        }
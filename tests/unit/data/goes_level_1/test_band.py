@@ -1,11 +1,14 @@
 import datetime
 import os
+import pickle
 import tempfile
 
+import fsspec
 import numpy as np
 import scipy.stats as st
 import xarray as xr
 
+from wildfire import instrumentation
 from wildfire.data import goes_level_1
 
 
@@ -61,6 +64,50 @@ def test_filter_bad_pixels(goes_level_1_mesoscale):
     assert np.isnan(actual.reflectance_factor).sum() == 0
 
 
+def test_filter_bad_pixels_mask(goes_level_1_mesoscale):
+    dataset = goes_level_1_mesoscale.copy(deep=True)
+    dataset.DQF[:10, :20] = 2
+    dataset.DQF[-1, -1] = np.nan
+    goes_band = goes_level_1.GoesBand(dataset=dataset)
+    actual = goes_band.filter_bad_pixels()
+
+    assert actual.dataset is dataset
+    assert actual.mask.sum() == 201
+    assert np.isnan(actual.reflectance_factor.data).sum() == 201
+    assert np.isnan(actual.radiance.data[:10, :20]).all()
+    assert np.isnan(dataset.Rad.data).sum() == 0
+    expected = goes_level_1.band.filter_bad_pixels(dataset=dataset)
+    assert actual.masked_dataset.Rad.equals(expected.Rad)
+
+    rescaled = actual.rescale_to_2km()
+    assert rescaled.mask.shape == rescaled.dataset.Rad.shape
+    assert np.isnan(rescaled.reflectance_factor.data).sum() == rescaled.mask.sum() == 50
+
+
+def test_derived_products_are_cached(goes_level_1_mesoscale):
+    instrumentation.reset()
+    goes_band = goes_level_1.GoesBand(dataset=goes_level_1_mesoscale)
+    reflectance_factor = goes_band.reflectance_factor
+    assert goes_band.reflectance_factor is reflectance_factor
+    assert goes_band.parse() is reflectance_factor
+    assert instrumentation.summary()["calibrate"]["count"] == 1  # not the cache hits
+    assert goes_band.normalize() is goes_band.normalize()
+    assert goes_band.rescale_to_2km() is goes_band.rescale_to_2km()
+    assert goes_band.cache_bytes >= reflectance_factor.nbytes
+
+    unpickled = pickle.loads(pickle.dumps(goes_band))
+    assert unpickled.cache_bytes == 0
+    assert unpickled.reflectance_factor.equals(reflectance_factor)
+
+    goes_band.release()
+    assert goes_band.cache_bytes == 0
+    assert goes_band.reflectance_factor is not reflectance_factor
+
+    goes_band.cache_budget_bytes = reflectance_factor.nbytes
+    goes_band.normalize()
+    assert goes_band.cache_bytes <= goes_band.cache_budget_bytes
+
+
 def test_rescale_to_2km(goes_level_1_mesoscale, goes_level_1_conus, goes_level_1_full):
     actual = goes_level_1.GoesBand(dataset=goes_level_1_mesoscale).rescale_to_2km()
     assert isinstance(actual, goes_level_1.GoesBand)
@@ -111,3 +158,144 @@ def test_get_goes_band_local(goes_level_1_filepaths_no_wildfire):
     assert actual.region == region
     assert actual.satellite == satellite
     assert actual.scan_time_utc == scan_time
+
+
+class _CountingFile:
+    """Count the bytes read from a file object."""
+
+    def __init__(self, buffer, num_bytes):
+        self._buffer = buffer
+        self._num_bytes = num_bytes
+
+    def read(self, size=-1):
+        data = self._buffer.read(size)
+        self._num_bytes.append(len(data))
+        return data
+
+    def readinto(self, array):
+        num_bytes = self._buffer.readinto(array)
+        self._num_bytes.append(num_bytes)
+        return num_bytes
+
+    def __getattr__(self, name):
+        return getattr(self._buffer, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._buffer.close()
+
+
+class _CountingFileSystem:
+    """Local filesystem that counts the bytes read from the files it opens."""
+
+    def __init__(self):
+        self.filesystem = fsspec.filesystem("file")
+        self.num_bytes = []
+
+    def open(self, path, mode="rb", **kwargs):
+        return _CountingFile(self.filesystem.open(path, mode=mode), self.num_bytes)
+
+    @property
+    def bytes_read(self):
+        return sum(self.num_bytes)
+
+
+def test_read_netcdf_remote(goes_level_1_filepaths_no_wildfire):
+    local_filepath = goes_level_1_filepaths_no_wildfire[0]
+    expected = goes_level_1.read_netcdf(local_filepath=local_filepath)
+
+    actual = goes_level_1.band.read_netcdf_remote(
+        filepath=local_filepath, filesystem=fsspec.filesystem("file")
+    )
+    assert isinstance(actual, goes_level_1.GoesBand)
+    assert actual.band_id == expected.band_id
+    assert actual.scan_time_utc == expected.scan_time_utc
+    assert set(actual.dataset.data_vars) <= set(goes_level_1.band.REMOTE_VARIABLES)
+    assert actual.dataset.Rad.equals(expected.dataset.Rad)
+    assert actual.parse().equals(expected.parse())
+
+    x_slice = slice(expected.dataset.x.values[10], expected.dataset.x.values[19])
+    y_slice = slice(expected.dataset.y.values[30], expected.dataset.y.values[49])
+    actual = goes_level_1.band.read_netcdf_remote(
+        filepath=local_filepath,
+        filesystem=fsspec.filesystem("file"),
+        x_slice=x_slice,
+        y_slice=y_slice,
+    )
+    assert actual.dataset.Rad.shape == (20, 10)
+    assert actual.dataset.Rad.equals(expected.dataset.Rad.sel(x=x_slice, y=y_slice))
+
+
+def test_read_netcdf_remote_reads_only_the_slice(goes_level_1_filepaths_no_wildfire):
+    # band 2, of 64 chunks of Rad
+    local_filepath = max(goes_level_1_filepaths_no_wildfire, key=os.path.getsize)
+    expected = goes_level_1.read_netcdf(local_filepath=local_filepath)
+
+    filesystem = _CountingFileSystem()
+    actual = goes_level_1.band.read_netcdf_remote(
+        filepath=local_filepath,
+        filesystem=filesystem,
+        x_slice=slice(expected.dataset.x.values[10], expected.dataset.x.values[19]),
+        y_slice=slice(expected.dataset.y.values[30], expected.dataset.y.values[49]),
+    )
+    assert actual.dataset.Rad.shape == (20, 10)
+    assert filesystem.bytes_read < os.path.getsize(local_filepath) / 10
+
+    filesystem = _CountingFileSystem()
+    goes_level_1.band.read_netcdf_remote(filepath=local_filepath, filesystem=filesystem)
+    assert filesystem.bytes_read > os.path.getsize(local_filepath) / 2
+
+
+def test_get_goes_band_remote(goes_level_1_filepaths_no_wildfire, monkeypatch):
+    local_filepath = goes_level_1_filepaths_no_wildfire[0]
+    region, channel, satellite, scan_time = goes_level_1.utilities.parse_filename(
+        local_filepath
+    )
+    filesystem = _CountingFileSystem()
+    monkeypatch.setattr(
+        goes_level_1.downloader, "list_s3_files", lambda **kwargs: [local_filepath]
+    )
+    monkeypatch.setattr(goes_level_1.downloader, "get_s3_filesystem", lambda: filesystem)
+    monkeypatch.setattr(goes_level_1.downloader, "download_file", None)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        actual = goes_level_1.get_goes_band(
+            satellite=goes_level_1.utilities.SATELLITE_LONG_HAND[satellite],
+            region=region,
+            channel=channel,
+            scan_time_utc=scan_time,
+            local_directory=temporary_directory,
+            remote=True,
+        )
+        assert os.listdir(temporary_directory) == []
+    assert filesystem.bytes_read > 0
+    assert actual.dataset.Rad.equals(
+        goes_level_1.read_netcdf(local_filepath=local_filepath).dataset.Rad
+    )
+
+
+def test_get_encoding(goes_level_1_mesoscale):
+    assert goes_level_1.band.get_encoding(dataset=goes_level_1_mesoscale) == {
+        "x": {"dtype": "float32"},
+        "y": {"dtype": "float32"},
+    }
+    actual = goes_level_1.band.get_encoding(
+        dataset=goes_level_1_mesoscale, complevel=3, chunksizes=(4096, 250), pack=True
+    )
+    assert actual["Rad"]["complevel"] == 3
+    assert actual["Rad"]["chunksizes"] == (1000, 250)
+    assert (
+        actual["Rad"]["scale_factor"]
+        == goes_level_1_mesoscale.Rad.encoding["scale_factor"]
+    )
+
+    filtered = goes_level_1.GoesBand(dataset=goes_level_1_mesoscale).filter_bad_pixels()
+    filtered.dataset.Rad.encoding = {}
+    with tempfile.TemporaryDirectory() as temp_directory:
+        filepath = filtered.to_netcdf(directory=temp_directory, complevel=1, pack=True)
+        actual = xr.open_dataset(filepath)
+        assert actual.Rad.encoding["dtype"] == np.uint16
+        np.testing.assert_allclose(
+            actual.Rad.values, filtered.dataset.Rad.values, rtol=1e-4, atol=1e-2
+        )
@@ -0,0 +1,70 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from wildfire.data.goes_level_1 import compact, scan, utilities
+
+
+def test_compact_files(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        hour_directory = os.path.join(
+            temporary_directory, "ABI-L1b-RadM", "2019", "335", "10"
+        )
+        os.makedirs(hour_directory)
+        local_filepaths = [
+            shutil.copy(filepath, hour_directory)
+            for filepath in goes_level_1_filepaths_no_wildfire
+        ]
+        compact_kwargs = {
+            "local_directory": temporary_directory,
+            "satellite": "noaa-goes17",
+            "region": "M1",
+            "start_time": datetime.datetime(2019, 12, 1, 10, 27),
+            "end_time": datetime.datetime(2019, 12, 1, 10, 28),
+        }
+        actual = compact.compact_files(**compact_kwargs)
+        assert actual == [
+            os.path.join(
+                temporary_directory, "ABI-L1b-RadM", "2019", "335", "compact_M1_G17.nc"
+            )
+        ]
+        compact.compact_files(**compact_kwargs)  # scans already in the store are skipped
+
+        expected = scan.read_netcdfs(local_filepaths=local_filepaths, use_compact=False)
+        for filepath in local_filepaths:
+            os.remove(filepath)
+        assert sorted(os.listdir(os.path.dirname(actual[0]))) == [
+            "10",
+            "compact_M1_G17.nc",
+        ]
+        listed_filepaths = utilities.list_local_files(
+            local_directory=temporary_directory,
+            satellite="noaa-goes17",
+            region="M1",
+            start_time=datetime.datetime(2019, 12, 1, 10, 27),
+        )
+        assert sorted(listed_filepaths) == sorted(local_filepaths)
+        assert utilities.list_local_files(use_compact=False, **compact_kwargs) == []
+        actual = scan.get_goes_scan(
+            satellite="noaa-goes17",
+            region="M1",
+            scan_time_utc=datetime.datetime(2019, 12, 1, 10, 27),
+            local_directory=temporary_directory,
+            s3=False,
+        )
+        assert actual.scan_time_utc == expected.scan_time_utc
+        for band_name, expected_band in expected.iteritems():
+            actual_band = actual[band_name]
+            assert actual_band.band_id == expected_band.band_id
+            assert actual_band.dataset.t.values == expected_band.dataset.t.values
+            np.testing.assert_array_equal(
+                actual_band.dataset.x.values, expected_band.dataset.x.values
+            )
+            for variable in ("Rad", "DQF", "kappa0", "planck_fk1"):
+                np.testing.assert_array_equal(
+                    actual_band.dataset[variable].values,
+                    expected_band.dataset[variable].values,
+                )
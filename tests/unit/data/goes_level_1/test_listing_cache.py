@@ -0,0 +1,70 @@
+import datetime
+import os
+import tempfile
+
+import fsspec
+
+from wildfire.data.goes_level_1 import listing_cache
+
+HOUR_PREFIX = os.path.abspath(
+    os.path.join(
+        "tests",
+        "resources",
+        "goes_level_1_scan_no_wildfire",
+        "ABI-L1b-RadM",
+        "2019",
+        "335",
+        "10",
+    )
+)
+
+
+class CountingFileSystem:
+    def __init__(self):
+        self.filesystem = fsspec.filesystem("file")
+        self.num_listings = 0
+
+    def invalidate_cache(self, path=None):
+        self.filesystem.invalidate_cache(path)
+
+    def ls(self, path, detail=True):
+        self.num_listings += 1
+        return self.filesystem.ls(path, detail=detail)
+
+
+def test_listing_cache_final():
+    filesystem = CountingFileSystem()
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        cache = listing_cache.ListingCache(directory=temporary_directory)
+        assert cache.get(prefix=HOUR_PREFIX) is None
+
+        actual = cache.list_prefix(prefix=HOUR_PREFIX, filesystem=filesystem)
+        assert len(actual) == 16
+        assert {"name", "size", "etag"} == set(actual[0].keys())
+        assert filesystem.num_listings == 1
+
+        actual = cache.list_prefix(prefix=HOUR_PREFIX, filesystem=filesystem)
+        assert len(actual) == 16
+        assert filesystem.num_listings == 1
+        assert len(cache.get(prefix=HOUR_PREFIX)) == 16
+
+        cache.list_prefix(prefix=HOUR_PREFIX, filesystem=filesystem, refresh=True)
+        assert filesystem.num_listings == 2
+
+
+def test_listing_cache_open_hour():
+    filesystem = CountingFileSystem()
+    now = datetime.datetime(2019, 12, 1, 10, 59)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        cache = listing_cache.ListingCache(directory=temporary_directory)
+        cache.list_prefix(prefix=HOUR_PREFIX, filesystem=filesystem, now=now)
+        cache.list_prefix(prefix=HOUR_PREFIX, filesystem=filesystem, now=now)
+        assert filesystem.num_listings == 2
+        assert cache.get(prefix=HOUR_PREFIX) is None
+
+
+def test_is_final():
+    prefix = "noaa-goes17/ABI-L1b-RadM/2019/335/10"
+    assert not listing_cache.is_final(prefix, now=datetime.datetime(2019, 12, 1, 10, 30))
+    assert not listing_cache.is_final(prefix, now=datetime.datetime(2019, 12, 1, 11, 5))
+    assert listing_cache.is_final(prefix, now=datetime.datetime(2019, 12, 1, 12))
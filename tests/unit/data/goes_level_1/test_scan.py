@@ -1,8 +1,11 @@
 import datetime
 import glob
+import multiprocessing
 import os
 import tempfile
 
+import fsspec
+import numpy as np
 import pytest
 
 from wildfire.data import goes_level_1
@@ -51,6 +54,27 @@ def test_read_netcdfs(goes_level_1_filepaths_no_wildfire):
     assert isinstance(actual, goes_level_1.GoesScan)
 
 
+def test_read_netcdfs_in_daemonic_process(goes_level_1_filepaths_no_wildfire):
+    # daemonic processes, such as the workers of a pool, cannot start processes
+    with multiprocessing.Pool(processes=1) as pool:
+        actual = pool.apply(
+            goes_level_1.read_netcdfs, (goes_level_1_filepaths_no_wildfire,)
+        )
+    assert isinstance(actual, goes_level_1.GoesScan)
+
+
+def test_read_netcdfs_parallel(goes_level_1_filepaths_no_wildfire):
+    expected = goes_level_1.read_netcdfs(
+        local_filepaths=goes_level_1_filepaths_no_wildfire, max_workers=1
+    )
+    actual = goes_level_1.read_netcdfs(
+        local_filepaths=goes_level_1_filepaths_no_wildfire, max_workers=4,
+    )
+    assert actual == expected
+    for band_name, expected_band in expected.iteritems():
+        assert actual[band_name].dataset.equals(expected_band.dataset)
+
+
 def test_rescale_to_2km(goes_level_1_filepaths_no_wildfire):
     original = goes_level_1.read_netcdfs(goes_level_1_filepaths_no_wildfire)
     actual = original.rescale_to_2km()
@@ -62,6 +86,55 @@ def test_rescale_to_2km(goes_level_1_filepaths_no_wildfire):
         assert band_data.dataset.Rad.shape == (500, 500)
 
 
+def test_scan_shares_cache(goes_level_1_filepaths_no_wildfire):
+    goes_scan = goes_level_1.read_netcdfs(goes_level_1_filepaths_no_wildfire)
+    rescaled = goes_scan.rescale_to_2km()
+    assert rescaled.cache is goes_scan.cache
+    for _, goes_band in rescaled.iteritems():
+        assert goes_band.cache is goes_scan.cache
+
+    band_7, band_14 = rescaled["band_7"].parse(), rescaled["band_14"].parse()
+    assert goes_scan.cache.nbytes >= band_7.nbytes + band_14.nbytes
+    goes_scan.cache.budget_bytes = band_7.nbytes
+    assert rescaled["band_14"].parse() is band_14
+    rescaled["band_7"].release()
+    rescaled["band_7"].parse()
+    assert goes_scan.cache.nbytes <= band_7.nbytes  # one budget for every band
+
+    goes_scan.release()
+    assert goes_scan.cache.nbytes == 0
+    assert rescaled["band_14"].parse() is not band_14
+
+
+def test_get_goes_scan_remote(goes_level_1_filepaths_no_wildfire, monkeypatch):
+    region, _, satellite, scan_time = goes_level_1.utilities.parse_filename(
+        goes_level_1_filepaths_no_wildfire[0]
+    )
+    monkeypatch.setattr(
+        goes_level_1.downloader,
+        "list_s3_files",
+        lambda **kwargs: goes_level_1_filepaths_no_wildfire,
+    )
+    monkeypatch.setattr(
+        goes_level_1.downloader, "get_s3_filesystem", lambda: fsspec.filesystem("file")
+    )
+    monkeypatch.setattr(goes_level_1.downloader, "download_files", None)
+    expected = goes_level_1.read_netcdfs(goes_level_1_filepaths_no_wildfire)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        actual = goes_level_1.get_goes_scan(
+            satellite=goes_level_1.utilities.SATELLITE_LONG_HAND[satellite],
+            region=region,
+            scan_time_utc=scan_time,
+            local_directory=temporary_directory,
+            max_workers=1,
+            remote=True,
+        )
+        assert os.listdir(temporary_directory) == []
+    assert actual == expected
+    for band_name, expected_band in expected.iteritems():
+        assert actual[band_name].dataset.Rad.equals(expected_band.dataset.Rad)
+
+
 def test_get_goes_scan_local(goes_level_1_filepaths_no_wildfire):
     region, _, satellite, scan_time = goes_level_1.utilities.parse_filename(
         goes_level_1_filepaths_no_wildfire[0]
@@ -80,3 +153,30 @@ def test_get_goes_scan_local(goes_level_1_filepaths_no_wildfire):
     assert actual.region == region
     assert actual.satellite == satellite
     assert actual.scan_time_utc == scan_time
+
+
+def test_scan_to_netcdf_encodings(goes_level_1_filepaths_no_wildfire):
+    expected = goes_level_1.read_netcdfs(
+        local_filepaths=goes_level_1_filepaths_no_wildfire, max_workers=1
+    )
+    with tempfile.TemporaryDirectory() as temp_directory:
+        filepaths = expected.to_netcdf(
+            directory=temp_directory, complevel=4, chunksizes=(256, 256), pack=True
+        )
+        assert len(filepaths) == 16
+        actual = goes_level_1.read_netcdfs(local_filepaths=filepaths, use_compact=False)
+        for band_name, expected_band in expected.iteritems():
+            np.testing.assert_array_equal(
+                actual[band_name].dataset.Rad.values, expected_band.dataset.Rad.values
+            )
+
+        (filepath,) = expected.to_netcdf(
+            directory=temp_directory, complevel=1, pack=True, single_file=True,
+        )
+        assert os.path.basename(filepath).startswith("OR_ABI-L1b-RadM1-M6_G17_s")
+        actual = goes_level_1.read_netcdf_groups(local_filepath=filepath)
+        assert actual.scan_time_utc == expected.scan_time_utc
+        for band_name, expected_band in expected.iteritems():
+            np.testing.assert_array_equal(
+                actual[band_name].dataset.Rad.values, expected_band.dataset.Rad.values
+            )
@@ -94,6 +94,27 @@ def test_decide_fastest_glob_patterns():
     assert actual[0].count("*") == 4
 
 
+def test_list_hour_prefixes():
+    actual = utilities.list_hour_prefixes(
+        directory="noaa-goes17",
+        region="M1",
+        start_time=datetime.datetime(2019, 12, 31, 23, 30),
+        end_time=datetime.datetime(2020, 1, 1, 1, 0),
+    )
+    assert actual == [
+        "noaa-goes17/ABI-L1b-RadM/2019/365/23",
+        "noaa-goes17/ABI-L1b-RadM/2020/001/00",
+        "noaa-goes17/ABI-L1b-RadM/2020/001/01",
+    ]
+
+    actual = utilities.list_hour_prefixes(
+        directory="noaa-goes16",
+        region="C",
+        start_time=datetime.datetime(2019, 1, 1, 1, 1),
+    )
+    assert actual == ["noaa-goes16/ABI-L1b-RadC/2019/001/01"]
+
+
 def test_list_local_files(goes_level_1_filepaths_no_wildfire):
     actual = utilities.list_local_files(
         local_directory=os.path.join(
@@ -115,3 +136,11 @@ def test_list_local_files(goes_level_1_filepaths_no_wildfire):
         end_time=datetime.datetime(2019, 12, 1, 10, 28),
     )
     np.testing.assert_array_equal(actual, goes_level_1_filepaths_no_wildfire)
+
+
+def test_estimate_scan_memory():
+    mesoscale = utilities.estimate_scan_memory(region="M1")
+    full_disk = utilities.estimate_scan_memory(region="F")
+    assert mesoscale == utilities.estimate_scan_memory(region="M2")
+    assert 10e9 < full_disk < 20e9
+    assert utilities.estimate_scan_memory(region="F", num_copies=4) > full_disk
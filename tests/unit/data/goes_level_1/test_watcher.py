@@ -0,0 +1,104 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+import fsspec
+
+from wildfire.data.goes_level_1 import watcher
+
+SCAN_DIRECTORY = os.path.join("tests", "resources", "goes_level_1_scan_no_wildfire")
+SCAN_TIME = datetime.datetime(2019, 12, 1, 10, 30)
+SINCE = datetime.datetime(2019, 12, 1, 10)
+
+
+def test_scan_watcher(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        scan_watcher = watcher.ScanWatcher(
+            satellite="noaa-goes17",
+            region="M1",
+            local_directory=temporary_directory,
+            remote_directory=SCAN_DIRECTORY,
+            filesystem=fsspec.filesystem("file"),
+            since=SINCE,
+        )
+        actual = scan_watcher.poll(now=SCAN_TIME)
+        assert len(actual) == 1
+        assert len(actual[0]) == 16
+        for filepath in actual[0]:
+            assert filepath.startswith(temporary_directory)
+            assert os.path.exists(filepath)
+
+        assert scan_watcher.poll(now=SCAN_TIME) == []
+
+
+def test_scan_watcher_partial_scan(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as bucket_directory:
+        with tempfile.TemporaryDirectory() as local_directory:
+            scan_watcher = watcher.ScanWatcher(
+                satellite="noaa-goes17",
+                region="M1",
+                local_directory=local_directory,
+                remote_directory=bucket_directory,
+                filesystem=fsspec.filesystem("file"),
+                since=SINCE,
+            )
+            assert scan_watcher.poll(now=SCAN_TIME) == []
+
+            hour_directory = os.path.join(
+                bucket_directory, "ABI-L1b-RadM", "2019", "335", "10"
+            )
+            os.makedirs(hour_directory)
+            filepaths = sorted(goes_level_1_filepaths_no_wildfire)
+            for filepath in filepaths[:10]:
+                shutil.copy(filepath, hour_directory)
+            assert scan_watcher.poll(now=SCAN_TIME) == []
+
+            for filepath in filepaths[10:]:
+                shutil.copy(filepath, hour_directory)
+            actual = scan_watcher.poll(now=SCAN_TIME)
+            assert len(actual) == 1
+            assert len(actual[0]) == 16
+
+
+def test_scan_watcher_retries_failed_downloads(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        scan_watcher = watcher.ScanWatcher(
+            satellite="noaa-goes17",
+            region="M1",
+            local_directory=temporary_directory,
+            remote_directory=SCAN_DIRECTORY,
+            filesystem=fsspec.filesystem("file"),
+            since=SINCE,
+        )
+        download = scan_watcher._download
+        failed = []
+
+        def fail_once(remote_filepath):
+            if not failed:
+                failed.append(remote_filepath)
+                raise ConnectionError("Connection reset by peer")
+            return download(remote_filepath)
+
+        scan_watcher._download = fail_once
+        assert scan_watcher.poll(now=SCAN_TIME) == []
+        assert len(failed) == 1
+
+        actual = scan_watcher.poll(now=SCAN_TIME)
+        assert len(actual) == 1
+        assert len(actual[0]) == 16
+        assert scan_watcher.poll(now=SCAN_TIME) == []
+
+
+def test_scan_watcher_skips_backlog(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        scan_watcher = watcher.ScanWatcher(
+            satellite="noaa-goes17",
+            region="M1",
+            local_directory=temporary_directory,
+            remote_directory=SCAN_DIRECTORY,
+            filesystem=fsspec.filesystem("file"),
+        )
+        assert scan_watcher.poll(now=SCAN_TIME) == []
+        assert scan_watcher.since == SCAN_TIME
+        assert os.listdir(temporary_directory) == []
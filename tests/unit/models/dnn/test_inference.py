@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from wildfire.models.dnn import inference
+
+
+def test_predict_tiles():
+    data = np.random.RandomState(0).normal(size=(50, 70, 16)).astype(np.float32)
+    actual = inference.predict_tiles(
+        data=data,
+        model=lambda batch: batch[:, :, :, 0],
+        height=16,
+        width=16,
+        stride=8,
+        batch_size=5,
+    )
+    np.testing.assert_allclose(actual, data[:, :, 0], rtol=1e-6)
+
+    model = inference.NumpyModel(weights=np.eye(16)[3], bias=0.0, num_threads=3)
+    actual = inference.predict_tiles(
+        data=data, model=model, height=10, width=10, stride=10, batch_size=7
+    )
+    np.testing.assert_allclose(actual, 1 / (1 + np.exp(-data[:, :, 3])), rtol=1e-6)
+
+
+def test_load_model():
+    model = inference.NumpyModel(weights=np.arange(16), bias=-1.0)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        filepath = os.path.join(temporary_directory, "model.npz")
+        model.save(filepath)
+        actual = inference.load_model(filepath=filepath, num_threads=2)
+        np.testing.assert_array_equal(actual.weights, model.weights)
+        assert actual.num_threads == 2
+
+        with pytest.raises(ValueError):
+            inference.load_model(filepath=os.path.join(temporary_directory, "model.h5"))
+
+
+def test_parse_scan_for_wildfire(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        filepath = os.path.join(temporary_directory, "model.npz")
+        for bias, expected in ((-100.0, type(None)), (100.0, dict)):
+            inference.NumpyModel(weights=np.zeros(16), bias=bias).save(filepath)
+            inference.load_model.cache_clear()
+            actual = inference.parse_scan_for_wildfire(
+                filepaths=goes_level_1_filepaths_no_wildfire,
+                model_filepath=filepath,
+                height=32,
+                width=32,
+                stride=24,
+            )
+            assert isinstance(actual, expected)
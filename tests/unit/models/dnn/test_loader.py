@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from wildfire.models.dnn import loader
+
+
+def _write_training_data(directory, num_files=3, height=4, width=4):
+    counts = []
+    for file_index in range(num_files):
+        num_patches = 5 + 7 * file_index
+        ids = 1000 * file_index + np.arange(num_patches, dtype=np.float32)
+        abi = np.broadcast_to(ids[:, None, None, None], (num_patches, height, width, 16))
+        fire_temp = np.full((num_patches, height, width), np.nan, dtype=np.float32)
+        fire_temp[:, 0, 0] = ids
+        xr.Dataset(
+            {"abi": xr.DataArray(abi.copy()), "fire_temp": xr.DataArray(fire_temp)}
+        ).to_netcdf(os.path.join(directory, f"cnn_training_{file_index}.nc"))
+        counts.append(num_patches)
+    return counts
+
+
+def test_patch_index():
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        counts = _write_training_data(temporary_directory)
+        actual = loader.PatchIndex.from_directory(temporary_directory)
+    assert list(actual.counts) == counts
+    assert len(actual) == sum(counts)
+    assert actual.locate(5) == (actual.filepaths[1], 0)
+    with pytest.raises(IndexError):
+        actual.locate(len(actual))
+
+
+def test_batch_loader():
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        _write_training_data(temporary_directory)
+        patch_index = loader.PatchIndex.from_directory(temporary_directory)
+        assert isinstance(
+            loader.open_variables(patch_index.filepaths[0])["abi"], np.memmap
+        )
+
+        ordered = loader.BatchLoader(patch_index, batch_size=4, shuffle=False)
+        ordered_ids = np.concatenate([abi[:, 0, 0, 0] for abi, _ in ordered])
+        assert len(list(ordered)) == len(ordered) == 9
+
+        shuffled = loader.BatchLoader(
+            patch_index, batch_size=4, buffer_size=8, block_size=3, augment=True, seed=0
+        )
+        batches = list(shuffled)
+        for abi, fire_temp in batches:
+            assert abi.dtype == fire_temp.dtype == np.float32
+            assert abi.shape[1:] == (4, 4, 16) and fire_temp.shape[1:] == (4, 4)
+            # fire pixels move with their patch, to one of the corners
+            corners = fire_temp[:, [0, 0, -1, -1], [0, -1, 0, -1]]
+            np.testing.assert_array_equal(np.nanmax(corners, axis=1), abi[:, 0, 0, 0])
+        shuffled_ids = np.concatenate([abi[:, 0, 0, 0] for abi, _ in batches])
+
+        # stopping early releases the background thread
+        next(iter(shuffled))
+
+    np.testing.assert_array_equal(np.sort(shuffled_ids), ordered_ids)
+    assert not np.array_equal(shuffled_ids, ordered_ids)
+    np.testing.assert_array_equal(ordered_ids, np.sort(ordered_ids))
@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from wildfire.data import goes_level_1
+from wildfire.models.dnn import normalization, training_data
+
+
+def test_running_statistics():
+    random_state = np.random.RandomState(0)
+    data = random_state.normal(loc=280, scale=20, size=(16, 30, 40))
+    data[:6] = random_state.uniform(size=(6, 30, 40))
+    data[3, :5] = np.nan
+
+    expected = normalization.RunningStatistics().update(data)
+    actual = normalization.RunningStatistics()
+    for part in np.array_split(data, 4, axis=1):
+        actual.merge(normalization.RunningStatistics().update(part))
+
+    np.testing.assert_array_equal(actual.count, np.isfinite(data).sum(axis=(1, 2)))
+    np.testing.assert_allclose(actual.mean, np.nanmean(data, axis=(1, 2)))
+    np.testing.assert_allclose(actual.std, np.nanstd(data, axis=(1, 2)))
+    np.testing.assert_allclose(actual.variance, expected.variance)
+    np.testing.assert_array_equal(actual.minimum, np.nanmin(data, axis=(1, 2)))
+    np.testing.assert_array_equal(actual.maximum, np.nanmax(data, axis=(1, 2)))
+    np.testing.assert_array_equal(actual.histogram, expected.histogram)
+    np.testing.assert_array_equal(actual.histogram.sum(axis=1), actual.count)
+
+    normalized = actual.normalize(data)
+    np.testing.assert_allclose(np.nanmean(normalized, axis=(1, 2)), 0, atol=1e-9)
+    np.testing.assert_allclose(np.nanstd(normalized, axis=(1, 2)), 1)
+
+    with pytest.raises(ValueError):
+        actual.merge(normalization.RunningStatistics(bin_edges=np.zeros((16, 3))))
+
+    # constant and empty bands are centered, not divided by zero
+    data[0] = 0.5
+    data[1] = np.nan
+    normalized = normalization.RunningStatistics().update(data).normalize(data)
+    np.testing.assert_array_equal(normalized[0], 0)
+    assert np.isnan(normalized[1]).all()
+    np.testing.assert_allclose(np.nanstd(normalized[2:], axis=(1, 2)), 1)
+
+
+def test_save_and_load_statistics():
+    data = np.random.RandomState(0).uniform(size=(16, 10, 10))
+    statistics = {
+        normalization.GLOBAL: normalization.RunningStatistics().update(data),
+        "M1": normalization.RunningStatistics().update(data[:, :5]),
+    }
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        filepath = os.path.join(temporary_directory, "statistics.json")
+        normalization.save_statistics(statistics=statistics, filepath=filepath)
+        actual = normalization.load_statistics(filepath)
+    assert actual == statistics
+    assert normalization.select_statistics(actual, region="M1") == statistics["M1"]
+    assert (
+        normalization.select_statistics(actual, region="C")
+        == statistics[normalization.GLOBAL]
+    )
+
+
+def test_compute_statistics(goes_level_1_filepaths_no_wildfire):
+    actual = normalization.compute_statistics(
+        scan_filepaths=[goes_level_1_filepaths_no_wildfire] * 2,
+        by_region=True,
+        backend="serial",
+    )
+    goes_scan = goes_level_1.read_netcdfs(goes_level_1_filepaths_no_wildfire)
+    assert set(actual) == {normalization.GLOBAL, goes_scan.region}
+
+    expected = normalization.RunningStatistics().update(
+        normalization.calibrate_scan(goes_scan)
+    )
+    np.testing.assert_array_equal(actual[goes_scan.region].count, 2 * expected.count)
+    np.testing.assert_allclose(actual[normalization.GLOBAL].mean, expected.mean)
+    np.testing.assert_allclose(actual[normalization.GLOBAL].std, expected.std)
+
+    # normalizing a scan by its own statistics is the same as the default
+    np.testing.assert_allclose(
+        training_data.normalize_scan(goes_scan=goes_scan, statistics=expected),
+        training_data.normalize_scan(goes_scan=goes_scan),
+        rtol=1e-5,
+        atol=1e-5,
+    )
@@ -33,6 +33,97 @@ def test_extract_patches_2d():
     assert actual.shape == (28900, 32, 32, 17)
 
 
+def test_count_tiles():
+    mask = np.random.RandomState(0).uniform(size=(50, 70)) > 0.7
+    tile_indices = training_data.get_tile_indices(
+        shape=mask.shape, height=8, width=16, stride=6
+    )
+    actual = training_data.count_tiles(mask, tile_indices, height=8, width=16)
+    expected = [
+        mask[row : row + 8, column : column + 16].sum() for row, column in tile_indices
+    ]
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_reservoir_sampler():
+    random_state = np.random.RandomState(0)
+    counts = np.zeros(20)
+    for _ in range(2000):
+        sampler = training_data.ReservoirSampler(size=5, random_state=random_state)
+        for item in range(20):
+            sampler.add(item)
+        assert len(sampler.items) == 5 and len(set(sampler.items)) == 5
+        counts[sampler.items] += 1
+    assert sampler.num_seen == 20
+    np.testing.assert_allclose(counts / 2000, 0.25, atol=0.05)
+
+
+def test_sample_tiles():
+    is_fire = np.zeros((100, 100), dtype=bool)
+    is_fire[[5, 50, 95], [5, 50, 95]] = True
+
+    positives, negatives = training_data.sample_tiles(
+        is_fire=is_fire, height=10, width=10, stride=10
+    )
+    assert positives == [(0, 0), (50, 50), (90, 90)]
+    assert negatives == []
+
+    positives, negatives = training_data.sample_tiles(
+        is_fire=is_fire,
+        height=10,
+        width=10,
+        stride=10,
+        negative_ratio=3,
+        max_negatives=7,
+        random_state=np.random.RandomState(0),
+    )
+    assert len(positives) == 3
+    assert len(negatives) == 7 and len(set(negatives)) == 7
+    assert not set(positives) & set(negatives)
+
+    is_water = np.zeros((100, 100), dtype=bool)
+    is_water[:20] = True  # 19 tiles without fire, of 97
+    for max_negatives, expected in [(10, 5), (60, 19)]:
+        _, negatives = training_data.sample_tiles(
+            is_fire=is_fire,
+            height=10,
+            width=10,
+            stride=10,
+            negative_ratio=20,
+            max_negatives=max_negatives,
+            strata={"water": is_water},
+            random_state=np.random.RandomState(0),
+        )
+        assert len(negatives) == max_negatives
+        assert sum(row < 20 for row, _ in negatives) == expected
+
+    # a scan without fire only contributes negatives with a floor
+    no_fire = np.zeros((100, 100), dtype=bool)
+    assert training_data.sample_tiles(
+        is_fire=no_fire, height=10, width=10, stride=10, negative_ratio=3
+    ) == ([], [])
+    positives, negatives = training_data.sample_tiles(
+        is_fire=no_fire,
+        height=10,
+        width=10,
+        stride=10,
+        negative_ratio=3,
+        min_negatives=4,
+        random_state=np.random.RandomState(0),
+    )
+    assert positives == [] and len(set(negatives)) == 4
+    _, negatives = training_data.sample_tiles(
+        is_fire=is_fire,
+        height=10,
+        width=10,
+        stride=10,
+        min_negatives=200,
+        max_negatives=50,
+        random_state=np.random.RandomState(0),
+    )
+    assert len(negatives) == 50
+
+
 def test_process_file(goes_level_2):
     with tempfile.TemporaryDirectory() as temporary_directory:
         actual = training_data.process_file(
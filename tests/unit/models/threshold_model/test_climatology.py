@@ -0,0 +1,158 @@
+import datetime
+import tempfile
+
+import numpy as np
+import pytest
+
+from wildfire.data import goes_level_1
+from wildfire.models.threshold_model import climatology, goes_level_1_wildfires
+
+
+def test_get_hour_bin():
+    assert climatology.get_hour_bin(datetime.datetime(2019, 1, 1, 0, 59)) == 0
+    assert climatology.get_hour_bin(datetime.datetime(2019, 1, 1, 23, 0)) == 23
+    assert (
+        climatology.get_hour_bin(datetime.datetime(2019, 1, 1, 11, 59), num_hour_bins=4)
+        == 1
+    )
+
+
+def test_climatology():
+    random_state = np.random.RandomState(0)
+    values = random_state.normal(loc=300, scale=10, size=(12, 2, 4, 5)).astype(np.float32)
+    values[:3, 0, 0, 0] = np.nan
+    values[5, 1, 2, 3] = np.nan
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        store = climatology.Climatology.create(
+            directory=temporary_directory,
+            satellite="noaa-goes17",
+            region="C",
+            shape=(4, 5),
+            num_hour_bins=4,
+        )
+        for scan_values in values:
+            store.update(values=scan_values, hour_bin=2)
+        store.flush()
+
+        store = climatology.Climatology(
+            directory=temporary_directory, satellite="noaa-goes17", region="C"
+        )
+        assert store.shape == (4, 5) and store.num_hour_bins == 4
+        is_valid = np.isfinite(values).all(axis=1, keepdims=True)
+        valid_values = np.where(is_valid, values, np.nan)
+        np.testing.assert_array_equal(store.count[2], is_valid.sum(axis=(0, 1)))
+        np.testing.assert_array_equal(store.count[[0, 1, 3]], 0)
+        np.testing.assert_allclose(
+            store.mean[2], np.nanmean(valid_values, axis=0), rtol=1e-5
+        )
+        np.testing.assert_allclose(
+            store.sum_squares[2] / store.count[2],
+            np.nanvar(valid_values, axis=0),
+            rtol=1e-3,
+        )
+
+        scores = store.score(values=values[0], hour_bin=2, min_count=10)
+        expected = (values[0] - np.nanmean(valid_values, axis=0)) / np.nanstd(
+            valid_values, axis=0
+        )
+        expected[:, store.count[2] < 10] = np.nan
+        np.testing.assert_allclose(scores, expected, rtol=1e-3)
+        assert np.isnan(store.score(values=values[0], hour_bin=0)).all()
+
+        with pytest.raises(ValueError):
+            store.update(values=values[0, :, :2], hour_bin=2)
+
+        # merging partial statistics is the same as updating with every scan
+        merged = climatology.Climatology.create(
+            directory=temporary_directory,
+            satellite="noaa-goes16",
+            region="C",
+            shape=(4, 5),
+            num_hour_bins=4,
+        )
+        for part in np.array_split(values, 3):
+            count = np.zeros((4, 5), dtype=np.int32)
+            mean = np.zeros((2, 4, 5), dtype=np.float32)
+            sum_squares = np.zeros_like(mean)
+            for scan_values in part:
+                climatology._update(
+                    count=count, mean=mean, sum_squares=sum_squares, values=scan_values
+                )
+            merged.merge(count=count, mean=mean, sum_squares=sum_squares, hour_bin=2)
+        np.testing.assert_array_equal(merged.count, store.count)
+        np.testing.assert_allclose(merged.mean, store.mean, rtol=1e-5)
+        np.testing.assert_allclose(merged.sum_squares, store.sum_squares, rtol=1e-3)
+
+
+def test_check_climatology():
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        with pytest.raises(FileNotFoundError):
+            climatology.check_climatology(
+                directory=temporary_directory, satellite="noaa-goes17", region="C"
+            )
+        with pytest.raises(FileNotFoundError):
+            goes_level_1_wildfires.label_wildfires(
+                scan_filepaths=[],
+                persist_directory=temporary_directory,
+                satellite="noaa-goes17",
+                region="C",
+                start=datetime.datetime(2019, 1, 1),
+                end=datetime.datetime(2019, 1, 2),
+                climatology_directory=temporary_directory,
+                backend="serial",
+            )
+        climatology.Climatology.create(
+            directory=temporary_directory,
+            satellite="noaa-goes17",
+            region="C",
+            shape=(4, 5),
+        )
+        climatology.check_climatology(
+            directory=temporary_directory, satellite="noaa-goes17", region="C"
+        )
+
+
+def test_update_climatology(goes_level_1_filepaths_no_wildfire):
+    goes_scan = goes_level_1.read_netcdfs(goes_level_1_filepaths_no_wildfire)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        actual = climatology.update_climatology(
+            scan_filepaths=[goes_level_1_filepaths_no_wildfire] * 2,
+            directory=temporary_directory,
+            satellite=goes_scan.satellite,
+            region=goes_scan.region,
+            scans_per_task=1,
+            backend="serial",
+        )
+        assert actual == 1
+
+        # scans already in the climatology are not counted again
+        actual = climatology.update_climatology(
+            scan_filepaths=[goes_level_1_filepaths_no_wildfire],
+            directory=temporary_directory,
+            satellite=goes_scan.satellite,
+            region=goes_scan.region,
+            backend="serial",
+        )
+        assert actual == 0
+
+        store = climatology.load_climatology(
+            directory=temporary_directory,
+            satellite=goes_scan.satellite,
+            region=goes_scan.region,
+        )
+        hour_bin = climatology.get_hour_bin(goes_scan.scan_time_utc)
+        values = climatology.get_values(goes_scan)
+        is_valid = np.isfinite(values).all(axis=0)
+        np.testing.assert_array_equal(store.count[hour_bin], is_valid)
+        assert store.has_scan(goes_scan.scan_time_utc)
+        np.testing.assert_allclose(store.mean[hour_bin][:, is_valid], values[:, is_valid])
+
+        # without enough history, the model falls back to its comparisons to the scene
+        assert store.is_anomalous(goes_scan=goes_scan).all()
+        np.testing.assert_array_equal(
+            goes_level_1_wildfires.predict_wildfires(
+                goes_scan=goes_scan, climatology=store
+            ),
+            goes_level_1_wildfires.predict_wildfires(goes_scan=goes_scan),
+        )
+        climatology.load_climatology.cache_clear()
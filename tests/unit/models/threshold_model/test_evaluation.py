@@ -0,0 +1,138 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import xarray as xr
+
+from wildfire.data import goes_level_2
+from wildfire.models.threshold_model import evaluation, goes_level_1_wildfires
+
+
+def test_confusion_counts():
+    predictions = np.zeros((10, 10), dtype=bool)
+    predictions[[1, 5, 9], [1, 5, 0]] = True
+    fires = np.zeros((10, 10), dtype=bool)
+    fires[[1, 6, 3], [1, 5, 8]] = True
+
+    actual = evaluation.ConfusionCounts().update(predictions=predictions, fires=fires)
+    assert actual.to_dict() == {
+        "true_positives": 1,
+        "false_positives": 2,
+        "detected_fires": 1,
+        "false_negatives": 2,
+        "true_negatives": 95,
+        "scan_true_positives": 1,
+        "scan_false_positives": 0,
+        "scan_false_negatives": 0,
+        "scan_true_negatives": 0,
+        "num_scans": 1,
+        "num_skipped": 0,
+    }
+
+    tolerant = evaluation.ConfusionCounts().update(
+        predictions=predictions, fires=fires, tolerance=1
+    )
+    assert (tolerant.true_positives, tolerant.false_positives) == (2, 1)
+    assert (tolerant.detected_fires, tolerant.false_negatives) == (2, 1)
+
+    is_evaluated = np.ones((10, 10), dtype=bool)
+    is_evaluated[9] = False
+    actual.merge(
+        evaluation.ConfusionCounts().update(
+            predictions=predictions,
+            fires=np.zeros_like(fires),
+            is_evaluated=is_evaluated,
+        )
+    )
+    assert actual.false_positives == 4
+    assert actual.true_negatives == 95 + 88
+    assert actual.scan_false_positives == 1
+    assert actual.num_scans == 2
+    np.testing.assert_almost_equal(actual.get_metrics()["pixel_precision"], 0.2)
+    np.testing.assert_almost_equal(actual.get_metrics()["scan_recall"], 1.0)
+
+
+def test_get_level_2_fires(goes_level_2):
+    level_2 = xr.load_dataset(goes_level_2["level_2"])
+    fires, is_evaluated = evaluation.get_level_2_fires(level_2=level_2)
+    assert fires.shape == is_evaluated.shape == level_2.Mask.shape
+    assert 0 < fires.sum() < is_evaluated.sum()
+    assert not (fires & ~is_evaluated).any()
+
+    temp_fires, _ = evaluation.get_level_2_fires(level_2=level_2, truth="temp")
+    assert temp_fires.sum() > 0
+
+
+def test_evaluate_skips_unmatched_scans(goes_level_2):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        actual = evaluation.evaluate(
+            level_2_filepaths=[goes_level_2["level_2"]],
+            level_1_directory=temporary_directory,
+            backend="serial",
+        )
+        assert actual == evaluation.ConfusionCounts(num_skipped=1)
+
+        report_filepath = os.path.join(temporary_directory, "report.json")
+        evaluation.write_report(
+            confusion_counts=actual, filepath=report_filepath, tolerance=0
+        )
+        with open(report_filepath) as buffer:
+            report = json.load(buffer)
+        assert report["tolerance"] == 0
+        assert report["counts"]["num_skipped"] == 1
+
+
+class _StubScan:
+    def release(self):
+        pass
+
+
+def test_evaluate_scan(monkeypatch):
+    mask = np.full((4, 5), 100, dtype=np.float32)  # processed, no fire
+    mask[0, 0] = 10  # fire, predicted
+    mask[0, 1] = 30  # fire, not predicted
+    mask[1, :] = 40  # off earth
+    mask[2, 0] = 120  # missing 3.89um input
+    mask[3, 0] = 151  # sea water
+    predictions = np.zeros((4, 5), dtype=bool)
+    predictions[0, 0] = True
+    predictions[[1, 2, 3, 3], [0, 0, 0, 4]] = True  # the last two are false positives
+    monkeypatch.setattr(
+        goes_level_2.utilities, "match_level_1", lambda **kwargs: _StubScan()
+    )
+    monkeypatch.setattr(
+        goes_level_1_wildfires, "predict_wildfires", lambda **kwargs: predictions
+    )
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        level_2_filepath = os.path.join(temporary_directory, "level_2.nc")
+        xr.Dataset(
+            {
+                "Mask": (("y", "x"), mask),
+                "Temp": (("y", "x"), np.where(mask < 40, 400, np.nan)),
+            }
+        ).to_netcdf(level_2_filepath)
+        actual = evaluation.evaluate_scan(
+            level_2_filepath=level_2_filepath, level_1_directory=temporary_directory
+        )
+        assert actual.to_dict() == {
+            "true_positives": 1,
+            "false_positives": 2,
+            "detected_fires": 1,
+            "false_negatives": 1,
+            "true_negatives": 10,
+            "scan_true_positives": 1,
+            "scan_false_positives": 0,
+            "scan_false_negatives": 0,
+            "scan_true_negatives": 0,
+            "num_scans": 1,
+            "num_skipped": 0,
+        }
+
+        not_a_netcdf = os.path.join(temporary_directory, "not_a_netcdf.nc")
+        with open(not_a_netcdf, "w") as buffer:
+            buffer.write("truncated")
+        for level_2_filepath in (not_a_netcdf, os.path.join(temporary_directory, "no")):
+            assert evaluation.evaluate_scan(
+                level_2_filepath=level_2_filepath, level_1_directory=temporary_directory
+            ) == evaluation.ConfusionCounts(num_skipped=1)
@@ -1,9 +1,14 @@
+import datetime
 import glob
 import os
+import shutil
+import tempfile
 
+import fsspec
 import numpy as np
 
 from wildfire.data import goes_level_1
+from wildfire.data.goes_level_1 import watcher
 from wildfire.models import threshold_model
 from wildfire.models.threshold_model import goes_level_1_wildfires
 
@@ -61,3 +66,67 @@ def test_predict_wildfires(goes_level_1_filepaths_wildfire):
     assert isinstance(actual, np.ndarray)
     assert actual.shape == (1500, 2500)
     assert actual.mean() > 0
+
+
+def test_watch_wildfires(goes_level_1_filepaths_no_wildfire):
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        bucket_directory = os.path.join(temporary_directory, "bucket")
+        hour_directory = os.path.join(
+            bucket_directory,
+            "ABI-L1b-RadM",
+            "{:%Y/%j/%H}".format(datetime.datetime.utcnow()),
+        )
+        os.makedirs(hour_directory)
+        for filepath in goes_level_1_filepaths_no_wildfire:
+            shutil.copy(filepath, hour_directory)
+
+        actual = goes_level_1_wildfires.watch_wildfires(
+            satellite="noaa-goes17",
+            region="M1",
+            goes_directory=temporary_directory,
+            persist_directory=temporary_directory,
+            remote_directory=bucket_directory,
+            filesystem=fsspec.filesystem("file"),
+            max_polls=1,
+            since=datetime.datetime(2019, 12, 1),
+        )
+        assert list(actual) == []
+        assert (
+            len(
+                glob.glob(
+                    os.path.join(temporary_directory, "ABI-L1b-RadM", "**", "*.nc"),
+                    recursive=True,
+                )
+            )
+            == 16
+        )
+
+
+def test_watch_wildfires_survives_errors(monkeypatch):
+    polls = []
+
+    def poll(self):
+        polls.append(self)
+        if len(polls) == 1:
+            raise ConnectionError("Connection reset by peer")
+        return [["bad_scan"]]
+
+    def parse_scan_for_wildfire(filepaths, max_workers):
+        raise OSError(f"Cannot read {filepaths}")
+
+    monkeypatch.setattr(watcher.ScanWatcher, "poll", poll)
+    monkeypatch.setattr(
+        goes_level_1_wildfires, "parse_scan_for_wildfire", parse_scan_for_wildfire
+    )
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        actual = goes_level_1_wildfires.watch_wildfires(
+            satellite="noaa-goes17",
+            region="M1",
+            goes_directory=temporary_directory,
+            persist_directory=temporary_directory,
+            filesystem=fsspec.filesystem("file"),
+            poll_seconds=0,
+            max_polls=3,
+        )
+        assert list(actual) == []
+    assert len(polls) == 3
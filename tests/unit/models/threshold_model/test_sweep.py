@@ -0,0 +1,118 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from wildfire.data import goes_level_1
+from wildfire.models import threshold_model
+from wildfire.models.threshold_model import sweep
+
+
+def _random_features(shape=(60, 50), seed=0):
+    random_state = np.random.RandomState(seed)
+    features = threshold_model.Features(
+        hot_3_89=random_state.normal(size=shape) * 2,
+        hot_difference=random_state.normal(size=shape) * 2,
+        cloud_reflectance=random_state.uniform(0, 1.5, size=shape),
+        cloud_temperature=random_state.uniform(250, 300, size=shape),
+        water_reflectance=random_state.uniform(0, 0.06, size=shape),
+        night_reflectance=random_state.uniform(0, 0.02, size=shape),
+    )
+    features.hot_3_89[0, :5] = np.nan
+    features.cloud_temperature[1, :5] = np.nan
+    return features
+
+
+def test_sweep_counts():
+    grid = sweep.ThresholdGrid(
+        hot_sigma=[1, 2],
+        hot_difference_sigma=[0.5, 1.5],
+        cloud_reflectance=[0.8, 1.2],
+        cloud_temperature=[265, 275],
+        water_reflectance=[0.01, 0.03],
+        night_reflectance=[0.008, 0.015],
+    )
+    assert len(grid) == 64
+    all_features = [_random_features(seed=seed) for seed in range(3)]
+
+    actual = sweep.SweepCounts(grid=grid)
+    for features in all_features:
+        actual.merge(sweep.SweepCounts(grid=grid)).update(features=features)
+
+    for index in range(len(grid)):
+        predictions = [
+            threshold_model.predict(
+                *threshold_model.classify(features=features, thresholds=grid[index])
+            )
+            for features in all_features
+        ]
+        assert actual.pixel_counts[index] == sum(map(np.sum, predictions))
+        assert actual.scan_counts[index] == sum(map(np.any, predictions))
+    assert actual.pixel_counts.max() > 0
+    assert actual.num_scans == 3
+
+    dataframe = actual.to_dataframe()
+    assert len(dataframe) == 64
+    assert dataframe.loc[5, "hot_sigma"] == grid[5].hot_sigma
+
+    with pytest.raises(ValueError):
+        actual.merge(sweep.SweepCounts(grid=sweep.ThresholdGrid(hot_sigma=[3])))
+    with pytest.raises(ValueError):
+        sweep.ThresholdGrid(hot=[1])
+
+
+def test_extract_features_and_sweep(goes_level_1_filepaths_no_wildfire):
+    goes_scan = goes_level_1.read_netcdfs(goes_level_1_filepaths_no_wildfire)
+    np.testing.assert_array_equal(
+        threshold_model.classify(
+            threshold_model.goes_level_1_wildfires.get_features(goes_scan=goes_scan)
+        ).is_water,
+        threshold_model.is_water_pixel(
+            goes_scan.rescale_to_2km()["band_6"].reflectance_factor.data
+        ),
+    )
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        features_filepaths = sweep.extract_features(
+            scan_filepaths=[goes_level_1_filepaths_no_wildfire],
+            features_directory=temporary_directory,
+            backend="serial",
+        )
+        assert len(features_filepaths) == 1
+        assert os.path.exists(features_filepaths[0])
+        features = sweep.load_features(filepath=features_filepaths[0])
+        assert features.hot_3_89.dtype == np.float32
+
+        actual = sweep.sweep(
+            features_filepaths=features_filepaths,
+            grid=sweep.ThresholdGrid(hot_sigma=[-10, 2], hot_difference_sigma=[-10, 3]),
+            backend="serial",
+        )
+    assert actual.num_scans == 1
+    assert actual.num_pixels == features.hot_3_89.size
+    assert actual.pixel_counts[-1] == 0
+    assert actual.pixel_counts[0] > 0
+
+
+def test_sweep_chunks(monkeypatch):
+    grid = sweep.ThresholdGrid(hot_sigma=[-10, 0, 2], hot_difference_sigma=[-10, 3])
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        features_filepaths = []
+        for seed in range(5):
+            features_filepath = os.path.join(temporary_directory, f"{seed}.npz")
+            sweep.save_features(
+                features=_random_features(seed=seed), filepath=features_filepath
+            )
+            features_filepaths.append(features_filepath)
+        expected = sweep.sweep(
+            features_filepaths=features_filepaths, grid=grid, backend="serial"
+        )
+
+        monkeypatch.setattr(sweep, "MAX_CHUNKS", 2)
+        actual = sweep.sweep(
+            features_filepaths=features_filepaths, grid=grid, backend="serial"
+        )
+    assert actual.num_scans == expected.num_scans == 5
+    np.testing.assert_array_equal(actual.pixel_counts, expected.pixel_counts)
+    np.testing.assert_array_equal(actual.scan_counts, expected.scan_counts)
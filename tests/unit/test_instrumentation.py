@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import time
+
+from wildfire import instrumentation, multiprocessing
+
+
+def read_bytes(nbytes):
+    with instrumentation.timer("read", nbytes=nbytes):
+        return nbytes
+
+
+def test_timer():
+    instrumentation.reset()
+    read_bytes(10)
+    instrumentation.add_bytes("read", 5)
+    actual = instrumentation.summary()
+    assert actual["read"]["count"] == 1
+    assert actual["read"]["bytes"] == 15
+    assert actual["read"]["wall_seconds"] >= 0
+    assert actual["read"]["peak_rss_bytes"] > 0
+
+
+def test_timer_nested():
+    instrumentation.reset()
+    with instrumentation.timer("model"):
+        with instrumentation.timer("rescale"):
+            time.sleep(0.2)
+    actual = instrumentation.summary()
+    assert actual["rescale"]["wall_seconds"] >= 0.2
+    assert actual["model"]["wall_seconds"] < 0.1
+    assert actual["model"]["count"] == 1
+
+
+def test_map_function_merges_records():
+    instrumentation.reset()
+    for backend in ("threads", "processes"):
+        actual = multiprocessing.map_function(read_bytes, [1, 2, 3], backend=backend)
+        assert actual == [1, 2, 3]
+    actual = instrumentation.summary()
+    assert actual["read"]["count"] == 6
+    assert actual["read"]["bytes"] == 12
+
+
+def test_report():
+    instrumentation.reset()
+    read_bytes(10)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        json_filepath = os.path.join(temporary_directory, "metrics.json")
+        prometheus_filepath = os.path.join(temporary_directory, "metrics.prom")
+        actual = instrumentation.report(
+            json_filepath=json_filepath,
+            prometheus_filepath=prometheus_filepath,
+            labels={"command": "test"},
+        )
+        with open(json_filepath) as buffer:
+            assert json.load(buffer) == actual
+        with open(prometheus_filepath) as buffer:
+            lines = buffer.read().splitlines()
+    assert "# TYPE wildfire_stage_bytes counter" in lines
+    assert 'wildfire_stage_bytes{command="test",stage="read"} 10' in lines
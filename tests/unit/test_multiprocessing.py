@@ -1,23 +1,26 @@
 import datetime
 import os
+import tempfile
 import time
 
 import dask
 import numpy as np
+import pytest
+import xarray as xr
 
-from wildfire import multiprocessing
+from wildfire import multiprocessing, precision
 
 
 def test_flatten_array():
     actual = multiprocessing.flatten_array([[1], [2], [3], [4]])
     np.testing.assert_array_equal(actual, np.array([1, 2, 3, 4]))
 
-    
+
 def test_dask_client():
     with multiprocessing.dask_client() as client:
         assert isinstance(client, dask.distributed.client.Client)
 
-        
+
 def test_map_function():
     num_cpus = os.cpu_count()
 
@@ -32,3 +35,177 @@ def test_map_function():
     np.testing.assert_almost_equal(
         (finished_at - started_at).total_seconds(), 2, decimal=0
     )
+
+
+def test_share_arrays():
+    array = np.arange(10, dtype=np.float32)
+    dataset = xr.Dataset({"a": (("x",), array)}, coords={"x": np.arange(10)})
+    shared = multiprocessing.share_arrays(
+        {"array": array, "dataset": dataset, "small": [1, 2]}, min_bytes=0
+    )
+    assert isinstance(shared["array"], multiprocessing.SharedArray)
+    assert os.path.exists(shared["array"].filepath)
+    assert isinstance(shared["dataset"], multiprocessing.SharedDataset)
+    assert shared["small"] == [1, 2]
+
+    actual = multiprocessing.load_shared_arrays(shared)
+    assert not os.path.exists(shared["array"].filepath)
+    np.testing.assert_array_equal(actual["array"], array)
+    assert actual["dataset"].equals(dataset)
+
+
+def test_map_function_share_results():
+    def make_array(x):
+        return np.full(2 ** 20, x, dtype=np.float64)
+
+    actual = multiprocessing.map_function(make_array, [1, 2], share_results=True)
+    np.testing.assert_array_equal(actual[0], make_array(1))
+    np.testing.assert_array_equal(actual[1], make_array(2))
+
+
+def test_map_function_share_results_cleans_up(monkeypatch, tmp_path):
+    def make_array_or_fail(x):
+        if x == 2:
+            raise ValueError("failed")
+        return np.full(2 ** 20, x, dtype=np.float64)
+
+    monkeypatch.setattr(multiprocessing, "SHARED_DIRECTORY", str(tmp_path))
+    with pytest.raises(ValueError):
+        multiprocessing.map_function(make_array_or_fail, [1, 2], share_results=True)
+    assert os.listdir(tmp_path) == []
+
+
+def add(x, y):
+    return x + y
+
+
+@pytest.mark.parametrize("backend", ["serial", "threads", "processes"])
+def test_map_function_backends(backend):
+    actual = multiprocessing.map_function(
+        add, [[1, 2, 3, 4], [11, 12, 13, 14]], backend=backend
+    )
+    assert actual == [12, 14, 16, 18]
+    assert multiprocessing.map_function(len, [[[1], [2, 3]]], backend=backend) == [1, 2]
+
+
+def test_set_default_backend():
+    default_backend = multiprocessing.get_default_backend()
+    try:
+        multiprocessing.set_default_backend(name="serial")
+        assert multiprocessing.map_function(abs, [-1, 2]) == [1, 2]
+        with pytest.raises(ValueError):
+            multiprocessing.set_default_backend(name="not_a_backend")
+    finally:
+        multiprocessing.set_default_backend(name=default_backend)
+
+
+def test_dask_client_adapt():
+    with multiprocessing.dask_client(adapt={"minimum": 1, "maximum": 2}) as client:
+        assert client.cluster._adaptive is not None
+        assert client.cluster._adaptive.maximum == 2
+        assert client.submit(add, 1, 2).result() == 3
+
+
+def test_estimate_node_hours():
+    actual = multiprocessing.estimate_node_hours(
+        num_tasks=7200, seconds_per_task=10, cores_per_job=10
+    )
+    assert actual == 2
+
+
+def test_map_function_batches():
+    num_tasks = []
+
+    @multiprocessing.register_backend("counting")
+    def map_counting(function, function_args, **_):
+        num_tasks.append(len(function_args[0]))
+        return list(map(function, *function_args))
+
+    try:
+        xs = list(range(10000))
+        actual = multiprocessing.map_function(
+            add, [xs, xs], backend="counting", batch_size=64
+        )
+        assert actual == [2 * x for x in xs]
+        assert num_tasks[-1] == 157
+
+        # by default, each element is its own task
+        actual = multiprocessing.map_function(add, [xs, xs], backend="counting")
+        assert actual == [2 * x for x in xs]
+        assert num_tasks[-1] == len(xs)
+    finally:
+        del multiprocessing.BACKENDS["counting"]
+
+
+def exit_once(marker_filepath):
+    if not os.path.exists(marker_filepath):
+        open(marker_filepath, "w").close()
+        os._exit(1)
+    return marker_filepath
+
+
+def test_map_function_memory():
+    actual = multiprocessing.map_function(
+        add, [[1, 2], [11, 12]], backend="processes", memory=2 ** 60
+    )
+    assert actual == [12, 14]
+    with multiprocessing.dask_client() as client:
+        actual = multiprocessing._map_client(client, add, [[1, 2], [11, 12]], memory=1)
+        assert actual == [12, 14]
+        (worker,) = client.scheduler_info()["workers"].values()
+        assert worker["resources"][multiprocessing.MEMORY_RESOURCE] > 0
+
+
+def test_get_pbs_cluster_kwargs():
+    actual = multiprocessing._get_pbs_cluster_kwargs(
+        cluster_kwargs={"memory": "100 GB", "cores": 10, "processes": 4, "extra": ["-x"]}
+    )
+    assert actual["extra"] == [
+        "-x",
+        "--resources",
+        f"{multiprocessing.MEMORY_RESOURCE}={25 * 10 ** 9}",
+    ]
+    assert actual["processes"] == 4
+    with precision.using("float32"):
+        actual = multiprocessing._get_pbs_cluster_kwargs(
+            cluster_kwargs={"memory": "1 GB", "env_extra": ["module load gcc"]}
+        )
+    assert actual["env_extra"] == ["module load gcc", "export WILDFIRE_PRECISION=float32"]
+
+    # without processes, dask_jobqueue starts about sqrt(cores) worker processes
+    actual = multiprocessing._get_worker_memory(
+        pbs=True, cluster_kwargs={"memory": "100 GB", "cores": 10, "processes": None}
+    )
+    assert actual == 100 * 10 ** 9 // multiprocessing._get_worker_processes(
+        cluster_kwargs={"cores": 10}
+    )
+    assert multiprocessing._get_worker_processes(cluster_kwargs={"cores": 10}) > 1
+    assert (
+        multiprocessing._get_worker_memory(
+            pbs=True, cluster_kwargs={"memory": "100 GB", "processes": 1}
+        )
+        == 100 * 10 ** 9
+    )
+
+
+def test_map_function_retries():
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        marker_filepath = os.path.join(temporary_directory, "marker")
+        actual = multiprocessing.map_function(
+            exit_once, [marker_filepath], backend="processes", retries=1
+        )
+        assert actual == [marker_filepath]
+
+
+def test_map_function_mpi(monkeypatch):
+    monkeypatch.setattr(multiprocessing, "_MPI_CLIENT", None)
+    with pytest.raises(RuntimeError):
+        multiprocessing.map_function(add, [[1], [2]], backend="mpi")
+
+    # as the cluster started by initialize_mpi, whose size the cluster kwargs cannot change
+    with multiprocessing.dask_client() as client:
+        monkeypatch.setattr(multiprocessing, "_MPI_CLIENT", client)
+        actual = multiprocessing.map_function(
+            add, [[1, 2], [11, 12]], backend="mpi", n_workers=4, cores=8
+        )
+    assert actual == [12, 14]
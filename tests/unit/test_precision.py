@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+from wildfire import precision
+from wildfire.data import goes_level_1
+from wildfire.models.threshold_model import goes_level_1_wildfires
+
+
+@pytest.fixture(autouse=True)
+def default_precision(monkeypatch):
+    # start each test at float64, and restore the precision of later tests
+    monkeypatch.delenv(precision.ENVIRONMENT_VARIABLE, raising=False)
+    monkeypatch.setattr(precision, "_PRECISION", "float64")
+
+
+def test_set_precision():
+    with precision.using("float32"):
+        assert precision.get_dtype() == np.float32
+        assert os.environ[precision.ENVIRONMENT_VARIABLE] == "float32"
+    assert precision.get_precision() == "float64"
+    assert precision.ENVIRONMENT_VARIABLE not in os.environ
+    with pytest.raises(ValueError):
+        precision.set_precision(name="float16")
+
+    precision.set_precision(name="float32")
+    assert precision.get_precision() == "float32"
+    assert os.environ[precision.ENVIRONMENT_VARIABLE] == "float32"
+
+
+def test_float32_matches_float64(goes_level_1_filepaths_no_wildfire):
+    goes_scan = goes_level_1.read_netcdfs(goes_level_1_filepaths_no_wildfire)
+    expected = {
+        name: (goes_band.parse().data, goes_band.normalize().data)
+        for name, goes_band in goes_scan.iteritems()
+    }
+    expected_features = goes_level_1_wildfires.get_model_features(goes_scan=goes_scan)
+
+    goes_scan.release()
+    with precision.using("float32"):
+        for name, goes_band in goes_scan.iteritems():
+            parsed, normalized = goes_band.parse().data, goes_band.normalize().data
+            assert parsed.dtype == normalized.dtype == np.float32
+            assert expected[name][0].dtype == np.float64
+            np.testing.assert_allclose(parsed, expected[name][0], rtol=1e-6)
+            np.testing.assert_allclose(normalized, expected[name][1], atol=1e-4)
+        actual_features = goes_level_1_wildfires.get_model_features(goes_scan=goes_scan)
+
+    for actual_feature, expected_feature in zip(actual_features, expected_features):
+        assert (actual_feature != expected_feature).mean() < 1e-4
@@ -0,0 +1,32 @@
+import glob
+import importlib.util
+import os
+import pstats
+import tempfile
+
+from wildfire import multiprocessing, profiling
+
+
+def square(x):
+    return x ** 2
+
+
+def test_map_function_profiles():
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        try:
+            profiling.enable(directory=temporary_directory, sample_rate=1)
+            actual = multiprocessing.map_function(square, [1, 2, 3], backend="processes")
+            with multiprocessing.dask_client() as client:
+                assert client.submit(square, 2).result() == 4
+        finally:
+            profiling.disable()
+        assert actual == [1, 4, 9]
+
+        filepaths = glob.glob(os.path.join(temporary_directory, "square_*.prof"))
+        assert len(filepaths) == 3
+        assert pstats.Stats(filepaths[0]).total_calls > 0
+        if importlib.util.find_spec("bokeh") is not None:
+            assert glob.glob(os.path.join(temporary_directory, "dask_report_*.html"))
+
+        multiprocessing.map_function(square, [1, 2, 3], backend="serial")
+        assert len(glob.glob(os.path.join(temporary_directory, "*.prof"))) == 3
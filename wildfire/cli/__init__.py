@@ -5,4 +5,5 @@ Usage
 `download --help`
 `predict --help`
 `training-data --help`
+`watch --help`
 """
@@ -1,9 +1,12 @@
 """Download satellite data."""
+import collections
+import functools
 import logging
 import os
 
 import click
 
+from wildfire import instrumentation, multiprocessing, profiling
 from wildfire.data import goes_level_1 as gl1, goes_level_2 as gl2
 
 DATETIME_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]
@@ -13,14 +16,73 @@ _logger = logging.getLogger(__name__)
 
 
 @click.group()
-def download():
+@click.option(
+    "--backend",
+    default=None,
+    type=click.Choice(sorted(multiprocessing.BACKENDS)),
+    help="Backend over which to parallelize. Defaults to $WILDFIRE_BACKEND or dask.",
+)
+@click.option(
+    "--metrics_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary as JSON.",
+)
+@click.option(
+    "--prometheus_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary for Prometheus.",
+)
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Path(file_okay=False),
+    help=(
+        "Directory in which to write cProfile (.prof) or pyinstrument (.html) profiles "
+        "of a sample of tasks, and the dask performance report (.html)."
+    ),
+)
+@click.option(
+    "--profile_rate",
+    default=profiling.DEFAULT_SAMPLE_RATE,
+    type=click.FloatRange(0, 1),
+    help="Fraction of tasks to profile.",
+)
+@click.option(
+    "--profiler",
+    default="cprofile",
+    type=click.Choice(profiling.PROFILERS),
+    help="Profiler of tasks. pyinstrument must be installed separately.",
+)
+@click.pass_context
+def download(
+    ctx, backend, metrics_file, prometheus_file, profile, profile_rate, profiler
+):
     """Download satellite data.
 
     Usage
     -----
     `download --help`
     """
-    pass
+    if backend is not None:
+        multiprocessing.set_default_backend(name=backend)
+    if multiprocessing.get_default_backend() == "mpi":
+        multiprocessing.initialize_mpi()  # before any other work, on every rank
+
+    if profile is not None:
+        profiling.enable(directory=profile, sample_rate=profile_rate, profiler=profiler)
+
+    # time the stages of the command, and report them once it completes
+    instrumentation.reset()
+    ctx.call_on_close(
+        functools.partial(
+            instrumentation.report,
+            json_filepath=metrics_file,
+            prometheus_filepath=prometheus_file,
+            labels={"command": ctx.invoked_subcommand},
+        )
+    )
 
 
 @download.command()
@@ -80,6 +142,196 @@ def goes_level_1(start, end, satellite, region, persist_directory):
     _logger.info("Job completed.")
 
 
+@download.command()
+@click.argument("start", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("end", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.option(
+    "--satellite",
+    default="noaa-goes17",
+    type=click.Choice(["noaa-goes16", "noaa-goes17"]),
+    help="GOES East|GOES East.",
+)
+@click.option(
+    "--region",
+    default="M1",
+    type=click.Choice(["M1", "M2", "C", "F"]),
+    help="US West Coast|US East Coast|US Full|Hemisphere.",
+)
+@click.option(
+    "--persist_directory",
+    default="./downloaded_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which GOES data has been downloaded.",
+)
+@click.option(
+    "--checksum", is_flag=True, help="Compare checksums as well as file sizes.",
+)
+def verify(start, end, satellite, region, persist_directory, checksum):
+    """Verify downloaded GOES Level 1b data against the local archive's manifests.
+
+    Exits with a non-zero status if any file is partial or corrupt.
+
+    Usage
+    -----
+    `download verify 2019-01-01 2019-02-01 --checksum`
+    """
+    _logger.info(
+        """Verifying downloaded GOES satellite data. Parameters:
+    Start Time: %s
+    End Time: %s
+    Satellite: %s
+    Region: %s
+    Persist Directory: %s
+    Checksum: %s""",
+        start,
+        end,
+        satellite,
+        region,
+        persist_directory,
+        checksum,
+    )
+
+    statuses = gl1.archive.verify(
+        local_directory=persist_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start,
+        end_time=end,
+        use_checksum=checksum,
+    )
+    counts = collections.Counter(statuses.values())
+    for status in gl1.archive.STATUSES:
+        _logger.info("%s: %d", status.capitalize(), counts[status])
+    for filepath, status in sorted(statuses.items()):
+        if status in ("partial", "corrupt"):
+            _logger.warning("%s: %s", status.capitalize(), filepath)
+    if counts["partial"] or counts["corrupt"]:
+        raise click.ClickException(
+            "Found partial or corrupt files. Run `download repair`."
+        )
+    _logger.info("Job completed.")
+
+
+@download.command()
+@click.argument("start", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("end", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.option(
+    "--satellite",
+    default="noaa-goes17",
+    type=click.Choice(["noaa-goes16", "noaa-goes17"]),
+    help="GOES East|GOES East.",
+)
+@click.option(
+    "--region",
+    default="M1",
+    type=click.Choice(["M1", "M2", "C", "F"]),
+    help="US West Coast|US East Coast|US Full|Hemisphere.",
+)
+@click.option(
+    "--persist_directory",
+    default="./downloaded_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which GOES data has been downloaded.",
+)
+@click.option(
+    "--checksum",
+    is_flag=True,
+    help="Compare checksums as well as file sizes, and record missing ones.",
+)
+def repair(start, end, satellite, region, persist_directory, checksum):
+    """Re-download missing, partial or corrupt GOES Level 1b data from Amazon S3.
+
+    Usage
+    -----
+    `download repair 2019-01-01 2019-02-01 --checksum`
+    """
+    _logger.info(
+        """Repairing downloaded GOES satellite data. Parameters:
+    Start Time: %s
+    End Time: %s
+    Satellite: %s
+    Region: %s
+    Persist Directory: %s
+    Checksum: %s""",
+        start,
+        end,
+        satellite,
+        region,
+        persist_directory,
+        checksum,
+    )
+
+    gl1.downloader.download_files(
+        local_directory=persist_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start,
+        end_time=end,
+        use_checksum=checksum,
+    )
+    _logger.info("Job completed.")
+
+
+@download.command()
+@click.argument("start", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("end", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.option(
+    "--satellite",
+    default="noaa-goes17",
+    type=click.Choice(["noaa-goes16", "noaa-goes17"]),
+    help="GOES East|GOES East.",
+)
+@click.option(
+    "--region",
+    default="M1",
+    type=click.Choice(["M1", "M2", "C", "F"]),
+    help="US West Coast|US East Coast|US Full|Hemisphere.",
+)
+@click.option(
+    "--persist_directory",
+    default="./downloaded_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which GOES data has been downloaded.",
+)
+def compact(start, end, satellite, region, persist_directory):
+    """Pack downloaded GOES Level 1b data into one compact store per day.
+
+    Each scan can then be read with a single file open instead of 16. The original files
+    are left in place.
+
+    Usage
+    -----
+    `download compact 2019-01-01 2019-02-01`
+    """
+    _logger.info(
+        """Compacting downloaded GOES satellite data. Parameters:
+    Start Time: %s
+    End Time: %s
+    Satellite: %s
+    Region: %s
+    Persist Directory: %s""",
+        start,
+        end,
+        satellite,
+        region,
+        persist_directory,
+    )
+
+    store_filepaths = gl1.compact.compact_files(
+        local_directory=persist_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start,
+        end_time=end,
+    )
+    _logger.info(
+        "Wrote %d stores of %.5f GB.",
+        len(store_filepaths),
+        sum(os.path.getsize(filepath) for filepath in store_filepaths) / 1e9,
+    )
+    _logger.info("Job completed.")
+
+
 @download.command()
 @click.argument("year", type=click.INT)
 @click.argument("day_of_year_min", type=click.INT)
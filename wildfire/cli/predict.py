@@ -1,11 +1,15 @@
 """Use available models to perform wildfire predictions."""
+import functools
+import glob
 import logging
 import os
 
 import click
 
+from wildfire import instrumentation, multiprocessing, profiling
 from wildfire.data import goes_level_1
 from wildfire.models import threshold_model
+from wildfire.models.dnn import inference
 
 DATETIME_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]
 
@@ -14,14 +18,71 @@ _logger = logging.getLogger(__name__)
 
 
 @click.group()
-def predict():
+@click.option(
+    "--backend",
+    default=None,
+    type=click.Choice(sorted(multiprocessing.BACKENDS)),
+    help="Backend over which to parallelize. Defaults to $WILDFIRE_BACKEND or dask.",
+)
+@click.option(
+    "--metrics_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary as JSON.",
+)
+@click.option(
+    "--prometheus_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary for Prometheus.",
+)
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Path(file_okay=False),
+    help=(
+        "Directory in which to write cProfile (.prof) or pyinstrument (.html) profiles "
+        "of a sample of tasks, and the dask performance report (.html)."
+    ),
+)
+@click.option(
+    "--profile_rate",
+    default=profiling.DEFAULT_SAMPLE_RATE,
+    type=click.FloatRange(0, 1),
+    help="Fraction of tasks to profile.",
+)
+@click.option(
+    "--profiler",
+    default="cprofile",
+    type=click.Choice(profiling.PROFILERS),
+    help="Profiler of tasks. pyinstrument must be installed separately.",
+)
+@click.pass_context
+def predict(ctx, backend, metrics_file, prometheus_file, profile, profile_rate, profiler):
     """Use the wildfire models to predict.
 
     Usage
     -----
     `predict --help`
     """
-    pass
+    if backend is not None:
+        multiprocessing.set_default_backend(name=backend)
+    if multiprocessing.get_default_backend() == "mpi":
+        multiprocessing.initialize_mpi()  # before any other work, on every rank
+
+    if profile is not None:
+        profiling.enable(directory=profile, sample_rate=profile_rate, profiler=profiler)
+
+    # time the stages of the command, and report them once it completes
+    instrumentation.reset()
+    ctx.call_on_close(
+        functools.partial(
+            instrumentation.report,
+            json_filepath=metrics_file,
+            prometheus_filepath=prometheus_file,
+            labels={"command": ctx.invoked_subcommand},
+        )
+    )
 
 
 @predict.command()
@@ -51,19 +112,60 @@ def predict():
     type=click.Path(exists=True, file_okay=False),
     help="Directory in which to persist wildfires.",
 )
+@click.option(
+    "--climatology_directory",
+    default=None,
+    type=click.Path(exists=True, file_okay=False),
+    help="Only keep hot pixels that are anomalous for this climatology.",
+)
+@click.option(
+    "--anomaly_sigma",
+    default=threshold_model.climatology.DEFAULT_ANOMALY_SIGMA,
+    type=click.FloatRange(min=0),
+    help="Z-score above the climatology of an anomalous pixel.",
+)
 @click.option("--pbs", is_flag=True, help="If running using a PBS cluster.")
 @click.option("--num_jobs", default=1, type=int, help="Number of jobs to submit.")
-def goes_threshold(
-    start, end, satellite, region, goes_directory, persist_directory, pbs, num_jobs,
+@click.option(
+    "--adapt", is_flag=True, help="Scale the number of jobs with the backlog of scans."
+)
+@click.option("--min_jobs", default=1, type=int, help="Fewest jobs when adapting.")
+@click.option(
+    "--max_jobs",
+    default=None,
+    type=int,
+    help="Most jobs when adapting. Defaults to a per region maximum.",
+)
+@click.option("--dry_run", is_flag=True, help="Estimate the cost and exit.")
+def goes_threshold(  # pylint: disable=too-many-arguments,too-many-locals
+    start,
+    end,
+    satellite,
+    region,
+    goes_directory,
+    persist_directory,
+    climatology_directory,
+    anomaly_sigma,
+    pbs,
+    num_jobs,
+    adapt,
+    min_jobs,
+    max_jobs,
+    dry_run,
 ):
     """Label wildfires in GOES level 1b data.
 
     If using PBS, then additional configuration can be set in the files located at the
     path set by the `DASK_ROOT_CONFIG` environment variable, namely, `dask_config/`.
 
+    With `--adapt`, jobs are requested and released as the backlog of scans grows and
+    drains, between `--min_jobs` and `--max_jobs`, instead of a static `--num_jobs`.
+
     Usage
     -----
     `predict goes-threshold 2019-01-01 2019-01-02`
+    `predict goes-threshold 2019-01-01 2019-02-01 --region=C --pbs --adapt --dry_run`
+    `predict goes-threshold 2019-01-01 2019-01-02 --climatology_directory=./climatology`
     """
     _logger.info(
         """Labeling wildfires from GOES data with the threshold model.
@@ -73,18 +175,24 @@ def goes_threshold(
     End Time: %s
     GOES Directory: %s
     Persist Directory: %s
+    Climatology Directory: %s
+    Anomaly Sigma: %s
     PBS: %s
     Number of Processes: %s
-    Number of Jobs: %s""",
+    Number of Jobs: %s
+    Adapt: %s""",
         satellite,
         region,
         start,
         end,
         goes_directory,
         persist_directory,
+        climatology_directory,
+        anomaly_sigma,
         pbs,
         os.cpu_count(),
         num_jobs,
+        f"{min_jobs} - {max_jobs}" if adapt else adapt,
     )
 
     # only parallel across local hardware
@@ -102,7 +210,28 @@ def goes_threshold(
 
     _logger.info("Processing %s scans...", len(scan_filepaths))
 
-    cluster_kwargs = {"n_workers": num_jobs}
+    max_jobs = (
+        max_jobs
+        if max_jobs is not None
+        else goes_level_1.utilities.REGION_MAXIMUM_JOBS[region]
+    )
+    node_hours = multiprocessing.estimate_node_hours(
+        num_tasks=len(scan_filepaths),
+        seconds_per_task=goes_level_1.utilities.REGION_SCAN_SECONDS[region],
+    )
+    _logger.info(
+        "Estimated cost: %.2f node-hours, or %.2f hours on %d jobs.",
+        node_hours,
+        node_hours / (max_jobs if adapt else num_jobs),
+        max_jobs if adapt else num_jobs,
+    )
+    if dry_run:
+        return
+
+    if adapt:
+        cluster_kwargs = {"adapt": {"minimum": min_jobs, "maximum": max_jobs}}
+    else:
+        cluster_kwargs = {"n_workers": num_jobs}
     threshold_model.label_wildfires(
         scan_filepaths=scan_filepaths,
         persist_directory=persist_directory,
@@ -110,13 +239,234 @@ def goes_threshold(
         region=region,
         start=start,
         end=end,
+        climatology_directory=os.path.abspath(climatology_directory)
+        if climatology_directory
+        else None,
+        anomaly_sigma=anomaly_sigma,
         pbs=pbs,
         **cluster_kwargs,
     )
     _logger.info("Job completed.")
 
 
-@predict.command
-def goes_deep():
-    """Not yet implemented."""
-    pass
+@predict.command()
+@click.argument("level_1_directory", type=click.Path(exists=True, file_okay=False))
+@click.argument("level_2_directory", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--report_file",
+    default="./threshold_evaluation.json",
+    type=click.Path(dir_okay=False),
+    help="File in which to write the counts and metrics of the evaluation as JSON.",
+)
+@click.option(
+    "--tolerance",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Pixels within which a prediction matches a level 2 fire.",
+)
+@click.option(
+    "--truth",
+    default="mask",
+    type=click.Choice(threshold_model.evaluation.LEVEL_2_TRUTHS),
+    help="Take level 2 fires from the fire categories of Mask, or a finite Temp.",
+)
+@click.option("--pbs", is_flag=True, help="If running using a PBS cluster.")
+@click.option("--num_jobs", default=1, type=int, help="Number of jobs to submit.")
+def evaluate_goes_threshold(
+    level_1_directory, level_2_directory, report_file, tolerance, truth, pbs, num_jobs
+):
+    """Evaluate the threshold model against GOES level 2 fire products.
+
+    Each level 2 scan in `LEVEL_2_DIRECTORY` is matched with its level 1 scan in
+    `LEVEL_1_DIRECTORY`, and the confusion counts of the predictions of the threshold
+    model against the level 2 fires of every scan are added up into a single report.
+
+    Usage
+    -----
+    `predict evaluate-goes-threshold ./level_1_directory ./level_2_directory`
+    `predict evaluate-goes-threshold ./level_1 ./level_2 --tolerance=1 --pbs --num_jobs=8`
+    """
+    level_2_filepaths = sorted(
+        glob.glob(os.path.join(level_2_directory, "**", "*.nc"), recursive=True)
+    )
+    _logger.info(
+        """Evaluating the threshold model against GOES level 2 fire data.
+    GOES Level 1 Directory: %s
+    GOES Level 2 Directory: %s
+    Level 2 Scans: %d
+    Tolerance: %d
+    Truth: %s
+    PBS: %s
+    Number of Jobs: %s""",
+        level_1_directory,
+        level_2_directory,
+        len(level_2_filepaths),
+        tolerance,
+        truth,
+        pbs,
+        num_jobs,
+    )
+    confusion_counts = threshold_model.evaluation.evaluate(
+        level_2_filepaths=level_2_filepaths,
+        level_1_directory=level_1_directory,
+        tolerance=tolerance,
+        truth=truth,
+        pbs=pbs,
+        n_workers=num_jobs,
+    )
+    report = threshold_model.evaluation.write_report(
+        confusion_counts=confusion_counts,
+        filepath=report_file,
+        tolerance=tolerance,
+        truth=truth,
+        thresholds=threshold_model.DEFAULT_THRESHOLDS._asdict(),
+    )
+    _logger.info("Saved evaluation to %s: %s", report_file, report["metrics"])
+
+
+@predict.command()
+@click.argument("start", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("end", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("model_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--satellite",
+    default="noaa-goes17",
+    type=click.Choice(["noaa-goes16", "noaa-goes17"]),
+    help="GOES East|GOES East.",
+)
+@click.option(
+    "--region",
+    default="M1",
+    type=click.Choice(["M1", "M2", "C", "F"]),
+    help="US West Coast|US East Coast|US Full|Hemisphere.",
+)
+@click.option(
+    "--goes_directory",
+    default="./downloaded_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which to look for GOES data.",
+)
+@click.option(
+    "--persist_directory",
+    default="./labeled_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which to persist wildfires.",
+)
+@click.option("--height", default=32, type=click.INT, help="Height of image patch")
+@click.option("--width", default=32, type=click.INT, help="Width of image patch")
+@click.option("--stride", default=32, type=click.INT, help="Stride of image patch")
+@click.option(
+    "--batch_size",
+    default=inference.DEFAULT_BATCH_SIZE,
+    type=click.IntRange(min=1),
+    help="Number of patches run through the model at once.",
+)
+@click.option(
+    "--num_threads",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Threads with which each worker runs the model.",
+)
+@click.option(
+    "--probability_threshold",
+    default=inference.DEFAULT_PROBABILITY_THRESHOLD,
+    type=click.FloatRange(0, 1),
+    help="Probability above which a pixel is a wildfire.",
+)
+@click.option(
+    "--statistics_file",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Normalize with the statistics of the archive the model was trained with.",
+)
+@click.option("--pbs", is_flag=True, help="If running using a PBS cluster.")
+@click.option("--num_jobs", default=1, type=int, help="Number of jobs to submit.")
+def goes_deep(  # pylint: disable=too-many-arguments,too-many-locals
+    start,
+    end,
+    model_file,
+    satellite,
+    region,
+    goes_directory,
+    persist_directory,
+    height,
+    width,
+    stride,
+    batch_size,
+    num_threads,
+    probability_threshold,
+    statistics_file,
+    pbs,
+    num_jobs,
+):
+    """Label wildfires in GOES level 1b data with a trained CNN.
+
+    `MODEL_FILE` is either an ONNX model (.onnx), run with the optional onnxruntime, or a
+    `NumpyModel` (.npz). See `wildfire/models/dnn/inference.py`. Patches should be of the
+    geometry the model was trained on.
+
+    Usage
+    -----
+    `predict goes-deep 2019-01-01 2019-01-02 ./model.onnx`
+    `predict goes-deep 2019-01-01 2019-01-02 ./model.onnx --batch_size=128`
+    `predict goes-deep 2019-01-01 2019-01-02 ./model.onnx --num_threads=4`
+    """
+    _logger.info(
+        """Labeling wildfires from GOES data with a CNN.
+    Satellite: %s
+    Region: %s
+    Start Time: %s
+    End Time: %s
+    Model: %s
+    GOES Directory: %s
+    Persist Directory: %s
+    Batch Size: %s
+    Number of Threads: %s
+    Statistics File: %s
+    PBS: %s
+    Number of Jobs: %s""",
+        satellite,
+        region,
+        start,
+        end,
+        model_file,
+        goes_directory,
+        persist_directory,
+        batch_size,
+        num_threads,
+        statistics_file,
+        pbs,
+        num_jobs,
+    )
+
+    filepaths = goes_level_1.utilities.list_local_files(
+        local_directory=goes_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start,
+        end_time=end,
+    )
+    if not filepaths:
+        raise ValueError("No local files found...")
+
+    scan_filepaths = goes_level_1.utilities.group_filepaths_into_scans(filepaths)
+    _logger.info("Processing %s scans...", len(scan_filepaths))
+    inference.label_wildfires(
+        scan_filepaths=scan_filepaths,
+        model_filepath=os.path.abspath(model_file),
+        persist_directory=persist_directory,
+        satellite=satellite,
+        region=region,
+        start=start,
+        end=end,
+        height=height,
+        width=width,
+        stride=stride,
+        batch_size=batch_size,
+        num_threads=num_threads,
+        probability_threshold=probability_threshold,
+        statistics_filepath=os.path.abspath(statistics_file) if statistics_file else None,
+        pbs=pbs,
+        n_workers=num_jobs,
+    )
+    _logger.info("Job completed.")
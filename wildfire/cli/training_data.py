@@ -1,24 +1,90 @@
 """Create training datasets."""
+import functools
+import glob
+import itertools
 import logging
 import os
 
 import click
 
-from wildfire.models import dnn
+from wildfire import instrumentation, multiprocessing, profiling
+from wildfire.data.goes_level_1 import utilities as gl1_utilities
+from wildfire.models import dnn, threshold_model
+
+DATETIME_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
 
 
 @click.group()
-def training_data():
+@click.option(
+    "--backend",
+    default=None,
+    type=click.Choice(sorted(multiprocessing.BACKENDS)),
+    help="Backend over which to parallelize. Defaults to $WILDFIRE_BACKEND or dask.",
+)
+@click.option(
+    "--metrics_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary as JSON.",
+)
+@click.option(
+    "--prometheus_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary for Prometheus.",
+)
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Path(file_okay=False),
+    help=(
+        "Directory in which to write cProfile (.prof) or pyinstrument (.html) profiles "
+        "of a sample of tasks, and the dask performance report (.html)."
+    ),
+)
+@click.option(
+    "--profile_rate",
+    default=profiling.DEFAULT_SAMPLE_RATE,
+    type=click.FloatRange(0, 1),
+    help="Fraction of tasks to profile.",
+)
+@click.option(
+    "--profiler",
+    default="cprofile",
+    type=click.Choice(profiling.PROFILERS),
+    help="Profiler of tasks. pyinstrument must be installed separately.",
+)
+@click.pass_context
+def training_data(
+    ctx, backend, metrics_file, prometheus_file, profile, profile_rate, profiler
+):
     """Create training data for the wildfire models.
 
     Usage
     -----
     `training-data --help`
     """
-    pass
+    if backend is not None:
+        multiprocessing.set_default_backend(name=backend)
+    if multiprocessing.get_default_backend() == "mpi":
+        multiprocessing.initialize_mpi()  # before any other work, on every rank
+
+    if profile is not None:
+        profiling.enable(directory=profile, sample_rate=profile_rate, profiler=profiler)
+
+    # time the stages of the command, and report them once it completes
+    instrumentation.reset()
+    ctx.call_on_close(
+        functools.partial(
+            instrumentation.report,
+            json_filepath=metrics_file,
+            prometheus_filepath=prometheus_file,
+            labels={"command": ctx.invoked_subcommand},
+        )
+    )
 
 
 @training_data.command()
@@ -32,26 +98,81 @@ def training_data():
 @click.option("--height", default=32, type=click.INT, help="Height of image patch")
 @click.option("--width", default=32, type=click.INT, help="Width of image patch")
 @click.option("--stride", default=32, type=click.INT, help="Stride of image patch")
+@click.option(
+    "--negative_ratio",
+    default=0.0,
+    type=click.FloatRange(min=0),
+    help="Patches without fire to keep per patch with fire.",
+)
+@click.option(
+    "--max_negatives",
+    default=dnn.training_data.DEFAULT_MAX_NEGATIVES,
+    type=click.IntRange(min=0),
+    help="Most patches without fire to keep per scan.",
+)
+@click.option(
+    "--min_negatives",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Fewest patches without fire to keep per scan, even without fire.",
+)
+@click.option(
+    "--stratify",
+    is_flag=True,
+    help="Sample patches without fire evenly from cloud, water and night backgrounds.",
+)
+@click.option("--seed", default=None, type=int, help="Seed of the sampling.")
+@click.option(
+    "--statistics_file",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Normalize with these statistics of the archive (see goes-statistics).",
+)
 @click.option("--pbs", is_flag=True, help="If running using a PBS cluster.")
 @click.option("--num_jobs", default=1, help="Number of jobs to submit.")
-def goes_l2_cnn(
+@click.option(
+    "--adapt", is_flag=True, help="Scale the number of jobs with the backlog of files."
+)
+@click.option("--min_jobs", default=1, type=int, help="Fewest jobs when adapting.")
+@click.option(
+    "--max_jobs",
+    default=None,
+    type=int,
+    help="Most jobs when adapting. Defaults to the maximum for Full Disk scans.",
+)
+@click.option("--dry_run", is_flag=True, help="Estimate the cost and exit.")
+def goes_l2_cnn(  # pylint: disable=too-many-arguments,too-many-locals
     level_1_directory,
     level_2_directory,
     persist_directory,
     height,
     width,
     stride,
+    negative_ratio,
+    max_negatives,
+    min_negatives,
+    stratify,
+    seed,
+    statistics_file,
     pbs,
     num_jobs,
+    adapt,
+    min_jobs,
+    max_jobs,
+    dry_run,
 ):
     """Create GOES level 2 training data for the DNN.
 
     If using PBS, then additional configuration can be set in the files located at the
     path set by the `DASK_ROOT_CONFIG` environment variable, namely, `dask_config/`.
 
+    With `--adapt`, jobs are requested and released as the backlog of files grows and
+    drains, between `--min_jobs` and `--max_jobs`, instead of a static `--num_jobs`.
+
     Usage
     -----
     `training-data goes-l2-cnn ./level_1_directory ./level_2_directory`
+    `training-data goes-l2-cnn ./level_1 ./level_2 --negative_ratio=1 --stratify`
     """
     _logger.info(
         """Creating training data from GOES level 2 wildfire data.
@@ -61,21 +182,56 @@ def goes_l2_cnn(
     Height: %s
     Width: %s
     Stride: %s
+    Negative Ratio: %s
+    Max Negatives: %s
+    Min Negatives: %s
+    Stratify: %s
+    Statistics File: %s
     PBS: %s
     Number of Processes: %s
-    Number of Jobs: %s""",
+    Number of Jobs: %s
+    Adapt: %s""",
         level_1_directory,
         level_2_directory,
         persist_directory,
         height,
         width,
         stride,
+        negative_ratio,
+        max_negatives,
+        min_negatives,
+        stratify,
+        statistics_file,
         pbs,
         os.cpu_count(),
         num_jobs,
+        f"{min_jobs} - {max_jobs}" if adapt else adapt,
+    )
+
+    # the level 2 fire products used for training are Full Disk
+    max_jobs = (
+        max_jobs if max_jobs is not None else gl1_utilities.REGION_MAXIMUM_JOBS["F"]
+    )
+    num_filepaths = len(
+        glob.glob(os.path.join(level_2_directory, "**", "*.nc"), recursive=True)
+    )
+    node_hours = multiprocessing.estimate_node_hours(
+        num_tasks=num_filepaths, seconds_per_task=gl1_utilities.REGION_SCAN_SECONDS["F"]
+    )
+    _logger.info(
+        "Estimated cost for %d files: %.2f node-hours, or %.2f hours on %d jobs.",
+        num_filepaths,
+        node_hours,
+        node_hours / (max_jobs if adapt else num_jobs),
+        max_jobs if adapt else num_jobs,
     )
+    if dry_run:
+        return
 
-    cluster_kwargs = {"n_workers": num_jobs}
+    if adapt:
+        cluster_kwargs = {"adapt": {"minimum": min_jobs, "maximum": max_jobs}}
+    else:
+        cluster_kwargs = {"n_workers": num_jobs}
     dnn.training_data.create_goes_level_2_training_data(
         level_2_directory=level_2_directory,
         level_1_directory=level_1_directory,
@@ -83,12 +239,204 @@ def goes_l2_cnn(
         height=height,
         width=width,
         stride=stride,
+        negative_ratio=negative_ratio,
+        max_negatives=max_negatives,
+        min_negatives=min_negatives,
+        stratify=stratify,
+        seed=seed,
+        statistics_filepath=os.path.abspath(statistics_file) if statistics_file else None,
         pbs=pbs,
         **cluster_kwargs,
     )
     _logger.info("Job completed.")
 
 
+@training_data.command()
+@click.argument("start", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("end", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("statistics_file", type=click.Path(dir_okay=False))
+@click.option(
+    "--satellite",
+    "satellites",
+    default=("noaa-goes16", "noaa-goes17"),
+    multiple=True,
+    type=click.Choice(["noaa-goes16", "noaa-goes17"]),
+    help="Satellites over whose scans to compute statistics. May be repeated.",
+)
+@click.option(
+    "--region",
+    "regions",
+    default=("M1", "M2", "C", "F"),
+    multiple=True,
+    type=click.Choice(["M1", "M2", "C", "F"]),
+    help="Regions over whose scans to compute statistics. May be repeated.",
+)
+@click.option(
+    "--goes_directory",
+    default="./downloaded_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which to look for GOES data.",
+)
+@click.option(
+    "--by_region", is_flag=True, help="Also keep the statistics of each region."
+)
+@click.option("--pbs", is_flag=True, help="If running using a PBS cluster.")
+@click.option("--num_jobs", default=1, type=int, help="Number of jobs to submit.")
+def goes_statistics(
+    start,
+    end,
+    statistics_file,
+    satellites,
+    regions,
+    goes_directory,
+    by_region,
+    pbs,
+    num_jobs,
+):
+    """Compute the statistics of each band over the GOES level 1b archive.
+
+    The statistics are written as JSON to `STATISTICS_FILE`, from which `goes-l2-cnn` and
+    `predict goes-deep` normalize scans with `--statistics_file`. See
+    `wildfire/models/dnn/normalization.py`.
+
+    Usage
+    -----
+    `training-data goes-statistics 2019-01-01 2019-02-01 ./statistics.json`
+    `training-data goes-statistics 2019-01-01 2019-02-01 ./statistics.json --by_region`
+    """
+    _logger.info(
+        """Computing the statistics of GOES level 1b data.
+    Satellites: %s
+    Regions: %s
+    Start Time: %s
+    End Time: %s
+    GOES Directory: %s
+    Statistics File: %s
+    By Region: %s
+    PBS: %s
+    Number of Jobs: %s""",
+        satellites,
+        regions,
+        start,
+        end,
+        goes_directory,
+        statistics_file,
+        by_region,
+        pbs,
+        num_jobs,
+    )
+
+    scan_filepaths = []
+    for satellite, region in itertools.product(satellites, regions):
+        filepaths = gl1_utilities.list_local_files(
+            local_directory=goes_directory,
+            satellite=satellite,
+            region=region,
+            start_time=start,
+            end_time=end,
+        )
+        scan_filepaths.extend(gl1_utilities.group_filepaths_into_scans(filepaths))
+    if not scan_filepaths:
+        raise ValueError("No local files found...")
+
+    statistics = dnn.normalization.compute_statistics(
+        scan_filepaths=scan_filepaths, by_region=by_region, pbs=pbs, n_workers=num_jobs
+    )
+    dnn.normalization.save_statistics(statistics=statistics, filepath=statistics_file)
+    _logger.info("Saved the statistics of %s to %s", sorted(statistics), statistics_file)
+
+
+@training_data.command()
+@click.argument("start", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("end", type=click.DateTime(formats=DATETIME_FORMATS))
+@click.argument("climatology_directory", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--satellite",
+    default="noaa-goes17",
+    type=click.Choice(["noaa-goes16", "noaa-goes17"]),
+    help="GOES East|GOES East.",
+)
+@click.option(
+    "--region",
+    default="C",
+    type=click.Choice(["M1", "M2", "C", "F"]),
+    help="US West Coast|US East Coast|US Full|Hemisphere.",
+)
+@click.option(
+    "--goes_directory",
+    default="./downloaded_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which to look for GOES data.",
+)
+@click.option("--create", is_flag=True, help="Replace any existing climatology.")
+@click.option("--pbs", is_flag=True, help="If running using a PBS cluster.")
+@click.option("--num_jobs", default=1, type=int, help="Number of jobs to submit.")
+def goes_climatology(
+    start,
+    end,
+    climatology_directory,
+    satellite,
+    region,
+    goes_directory,
+    create,
+    pbs,
+    num_jobs,
+):
+    """Add GOES level 1b scans to the per-pixel climatology of the threshold model.
+
+    Scans are added to the climatology in `CLIMATOLOGY_DIRECTORY`, which is created if
+    there is none, so that it can be updated as the archive grows. Scans already in the
+    climatology are skipped, so re-running over the same period adds only new scans. See
+    `wildfire/models/threshold_model/climatology.py`.
+
+    Usage
+    -----
+    `training-data goes-climatology 2019-01-01 2019-02-01 ./climatology --region=C`
+    """
+    _logger.info(
+        """Updating the climatology of GOES level 1b data.
+    Satellite: %s
+    Region: %s
+    Start Time: %s
+    End Time: %s
+    GOES Directory: %s
+    Climatology Directory: %s
+    Create: %s
+    PBS: %s
+    Number of Jobs: %s""",
+        satellite,
+        region,
+        start,
+        end,
+        goes_directory,
+        climatology_directory,
+        create,
+        pbs,
+        num_jobs,
+    )
+
+    filepaths = gl1_utilities.list_local_files(
+        local_directory=goes_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start,
+        end_time=end,
+    )
+    if not filepaths:
+        raise ValueError("No local files found...")
+
+    threshold_model.climatology.update_climatology(
+        scan_filepaths=gl1_utilities.group_filepaths_into_scans(filepaths),
+        directory=os.path.abspath(climatology_directory),
+        satellite=satellite,
+        region=region,
+        create=create,
+        pbs=pbs,
+        n_workers=num_jobs,
+    )
+    _logger.info("Job completed.")
+
+
 @training_data.command()
 def threshold_cnn():
     """Not yet implemented."""
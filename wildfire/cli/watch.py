@@ -0,0 +1,144 @@
+"""Watch for new satellite data and run the wildfire models as it arrives."""
+import functools
+import logging
+
+import click
+
+from wildfire import instrumentation
+from wildfire.models import threshold_model
+
+DATETIME_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+
+@click.group()
+@click.option(
+    "--metrics_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary as JSON.",
+)
+@click.option(
+    "--prometheus_file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="File in which to write the performance summary for Prometheus.",
+)
+@click.pass_context
+def watch(ctx, metrics_file, prometheus_file):
+    """Run the wildfire models in near real time.
+
+    Usage
+    -----
+    `watch --help`
+    """
+    # time the stages of the command, and report them once it completes
+    instrumentation.reset()
+    ctx.call_on_close(
+        functools.partial(
+            instrumentation.report,
+            json_filepath=metrics_file,
+            prometheus_filepath=prometheus_file,
+            labels={"command": ctx.invoked_subcommand},
+        )
+    )
+
+
+@watch.command()
+@click.option(
+    "--satellite",
+    default="noaa-goes17",
+    type=click.Choice(["noaa-goes16", "noaa-goes17"]),
+    help="GOES East|GOES East.",
+)
+@click.option(
+    "--region",
+    default="M1",
+    type=click.Choice(["M1", "M2", "C", "F"]),
+    help="US West Coast|US East Coast|US Full|Hemisphere.",
+)
+@click.option(
+    "--goes_directory",
+    default="./downloaded_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which to download GOES data.",
+)
+@click.option(
+    "--persist_directory",
+    default="./labeled_data",
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory in which to persist wildfires.",
+)
+@click.option(
+    "--poll_seconds", default=10.0, type=click.FLOAT, help="Seconds between polls."
+)
+@click.option(
+    "--source_directory",
+    default=None,
+    type=click.Path(exists=True, file_okay=False),
+    help="Local directory laid out like the S3 bucket to watch instead of Amazon S3.",
+)
+@click.option(
+    "--max_polls", default=None, type=click.INT, help="Stop after this many polls."
+)
+@click.option(
+    "--since",
+    default=None,
+    type=click.DateTime(formats=DATETIME_FORMATS),
+    help="Also label scans already published since this UTC time. Defaults to now.",
+)
+def goes_threshold(
+    satellite,
+    region,
+    goes_directory,
+    persist_directory,
+    poll_seconds,
+    source_directory,
+    max_polls,
+    since,
+):
+    """Label wildfires in GOES level 1b data as it is published.
+
+    Polls Amazon S3 for the bands of new scans, downloads each band as it appears, and
+    runs the threshold model as soon as a scan is complete.
+
+    Usage
+    -----
+    `watch goes-threshold --region=C`
+    """
+    _logger.info(
+        """Watching for wildfires in GOES data with the threshold model.
+    Satellite: %s
+    Region: %s
+    GOES Directory: %s
+    Persist Directory: %s
+    Poll Seconds: %s
+    Source Directory: %s
+    Since: %s""",
+        satellite,
+        region,
+        goes_directory,
+        persist_directory,
+        poll_seconds,
+        source_directory if source_directory else "Amazon S3",
+        since if since else "now",
+    )
+
+    import fsspec  # pylint: disable=import-outside-toplevel
+
+    wildfires = threshold_model.goes_level_1_wildfires.watch_wildfires(
+        satellite=satellite,
+        region=region,
+        goes_directory=goes_directory,
+        persist_directory=persist_directory,
+        poll_seconds=poll_seconds,
+        remote_directory=source_directory,
+        filesystem=fsspec.filesystem("file") if source_directory else None,
+        max_polls=max_polls,
+        since=since,
+    )
+    for wildfire in wildfires:
+        _logger.info("Wildfire: %s", wildfire)
+    _logger.info("Job completed.")
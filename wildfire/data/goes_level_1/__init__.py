@@ -19,4 +19,4 @@ GOES-17 Mesoscale
 https://s3.console.aws.amazon.com/s3/buckets/noaa-goes17/ABI-L1b-RadM/?region=us-east-1&tab=overview
 """
 from .band import get_goes_band, GoesBand, read_netcdf
-from .scan import get_goes_scan, GoesScan, read_netcdfs
+from .scan import get_goes_scan, GoesScan, read_netcdf_groups, read_netcdfs
@@ -0,0 +1,266 @@
+"""Manifests for verifying the integrity of the local archive of GOES level 1 data.
+
+Every directory of downloaded files holds a `.manifest.json` recording the size, S3 ETag
+and, if asked for, md5 checksum of each file as it was downloaded. A file whose size no
+longer matches its manifest (e.g. truncated by a killed worker) is "partial", and a file
+whose checksum no longer matches is "corrupt". Checking sizes only needs a `stat` per
+file, so a large archive can be verified without re-reading it.
+
+Manifests are updated under a lock on `.manifest.json.lock`, and replaced atomically, so
+that concurrent downloads into the same directory do not lose each other's entries. The
+lock is taken with `fcntl`, so this module only works on POSIX systems (e.g. Linux and
+the NAS clusters), not on Windows.
+
+The archive is deduplicated by key rather than by content: each file is stored at the
+path of its Amazon S3 key relative to the bucket, so it is held at most once, and a
+repaired file replaces the partial or corrupt one in place. Scans that NOAA published
+twice under different creation times are different keys, and are both kept.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from wildfire import multiprocessing
+from . import utilities
+
+MANIFEST_FILENAME = ".manifest.json"
+LOCK_FILENAME = ".manifest.json.lock"
+CHECKSUM_BLOCK_SIZE = 2 ** 20
+STATUSES = ("ok", "unrecorded", "partial", "corrupt", "missing")
+
+_logger = logging.getLogger(__name__)
+# POSIX locks only exclude other processes, so threads also take this one
+_THREAD_LOCK = threading.Lock()
+
+
+def checksum(filepath):
+    """Compute the md5 checksum of the file at `filepath`.
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    str
+        Hex digest.
+    """
+    md5 = hashlib.md5()
+    with open(filepath, "rb") as buffer:
+        for block in iter(lambda: buffer.read(CHECKSUM_BLOCK_SIZE), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def read_manifest(directory):
+    """Read the manifest of `directory`.
+
+    Parameters
+    ----------
+    directory : str
+
+    Returns
+    -------
+    dict
+        Of the form {filename: {"size": int, "md5": str, "etag": str}}, where "md5" is
+        empty if the checksum was not recorded. Empty if `directory` has no manifest.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_FILENAME)) as buffer:
+            return json.load(buffer)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_files(local_filepaths, etags=None, sizes=None, use_checksum=True):
+    """Record the size and checksum of `local_filepaths` in their directories' manifests.
+
+    Parameters
+    ----------
+    local_filepaths : list of str
+    etags : dict, optional
+        Of the form {local_filepath: etag}, for files downloaded from Amazon S3.
+    sizes : dict, optional
+        Of the form {local_filepath: size}, e.g. from an Amazon S3 listing. By default
+        the sizes of the files on disk.
+    use_checksum : bool, optional
+        Whether to compute and record the checksums of the files, in parallel across
+        local hardware, by default True. Without checksums, `verify` can only compare
+        sizes.
+    """
+    if not local_filepaths:
+        return
+    etags = etags if etags is not None else {}
+    sizes = sizes if sizes is not None else {}
+    if use_checksum:
+        checksums = multiprocessing.map_function(  # hashlib releases the GIL
+            function=checksum, function_args=list(local_filepaths), backend="threads"
+        )
+    else:
+        checksums = [""] * len(local_filepaths)
+
+    by_directory = {}
+    for filepath, md5 in zip(local_filepaths, checksums):
+        by_directory.setdefault(os.path.dirname(filepath), {})[
+            os.path.basename(filepath)
+        ] = {
+            "size": sizes.get(filepath) or os.path.getsize(filepath),
+            "md5": md5,
+            "etag": etags.get(filepath, ""),
+        }
+
+    for directory, entries in by_directory.items():
+        update_manifest(directory=directory, entries=entries)
+    _logger.info("Recorded %d files in manifests.", len(local_filepaths))
+
+
+def update_manifest(directory, entries):
+    """Add `entries` to the manifest of `directory`.
+
+    The manifest is read, updated and replaced under an exclusive lock, so that
+    concurrent updates, e.g. by downloads of different days into the same directory,
+    are not lost, and readers never see a partially written manifest.
+
+    Parameters
+    ----------
+    directory : str
+    entries : dict
+        Of the form {filename: {"size": int, "md5": str, "etag": str}}.
+    """
+    with _THREAD_LOCK, open(os.path.join(directory, LOCK_FILENAME), "a") as lock:
+        fcntl.lockf(lock, fcntl.LOCK_EX)  # POSIX locks also hold over NFS
+        try:
+            manifest = read_manifest(directory=directory)
+            manifest.update(entries)
+            file_descriptor, temporary_filepath = tempfile.mkstemp(dir=directory)
+            with os.fdopen(file_descriptor, "w") as buffer:
+                json.dump(manifest, buffer)
+            os.replace(temporary_filepath, os.path.join(directory, MANIFEST_FILENAME))
+        finally:
+            fcntl.lockf(lock, fcntl.LOCK_UN)
+
+
+def verify(
+    local_directory, satellite, region, start_time, end_time=None, use_checksum=False
+):
+    """Verify the local files matching parameters against their manifests.
+
+    Does not make any requests to Amazon S3, so files that have never been recorded in a
+    manifest are reported as "unrecorded". Use `downloader.download_files` to repair
+    the archive.
+
+    Parameters
+    ----------
+    local_directory : str
+    satellite : str
+        Must be in set (noaa-goes16, noaa-goes17).
+    region : str
+        Must be in set (M1, M2, C, F).
+    start_time : datetime.datetime
+    end_time : datetime.datetime, optional
+        By default `None`, which will verify all files whose scan start time matches
+        `start_time`.
+    use_checksum : bool, optional
+        Whether to also compare checksums, by default False.
+
+    Returns
+    -------
+    dict
+        Of the form {local_filepath: status}, where status is one of `STATUSES`.
+    """
+    local_filepaths = utilities.list_local_files(
+        local_directory=local_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start_time,
+        end_time=end_time,
+        use_compact=False,
+    )
+    return verify_files(local_filepaths=local_filepaths, use_checksum=use_checksum)
+
+
+def verify_files(local_filepaths, expected_sizes=None, use_checksum=False):
+    """Verify `local_filepaths` against their manifests.
+
+    Parameters
+    ----------
+    local_filepaths : list of str
+    expected_sizes : dict, optional
+        Of the form {local_filepath: size}, e.g. from an Amazon S3 listing. Used for files
+        that are not in a manifest.
+    use_checksum : bool, optional
+        Whether to also compare checksums, which requires reading every file. By default
+        False, which only compares sizes.
+
+    Returns
+    -------
+    dict
+        Of the form {local_filepath: status}, where status is one of `STATUSES`.
+    """
+    expected_sizes = expected_sizes if expected_sizes is not None else {}
+    manifests = {}
+    for filepath in local_filepaths:
+        directory = os.path.dirname(filepath)
+        if directory not in manifests:
+            manifests[directory] = read_manifest(directory=directory)
+
+    entries = [
+        manifests[os.path.dirname(filepath)].get(os.path.basename(filepath))
+        for filepath in local_filepaths
+    ]
+    sizes = [expected_sizes.get(filepath) for filepath in local_filepaths]
+    if use_checksum and local_filepaths:
+        statuses = multiprocessing.map_function(  # hashlib releases the GIL
+            backend="threads",
+            function=verify_file,
+            function_args=[
+                list(local_filepaths),
+                entries,
+                sizes,
+                [True] * len(local_filepaths),
+            ],
+        )
+    else:
+        statuses = [
+            verify_file(local_filepath=filepath, entry=entry, expected_size=size)
+            for filepath, entry, size in zip(local_filepaths, entries, sizes)
+        ]
+    return dict(zip(local_filepaths, statuses))
+
+
+def verify_file(local_filepath, entry=None, expected_size=None, use_checksum=False):
+    """Verify a single file against its manifest entry.
+
+    Parameters
+    ----------
+    local_filepath : str
+    entry : dict, optional
+        Manifest entry of the form {"size": int, "md5": str, "etag": str}.
+    expected_size : int, optional
+        Size to check against if there is no manifest entry.
+    use_checksum : bool, optional
+        Whether to compare the checksum of the file to `entry`, if it has one.
+
+    Returns
+    -------
+    str
+        One of `STATUSES`.
+    """
+    try:
+        size = os.path.getsize(local_filepath)
+    except OSError:
+        return "missing"
+
+    if entry is None:
+        if expected_size is None:
+            return "unrecorded"
+        return "ok" if size == expected_size else "partial"
+    if size != entry["size"]:
+        return "partial"
+    if use_checksum and entry["md5"] and checksum(local_filepath) != entry["md5"]:
+        return "corrupt"
+    return "ok"
@@ -1,15 +1,53 @@
 """Wrapper around the a single band from a GOES Level 1 satellite scan."""
+from collections import OrderedDict
+import functools
 import os
+import threading
+import uuid
 
 import numpy as np
 import xarray as xr
 
+from wildfire import instrumentation, precision
 from . import downloader, utilities
 
-
-def get_goes_band(satellite, region, channel, scan_time_utc, local_directory, s3=True):
+# the variables needed to calibrate, filter and identify a band
+REMOTE_VARIABLES = (
+    "Rad",
+    "DQF",
+    "band_wavelength",
+    "kappa0",
+    "planck_fk1",
+    "planck_fk2",
+    "planck_bc1",
+    "planck_bc2",
+)
+REMOTE_BLOCK_SIZE = 2 ** 22  # bytes; a few HDF5 chunks of Rad
+# the encoding of Rad in NOAA's files, reused when packing Rad as integers
+PACKING_KEYS = ("dtype", "scale_factor", "add_offset", "_FillValue", "_Unsigned")
+# most bytes of derived products (see `GoesBand.release`) kept by the bands of a scan,
+# together with the bands derived from them; enough for a few float64 copies of the
+# bands of a Full Disk scan that models use together
+CACHE_BUDGET_BYTES = 2 ** 32
+
+
+def get_goes_band(
+    satellite,
+    region,
+    channel,
+    scan_time_utc,
+    local_directory,
+    s3=True,
+    remote=False,
+    x_slice=None,
+    y_slice=None,
+):
     """Read the GoesBand defined by parameters from the local filesystem or Amazon S3.
 
+    If `remote`, bands that are not already local are read directly from Amazon S3
+    without being written to `local_directory`. Only the HDF5 chunks covering
+    `x_slice`, `y_slice` and `REMOTE_VARIABLES` are requested.
+
     Parameters
     ----------
     satellite : str
@@ -22,6 +60,14 @@ def get_goes_band(satellite, region, channel, scan_time_utc, local_directory, s3
     local_directory : str
     s3 : bool, optional
         Whether to download scan data from Amazon S3, if not already local.
+    remote : bool, optional
+        Whether to read from Amazon S3 without downloading, by default False.
+    x_slice : slice, optional
+        Bounds on the x coordinate (scan angle in radians, increasing) to read. By
+        default `None`, which reads the entire band.
+    y_slice : slice, optional
+        Bounds on the y coordinate (scan angle in radians, decreasing), e.g.
+        `slice(0.1, 0.05)`. By default `None`, which reads the entire band.
 
     Returns
     -------
@@ -33,19 +79,31 @@ def get_goes_band(satellite, region, channel, scan_time_utc, local_directory, s3
         region=region,
         start_time=scan_time_utc,
         channel=channel,
+        use_compact=False,
     )
+    transform_func = None
+    if x_slice is not None or y_slice is not None:
+        transform_func = functools.partial(subset, x_slice=x_slice, y_slice=y_slice)
     if len(local_filepaths) == 1:
-        return read_netcdf(local_filepath=local_filepaths[0])
+        return read_netcdf(
+            local_filepath=local_filepaths[0], transform_func=transform_func
+        )
 
     if s3:
         s3_filepaths = downloader.list_s3_files(
             satellite=satellite, region=region, channel=channel, start_time=scan_time_utc,
         )
+        if len(s3_filepaths) == 1 and remote:
+            return read_netcdf_remote(
+                filepath=s3_filepaths[0], x_slice=x_slice, y_slice=y_slice
+            )
         if len(s3_filepaths) == 1:
             downloaded_filepath = downloader.download_file(
                 s3_filepath=s3_filepaths[0], local_directory=local_directory,
             )
-            return read_netcdf(local_filepath=downloaded_filepath)
+            return read_netcdf(
+                local_filepath=downloaded_filepath, transform_func=transform_func
+            )
 
         raise ValueError(
             f"Could not find band. local: {len(local_filepaths)} files; "
@@ -54,7 +112,7 @@ def get_goes_band(satellite, region, channel, scan_time_utc, local_directory, s3
     raise ValueError(f"Could not find band. local: {len(local_filepaths)} files")
 
 
-def read_netcdf(local_filepath, transform_func=None):
+def read_netcdf(local_filepath, transform_func=None, group=None):
     """Read the netcdf4 file defined at `local_filepath`.
 
     If `transform_func` is provided, then transform dataset defined by `filepath` before
@@ -65,18 +123,166 @@ def read_netcdf(local_filepath, transform_func=None):
     local_filepath : str
     transform_func : function
         f(xr.core.dataset.Dataset) -> (xr.core.dataset.Dataset)
+    group : str, optional
+        Group of the file in which the band is stored, by default `None` which reads the
+        root group.
+
+    Returns
+    -------
+    GoesBand
+    """
+    with instrumentation.timer("read_netcdf", nbytes=os.path.getsize(local_filepath)):
+        dataset = xr.load_dataset(local_filepath, group=group)
+    if transform_func is not None:
+        dataset = transform_func(dataset)
+    return GoesBand(dataset=dataset)
+
+
+def read_netcdf_remote(
+    filepath,
+    filesystem=None,
+    x_slice=None,
+    y_slice=None,
+    variables=REMOTE_VARIABLES,
+    transform_func=None,
+    block_size=REMOTE_BLOCK_SIZE,
+):
+    """Read part of the netcdf4 file at `filepath` on a remote filesystem.
+
+    The file is opened through fsspec with a block cache, so only the blocks holding
+    HDF5 metadata and the chunks of `variables` that intersect `x_slice` and `y_slice`
+    are requested from the filesystem. Nothing is written to local disk.
+
+    Parameters
+    ----------
+    filepath : str
+        e.g. noaa-goes17/ABI-L1b-RadM/2019/300/20/OR_ABI-L1b-RadM1-M6C14_G17_...nc
+    filesystem : fsspec.AbstractFileSystem, optional
+        By default `None`, which uses an anonymous `s3fs.S3FileSystem`.
+    x_slice : slice, optional
+        Bounds on the x coordinate to read. By default `None`, which reads all of x.
+    y_slice : slice, optional
+        Bounds on the (decreasing) y coordinate to read. By default `None`, which reads
+        all of y.
+    variables : iterable of str, optional
+        Variables to read, by default `REMOTE_VARIABLES`.
+    transform_func : function, optional
+        f(xr.core.dataset.Dataset) -> (xr.core.dataset.Dataset)
+    block_size : int, optional
+        Size in bytes of each request made to the filesystem.
 
     Returns
     -------
     GoesBand
     """
-    dataset = xr.load_dataset(local_filepath)
+    filesystem = filesystem if filesystem else downloader.get_s3_filesystem()
+    with filesystem.open(
+        filepath, mode="rb", block_size=block_size, cache_type="blockcache"
+    ) as buffer:
+        with xr.open_dataset(buffer, engine="h5netcdf") as dataset:
+            dataset = subset(
+                dataset=dataset, x_slice=x_slice, y_slice=y_slice, variables=variables
+            ).load()
     if transform_func is not None:
         dataset = transform_func(dataset)
     return GoesBand(dataset=dataset)
 
 
-class GoesBand:
+def subset(dataset, x_slice=None, y_slice=None, variables=None):
+    """Select `variables` over `x_slice` and `y_slice` of `dataset`.
+
+    Parameters
+    ----------
+    dataset : xr.core.dataset.Dataset
+    x_slice : slice, optional
+        Bounds on the x coordinate, by default `None` which selects all of x.
+    y_slice : slice, optional
+        Bounds on the (decreasing) y coordinate, by default `None` which selects all of y.
+    variables : iterable of str, optional
+        By default `None`, which selects all variables.
+
+    Returns
+    -------
+    xr.core.dataset.Dataset
+        With the same attributes as `dataset`.
+    """
+    if variables is not None:
+        attrs = dataset.attrs
+        dataset = dataset[list(variables)]
+        dataset.attrs = attrs
+    return dataset.sel(
+        x=x_slice if x_slice is not None else slice(None),
+        y=y_slice if y_slice is not None else slice(None),
+    )
+
+
+class ProductCache:
+    """Least recently used cache of the derived products of bands, within a byte budget.
+
+    Shared by the bands of a `GoesScan` and the bands derived from them (e.g. by
+    `GoesBand.rescale_to_2km`), so that the budget holds for the whole scan. Pickled
+    empty.
+
+    Attributes
+    ----------
+    budget_bytes : int
+        Most bytes of products to keep, by default `CACHE_BUDGET_BYTES`.
+    """
+
+    def __init__(self, budget_bytes=CACHE_BUDGET_BYTES):
+        """Initialize.
+
+        Parameters
+        ----------
+        budget_bytes : int, optional
+            By default `CACHE_BUDGET_BYTES`.
+        """
+        self.budget_bytes = budget_bytes
+        self._products = OrderedDict()  # (owner, name) -> (product, nbytes)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Pickle without the products, which can be recomputed."""
+        return {"budget_bytes": self.budget_bytes}
+
+    def __setstate__(self, state):
+        """Unpickle empty."""
+        self.__init__(**state)
+
+    @property
+    def nbytes(self):
+        """Bytes of the products currently kept."""
+        return sum(nbytes for _, nbytes in self._products.values())
+
+    def get(self, owner, name, compute):
+        """Get the product `name` of `owner`, computing it with `compute()` if need be."""
+        with self._lock:
+            if (owner, name) in self._products:
+                self._products.move_to_end((owner, name))
+                return self._products[(owner, name)][0]
+
+        product = compute()
+        nbytes = (
+            product.dataset.nbytes if isinstance(product, GoesBand) else product.nbytes
+        )
+        with self._lock:
+            if nbytes <= self.budget_bytes:
+                while self._products and self.nbytes + nbytes > self.budget_bytes:
+                    self._products.popitem(last=False)
+                self._products[(owner, name)] = (product, nbytes)
+        return product
+
+    def release(self, owner=None):
+        """Drop the products of `owner`, by default of every owner."""
+        with self._lock:
+            if owner is None:
+                self._products.clear()
+                return
+            for key in [key for key in self._products if key[0] == owner]:
+                del self._products[key]
+
+
+class GoesBand:  # pylint: disable=too-many-instance-attributes
     """Wrapper around the a single band of data from a GOES level 1 satellite scan.
 
     Attributes
@@ -92,16 +298,39 @@ class GoesBand:
         In the set (noaa-goes16, noaa-goes17). The satellite the scan was made by.
     region : str
         In the set (C, F, M1, M2). The region over which the scan was made.
+    mask : np.ndarray of bool | None
+        `True` at the bad pixels of `dataset`, once filtered with `filter_bad_pixels`.
+        Applied to the radiance and every product derived from it, but not to `dataset`
+        itself.
+    cache : ProductCache
+        Where the derived products of the band are kept, shared with the other bands of
+        its scan.
+
+    Derived products (the calibrated, filtered, normalized and rescaled data) are computed
+    on first access and kept in `cache` until the band is garbage collected or `release`
+    is called, so that they can be accessed repeatedly for free. They are shared between
+    callers, so must not be modified in place. Once the products of the bands sharing
+    `cache` exceed `cache_budget_bytes`, the least recently used are dropped, and they
+    are never pickled.
     """
 
-    def __init__(self, dataset):
+    def __init__(self, dataset, mask=None, cache=None):
         """Initialize.
 
         Parameters
         ----------
         dataset : xr.core.dataset.Dataset
+        mask : np.ndarray of bool, optional
+            Of the shape of `dataset.Rad`, `True` at the pixels to ignore. By default
+            `None`, which keeps every pixel.
+        cache : ProductCache, optional
+            By default `None`, which gives the band a cache of its own, until it is
+            added to a `GoesScan`.
         """
         self.dataset = dataset
+        self.mask = mask
+        self.cache = cache if cache is not None else ProductCache()
+        self._cache_owner = uuid.uuid4().hex
         (
             self.region,
             self.band_id,
@@ -143,7 +372,7 @@ class GoesBand:
         plt.image.AxesImage
         """
         if use_radiance:
-            data = self.dataset.Rad
+            data = self.radiance
         else:
             data = self.parse()
 
@@ -175,11 +404,10 @@ class GoesBand:
         -------
         xr.core.dataarray.DataArray
         """
-        if use_radiance:
-            return normalize(self.dataset.Rad)
-
-        parsed_data = self.parse()
-        return normalize(parsed_data)
+        return self._cached(
+            f"normalize_{use_radiance}",
+            lambda: normalize(self.radiance if use_radiance else self.parse()),
+        )
 
     def rescale_to_2km(self):
         """Scale band to 2km meters x 2km meters.
@@ -200,20 +428,29 @@ class GoesBand:
         GoesBand
             A `GoesBand` object where each band has been rescaled to 500 meters.
         """
+        return self._cached("rescale_to_2km", self._rescale_to_2km)
+
+    def _rescale_to_2km(self):
         if self.dataset.Rad.shape in (
             (500, 500),  # 2km resolution at Mesoscale
             (5424, 5424),  # 2km resolution at Full
             (1500, 2500),  # 2km resolution at CONUS
         ):  # if already at 2km resolution
-            rescaled_data = self.dataset
+            step = 1
         elif self.band_id in (1, 3, 5):
-            rescaled_data = self.dataset.thin(2)  # 500m -> 2km
+            step = 2  # 500m -> 2km
         elif self.band_id == 2:
-            rescaled_data = self.dataset.thin(4)  # 1km -> 2km
+            step = 4  # 1km -> 2km
         else:
-            rescaled_data = self.dataset  # 2km -> 2km
-
-        return GoesBand(dataset=rescaled_data)
+            step = 1  # 2km -> 2km
+
+        if step == 1:
+            return GoesBand(dataset=self.dataset, mask=self.mask, cache=self.cache)
+        return GoesBand(
+            dataset=self.dataset.thin(step),
+            mask=self.mask[::step, ::step] if self.mask is not None else None,
+            cache=self.cache,
+        )
 
     def parse(self):
         """Parse spectral radiance into appropriate units.
@@ -228,6 +465,30 @@ class GoesBand:
             return self.reflectance_factor
         return self.brightness_temperature
 
+    @property
+    def radiance(self):
+        """Get the spectral radiance (`Rad`), with bad pixels set to `np.nan` if masked.
+
+        Returns
+        -------
+        xr.core.dataarray.DataArray
+        """
+        if self.mask is None:
+            return self.dataset.Rad
+        return self._cached("radiance", lambda: self._apply_mask(self.dataset.Rad.copy()))
+
+    @property
+    def masked_dataset(self):
+        """Get `dataset` with `radiance` as its `Rad`.
+
+        Returns
+        -------
+        xr.core.dataset.Dataset
+        """
+        if self.mask is None:
+            return self.dataset
+        return self.dataset.assign(Rad=self.radiance)
+
     @property
     def reflectance_factor(self):
         """Calculate the reflectance factor from spectral radiance.
@@ -239,10 +500,15 @@ class GoesBand:
         -------
         xr.core.dataarray.DataArray
         """
-        dataarray = self.dataset.Rad * self.dataset.kappa0
+        return self._cached("reflectance_factor", self._reflectance_factor)
+
+    @instrumentation.timed("calibrate")  # not cache hits
+    def _reflectance_factor(self):
+        radiance, kappa0 = self._get_variables("Rad", "kappa0")
+        dataarray = radiance * kappa0
         dataarray.attrs["long_name"] = "ABI L1b Reflectance Factor"
         dataarray.attrs["units"] = "unitless"
-        return dataarray
+        return self._apply_mask(dataarray)
 
     @property
     def brightness_temperature(self):
@@ -255,14 +521,17 @@ class GoesBand:
         -------
         xr.core.dataarray.DataArray
         """
-        dataarray = (
-            self.dataset.planck_fk2
-            / (np.log((self.dataset.planck_fk1 / self.dataset.Rad) + 1))
-            - self.dataset.planck_bc1
-        ) / self.dataset.planck_bc2
+        return self._cached("brightness_temperature", self._brightness_temperature)
+
+    @instrumentation.timed("calibrate")
+    def _brightness_temperature(self):
+        radiance, fk1, fk2, bc1, bc2 = self._get_variables(
+            "Rad", "planck_fk1", "planck_fk2", "planck_bc1", "planck_bc2"
+        )
+        dataarray = (fk2 / (np.log((fk1 / radiance) + 1)) - bc1) / bc2
         dataarray.attrs["long_name"] = "ABI L1b Brightness Temperature"
         dataarray.attrs["units"] = "Kelvin"
-        return dataarray
+        return self._apply_mask(dataarray)
 
     def filter_bad_pixels(self):
         """Use the Data Quality Flag (DQF) to filter out bad pixels.
@@ -271,34 +540,74 @@ class GoesBand:
         from 0 (good) to 3 (no value). We follow NOAA's suggestion of filtering out all
         pixes with a flag of 2 or 3.
 
+        Nothing is copied: the returned band shares `dataset`, and carries a boolean
+        `mask` of the bad pixels, which is applied to its radiance, calibrated and
+        normalized data as they are computed.
+
         Returns
         -------
         GoesBand
-            A `GoesBand` object where the spectral radiance (`Rad`) of any pixel with DQF
-            greater than 1 is set to `np.nan`.
+            A `GoesBand` object where the spectral radiance (`radiance`) of any pixel with
+            DQF greater than 1 is `np.nan`.
         """
-        return GoesBand(dataset=filter_bad_pixels(dataset=self.dataset))
+        return self._cached(
+            "filter_bad_pixels",
+            lambda: GoesBand(
+                dataset=self.dataset,
+                mask=get_bad_pixel_mask(dataset=self.dataset),
+                cache=self.cache,
+            ),
+        )
 
-    def to_netcdf(self, directory):
-        """Persist to netcdf4.
+    def _get_variables(self, *names):
+        """Get the variables `names` of `dataset` in the dtype of `wildfire.precision`."""
+        dtype = precision.get_dtype()
+        return [self.dataset[name].astype(dtype, copy=False) for name in names]
 
-        Filepath is in a form matching the file struture of the Amazon S3 data:
-            {local_directory}/{s3_bucket_name}/{s3_key}
-        For example:
-            {local_directory}/noaa-goes17/ABI-L1b-RadM/2019/300/20/
-        OR_ABI-L1b-RadM1-M6C14_G17_s20193002048275_e20193002048332_c20193002048405.nc
+    def _apply_mask(self, dataarray):
+        """Set the masked pixels of the new `dataarray` to `np.nan` in place."""
+        if self.mask is not None:
+            np.copyto(dataarray.data, np.nan, where=self.mask)
+        return dataarray
+
+    @property
+    def cache_bytes(self):
+        """Bytes of the derived products kept in `cache`, by all the bands sharing it."""
+        return self.cache.nbytes
+
+    @property
+    def cache_budget_bytes(self):
+        """Most bytes of derived products kept in `cache`. See `ProductCache`."""
+        return self.cache.budget_bytes
+
+    @cache_budget_bytes.setter
+    def cache_budget_bytes(self, budget_bytes):
+        self.cache.budget_bytes = budget_bytes
+
+    def release(self):
+        """Drop the derived products kept by the band, e.g. once done with it."""
+        self.cache.release(owner=self._cache_owner)
+
+    def _cached(self, name, compute):
+        """Get the derived product `name`, computing it with `compute()` if need be."""
+        return self.cache.get(
+            owner=self._cache_owner,
+            name=f"{name}_{precision.get_precision()}",
+            compute=compute,
+        )
+
+    def get_filepath(self, directory):
+        """Get the filepath at which `to_netcdf` persists the band.
 
         Parameters
         ----------
         directory : str
-            Path to local directory in which to persist.
 
         Returns
         -------
         str
-            The filepath of the persisted file.
         """
-        local_filepath = os.path.join(
+        return os.path.join(
             directory,
             self.satellite,
             f"ABI-L1b-Rad{self.region[0]}",
@@ -307,14 +616,113 @@ class GoesBand:
             self.scan_time_utc.strftime("%H"),
             self.dataset.dataset_name,
         )
+
+    def to_netcdf(self, directory, complevel=None, chunksizes=None, pack=False):
+        """Persist to netcdf4.
+
+        Filepath is in a form matching the file struture of the Amazon S3 data:
+            {local_directory}/{s3_bucket_name}/{s3_key}
+        For example:
+            {local_directory}/noaa-goes17/ABI-L1b-RadM/2019/300/20/
+        OR_ABI-L1b-RadM1-M6C14_G17_s20193002048275_e20193002048332_c20193002048405.nc
+
+        Parameters
+        ----------
+        directory : str
+            Path to local directory in which to persist.
+        complevel : int, optional
+            zlib compression level, between 1 and 9, of `Rad` and `DQF`. By default
+            `None`, which does not compress.
+        chunksizes : tuple of int, optional
+            HDF5 chunk shape (y, x) of `Rad` and `DQF`. By default `None`, which lets the
+            netCDF library decide.
+        pack : bool, optional
+            Whether to store `Rad` as 16 bit integers with a `scale_factor` and
+            `add_offset` (see `get_encoding`), by default False.
+
+        Returns
+        -------
+        str
+            The filepath of the persisted file.
+        """
+        local_filepath = self.get_filepath(directory=directory)
         os.makedirs(os.path.dirname(local_filepath), exist_ok=True)
-        self.dataset.to_netcdf(
-            path=local_filepath,
-            encoding={"x": {"dtype": "float32"}, "y": {"dtype": "float32"}},
-        )
+        with instrumentation.timer("persist"):
+            dataset = self.masked_dataset
+            dataset.to_netcdf(
+                path=local_filepath,
+                encoding=get_encoding(
+                    dataset=dataset,
+                    complevel=complevel,
+                    chunksizes=chunksizes,
+                    pack=pack,
+                ),
+            )
+        instrumentation.add_bytes("persist", os.path.getsize(local_filepath))
         return local_filepath
 
 
+def get_encoding(dataset, complevel=None, chunksizes=None, pack=False):
+    """Get the encoding with which to persist the dataset of a band with `to_netcdf`.
+
+    Packing reuses NOAA's encoding of `Rad` (unsigned 12 bit counts) when the dataset
+    still carries it. Otherwise `Rad` is packed into the full range of uint16, which
+    keeps a relative precision of about 1e-5 of the range of the band.
+
+    Parameters
+    ----------
+    dataset : xr.core.dataset.Dataset
+    complevel : int, optional
+        zlib compression level, between 1 and 9, of `Rad` and `DQF`. By default `None`,
+        which does not compress.
+    chunksizes : tuple of int, optional
+        HDF5 chunk shape (y, x) of `Rad` and `DQF`, clipped to the shape of the data.
+    pack : bool, optional
+        Whether to store `Rad` as 16 bit integers, by default False.
+
+    Returns
+    -------
+    dict
+    """
+    encoding = {"x": {"dtype": "float32"}, "y": {"dtype": "float32"}}
+    if complevel is None and chunksizes is None and not pack:
+        return encoding
+
+    for name in ("Rad", "DQF"):
+        if name not in dataset:
+            continue
+        variable_encoding = {}
+        if complevel:
+            variable_encoding.update(zlib=True, complevel=complevel, shuffle=True)
+        if chunksizes is not None:
+            variable_encoding["chunksizes"] = tuple(
+                min(chunk, size) for chunk, size in zip(chunksizes, dataset[name].shape)
+            )
+        encoding[name] = variable_encoding
+    if pack:
+        encoding["Rad"].update(_get_packing(dataarray=dataset.Rad))
+    return encoding
+
+
+def _get_packing(dataarray):
+    if all(key in dataarray.encoding for key in PACKING_KEYS[:3]):
+        return {
+            key: dataarray.encoding[key]
+            for key in PACKING_KEYS
+            if key in dataarray.encoding
+        }
+
+    minimum, maximum = float(dataarray.min()), float(dataarray.max())
+    if not np.isfinite(minimum):  # all pixels are missing
+        minimum, maximum = 0.0, 0.0
+    return {
+        "dtype": "uint16",
+        "scale_factor": np.float32((maximum - minimum) / 65534 or 1.0),
+        "add_offset": np.float32(minimum),
+        "_FillValue": np.uint16(65535),
+    }
+
+
 def filter_bad_pixels(dataset):
     """Use the Data Quality Flag (DQF) to filter out bad pixels.
 
@@ -322,13 +730,35 @@ def filter_bad_pixels(dataset):
     from 0 (good) to 3 (no value). We follow NOAA's suggestion of filtering out all
     pixes with a flag of 2 or 3.
 
+    Only `Rad` is copied. See `GoesBand.filter_bad_pixels` to filter without copying.
+
     Returns
     -------
     xr.core.dataset.Dataset
         An xarray dataset where the spectral radiance (`Rad`) of any pixel with DQF
         greater than 1 is set to `np.nan`.
     """
-    return dataset.where(dataset.DQF.isin([0, 1]))
+    return dataset.assign(
+        Rad=dataset.Rad.copy(
+            data=np.where(get_bad_pixel_mask(dataset=dataset), np.nan, dataset.Rad.data)
+        )
+    )
+
+
+def get_bad_pixel_mask(dataset):
+    """Get the pixels of `dataset` with a DQF of 2 or 3, or without a DQF.
+
+    Parameters
+    ----------
+    dataset : xr.core.dataset.Dataset
+
+    Returns
+    -------
+    np.ndarray of bool
+        Of the shape of `dataset.DQF`.
+    """
+    with np.errstate(invalid="ignore"):
+        return ~(dataset.DQF.data <= 1)
 
 
 def normalize(data):
@@ -0,0 +1,333 @@
+"""Compact stores of GOES level 1 data, one per day, satellite and region.
+
+NOAA's netCDF files hold a single band of a single scan, along with dozens of scalar
+variables we never read, so reading a scan means opening 16 files. On a shared
+filesystem like Lustre those opens, not the reads, dominate. A compact store packs every
+scan of a day into a single netCDF4 (HDF5) file, with one group per band (C01 - C16)
+holding:
+
+    Rad (time, y, x) uint16
+        The raw counts, exactly as stored by NOAA, chunked one scan at a time.
+    DQF (time, y, x) uint8
+    x (time, x), y (time, y) float32
+        Scan angles. Per scan, since the mesoscale regions move.
+    scale_factor, add_offset (time) float32
+        Calibration of the counts to spectral radiance.
+    band_wavelength, kappa0, planck_fk1, planck_fk2, planck_bc1, planck_bc2 (time)
+    scan_start (time) int64, t (time) float64, dataset_name (time) str
+        Scan start in whole seconds since J2000, and `t` as stored by NOAA.
+
+Stores live in the day directory of the archive, next to the hour directories holding
+the original files, e.g.
+    {local_directory}/ABI-L1b-RadM/2019/335/compact_M1_G17.nc
+
+A store is appended to in a temporary copy, which then replaces it, so that readers
+never see a partially written store. `utilities.list_local_files` lists the bands in the
+stores, so the original files of compacted scans can be removed.
+"""
+import datetime
+import logging
+import os
+import shutil
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from wildfire import instrumentation, multiprocessing
+from . import band, utilities
+
+COMPACT_CHUNK_SIZE = 500  # pixels along y and x
+COMPACT_COMPLEVEL = 1
+CALIBRATION_VARIABLES = (
+    "band_wavelength",
+    "kappa0",
+    "planck_fk1",
+    "planck_fk2",
+    "planck_bc1",
+    "planck_bc2",
+)
+TIME_UNITS = "seconds since 2000-01-01T12:00:00"
+EPOCH = datetime.datetime(2000, 1, 1, 12)
+
+_logger = logging.getLogger(__name__)
+
+
+def get_store_filepath(day_directory, region, satellite_short):
+    """Get the filepath of the compact store of a day.
+
+    Parameters
+    ----------
+    day_directory : str
+        e.g. {local_directory}/ABI-L1b-RadM/2019/335
+    region : str
+        Must be in set (M1, M2, C, F).
+    satellite_short : str
+        Must be in set (G16, G17).
+
+    Returns
+    -------
+    str
+    """
+    return os.path.join(
+        day_directory,
+        utilities.COMPACT_FILENAME_FORMAT.format(
+            region=region, satellite_short=satellite_short
+        ),
+    )
+
+
+def get_store_filepath_of_file(local_filepath):
+    """Get the filepath of the compact store that would hold `local_filepath`.
+
+    Parameters
+    ----------
+    local_filepath : str
+        Of the form {day_directory}/{hour}/OR_ABI-L1b-Rad...nc
+
+    Returns
+    -------
+    str
+    """
+    region, _, satellite_short, _ = utilities.parse_filename(filename=local_filepath)
+    return get_store_filepath(
+        day_directory=os.path.dirname(os.path.dirname(os.path.abspath(local_filepath))),
+        region=region,
+        satellite_short=satellite_short,
+    )
+
+
+def compact_files(local_directory, satellite, region, start_time, end_time):
+    """Pack the local files matching parameters into compact stores, one per day.
+
+    Days are compacted in parallel across local hardware. Scans already in a store are
+    skipped, so compacting a time range again only appends new scans. Scans missing any
+    of their 16 bands are not compacted.
+
+    Parameters
+    ----------
+    local_directory : str
+    satellite : str
+        Must be in set (noaa-goes16, noaa-goes17).
+    region : str
+        Must be in set (M1, M2, C, F).
+    start_time : datetime.datetime
+    end_time : datetime.datetime
+
+    Returns
+    -------
+    list of str
+        Filepaths of the compact stores written to.
+    """
+    local_filepaths = utilities.list_local_files(
+        local_directory=local_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start_time,
+        end_time=end_time,
+        use_compact=False,
+    )
+    by_store = {}
+    for scan_filepaths in utilities.group_filepaths_into_scans(filepaths=local_filepaths):
+        if len(scan_filepaths) != 16:
+            _logger.warning(
+                "Skipping scan with %d bands: %s", len(scan_filepaths), scan_filepaths[0]
+            )
+            continue
+        store_filepath = get_store_filepath_of_file(local_filepath=scan_filepaths[0])
+        by_store.setdefault(store_filepath, []).extend(scan_filepaths)
+
+    _logger.info(
+        "Compacting %d files into %d stores...",
+        sum(len(filepaths) for filepaths in by_store.values()),
+        len(by_store),
+    )
+    store_filepaths = list(by_store)
+    multiprocessing.map_function(  # HDF5 is not thread safe
+        function=compact_day,
+        function_args=[[by_store[filepath] for filepath in store_filepaths]],
+        backend="processes",
+    )
+    return store_filepaths
+
+
+def compact_day(local_filepaths):
+    """Append the bands in `local_filepaths` to the compact store of their day.
+
+    The bands are appended to a copy of the store, which then replaces it, so that the
+    store can be read while it is compacted. Only one process should compact a day at a
+    time. The store is not rewritten if it already holds every band.
+
+    Parameters
+    ----------
+    local_filepaths : list of str
+        Bands of a single day, satellite and region.
+
+    Returns
+    -------
+    str
+        Filepath of the compact store.
+    """
+    store_filepath = get_store_filepath_of_file(local_filepath=local_filepaths[0])
+    compacted = set(utilities.read_compact_filenames(store_filepath=store_filepath))
+    local_filepaths = [
+        filepath
+        for filepath in local_filepaths
+        if os.path.basename(filepath) not in compacted
+    ]
+    if not local_filepaths:
+        return store_filepath
+
+    # not made with tempfile.mkstemp, whose files only their owner can read
+    temporary_filepath = f"{store_filepath}.{os.getpid()}.tmp"
+    try:
+        if compacted:
+            shutil.copyfile(store_filepath, temporary_filepath)
+        with netCDF4.Dataset(temporary_filepath, mode="a" if compacted else "w") as store:
+            store.set_auto_maskandscale(False)
+            for local_filepath in sorted(local_filepaths):
+                _append_band(store=store, local_filepath=local_filepath)
+        os.replace(temporary_filepath, store_filepath)
+    finally:
+        if os.path.exists(temporary_filepath):
+            os.remove(temporary_filepath)
+    return store_filepath
+
+
+def _append_band(store, local_filepath):
+    _, channel, _, scan_time = utilities.parse_filename(filename=local_filepath)
+    scan_start = _to_seconds(scan_time)
+    with netCDF4.Dataset(local_filepath) as source:
+        group_name = f"C{channel:02d}"
+        if group_name not in store.groups:
+            _create_group(store=store, name=group_name, source=source)
+        group = store.groups[group_name]
+        if scan_start in group["scan_start"][:]:
+            return
+
+        rad = source["Rad"]
+        rad.set_auto_maskandscale(False)
+        dqf = source["DQF"]
+        dqf.set_auto_maskandscale(False)
+        idx = group.dimensions["time"].size
+        group["Rad"][idx] = rad[:].view(np.uint16)
+        group["DQF"][idx] = dqf[:].view(np.uint8)
+        group["x"][idx] = np.ma.filled(source["x"][:], np.nan)
+        group["y"][idx] = np.ma.filled(source["y"][:], np.nan)
+        group["scale_factor"][idx] = rad.scale_factor
+        group["add_offset"][idx] = rad.add_offset
+        for name in CALIBRATION_VARIABLES:
+            group[name][idx] = np.ma.filled(source[name][:], np.nan).ravel()[0]
+        group["t"][idx] = source["t"][:]
+        group["dataset_name"][idx] = source.dataset_name
+        group["scan_start"][idx] = scan_start
+
+
+def _create_group(store, name, source):
+    num_y, num_x = source["Rad"].shape
+    chunksizes = (1, min(num_y, COMPACT_CHUNK_SIZE), min(num_x, COMPACT_CHUNK_SIZE))
+    group = store.createGroup(name)
+    group.createDimension("time", None)
+    group.createDimension("y", num_y)
+    group.createDimension("x", num_x)
+
+    for variable_name, dtype in (("Rad", "u2"), ("DQF", "u1")):
+        variable = group.createVariable(
+            variable_name,
+            dtype,
+            ("time", "y", "x"),
+            zlib=True,
+            complevel=COMPACT_COMPLEVEL,
+            shuffle=True,
+            chunksizes=chunksizes,
+        )
+        fill_value = source[variable_name]._FillValue  # pylint: disable=protected-access
+        variable.setncattr("missing_count", int(np.array(fill_value).view(dtype)))
+        variable.setncattr("units", getattr(source[variable_name], "units", "1"))
+    group.createVariable("x", "f4", ("time", "x"))
+    group.createVariable("y", "f4", ("time", "y"))
+    for variable_name in ("scale_factor", "add_offset") + CALIBRATION_VARIABLES:
+        group.createVariable(variable_name, "f4", ("time",))
+    group.createVariable("t", "f8", ("time",)).setncattr("units", source["t"].units)
+    group.createVariable("scan_start", "i8", ("time",)).setncattr("units", TIME_UNITS)
+    group.createVariable("dataset_name", str, ("time",))
+
+
+def read_bands(store_filepath, scan_time_utc, transform_func=None):
+    """Read the 16 bands of a scan from a compact store with a single file open.
+
+    Parameters
+    ----------
+    store_filepath : str
+    scan_time_utc : datetime.datetime
+        Scan start time, to the minute.
+    transform_func : function, optional
+        f(xr.core.dataset.Dataset) -> (xr.core.dataset.Dataset)
+
+    Returns
+    -------
+    list of wildfire.data.goes_level_1.GoesBand | None
+        `None` if the store does not hold all 16 bands of the scan.
+    """
+    if not os.path.exists(store_filepath):
+        return None
+
+    seconds = _to_seconds(scan_time_utc.replace(second=0, microsecond=0))
+    bands = []
+    with netCDF4.Dataset(store_filepath) as store:
+        store.set_auto_maskandscale(False)
+        for channel in range(1, 17):
+            group = store.groups.get(f"C{channel:02d}")
+            if group is None:
+                return None
+            scan_starts = group["scan_start"][:]
+            (indices,) = np.nonzero(
+                (scan_starts >= seconds) & (scan_starts < seconds + 60)
+            )
+            if indices.size == 0:
+                return None
+            with instrumentation.timer("read_netcdf"):
+                dataset = _read_dataset(group=group, idx=int(indices[0]))
+            if transform_func is not None:
+                dataset = transform_func(dataset)
+            bands.append(band.GoesBand(dataset=dataset))
+    return bands
+
+
+def _read_dataset(group, idx):
+    """Read a single band as the dataset `xr.load_dataset` would for the original."""
+    rad = group["Rad"]
+    counts = rad[idx]
+    radiance = (
+        counts.astype(np.float32) * group["scale_factor"][idx] + group["add_offset"][idx]
+    )
+    radiance[counts == rad.missing_count] = np.nan
+    dqf_variable = group["DQF"]
+    dqf = dqf_variable[idx].astype(np.float32)
+    dqf[dqf == dqf_variable.missing_count] = np.nan
+
+    scan_t = xr.coding.times.decode_cf_datetime(
+        np.array(group["t"][idx]), units=group["t"].units
+    )
+    return xr.Dataset(
+        data_vars={
+            "Rad": (("y", "x"), radiance, {"units": rad.units}),
+            "DQF": (("y", "x"), dqf),
+            **{
+                name: ((), group[name][idx])
+                for name in CALIBRATION_VARIABLES
+                if name != "band_wavelength"
+            },
+        },
+        coords={
+            "y": group["y"][idx],
+            "x": group["x"][idx],
+            "t": scan_t,
+            "band_wavelength": (("band",), [group["band_wavelength"][idx]]),
+        },
+        attrs={"dataset_name": group["dataset_name"][idx]},
+    )
+
+
+def _to_seconds(datetime_utc):
+    return int((datetime_utc - EPOCH).total_seconds())
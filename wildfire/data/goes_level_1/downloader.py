@@ -14,10 +14,8 @@ from collections import namedtuple
 import logging
 import os
 
-import s3fs
-
-from wildfire import multiprocessing
-from . import utilities
+from wildfire import instrumentation, multiprocessing
+from . import archive, listing_cache, utilities
 
 LOCAL_FILEPATH_FORMAT = "{local_directory}/{s3_key}"
 
@@ -27,9 +25,22 @@ DownloadFileArgs = namedtuple(
 _logger = logging.getLogger(__name__)
 
 
-def list_s3_files(satellite, region, start_time, end_time=None, channel=None):
+@instrumentation.timed("list")
+def list_s3_files(  # pylint: disable=too-many-locals
+    satellite,
+    region,
+    start_time,
+    end_time=None,
+    channel=None,
+    use_cache=True,
+    detail=False,
+):
     """List the NOAA GOES-R level 1 series files in Amazon S3 matching parameters.
 
+    Listings are requested per hour prefix and cached in a `listing_cache.ListingCache`.
+    Hours that have finished being published are never listed again, so listing
+    historical data that has already been listed issues no requests to Amazon S3.
+
     Parameters
     ----------
     satellite : str
@@ -43,35 +54,99 @@ def list_s3_files(satellite, region, start_time, end_time=None, channel=None):
     end_time : datetime.datetime, optional
         By default `None`, which will list all files whose scan start time matches
         `start_time`.
+    use_cache : bool, optional
+        Whether to use the persistent listing cache, by default True.
+    detail : bool, optional
+        Whether to return the size and ETag of each file, by default False.
 
     Returns
     -------
-    list of str
+    list of str | list of dict
+        If `detail`, each file is of the form {"name": str, "size": int, "etag": str}.
     """
-    s3 = s3fs.S3FileSystem(anon=True, use_ssl=False)
-    glob_patterns = utilities.decide_fastest_glob_patterns(
-        directory=satellite,
-        satellite=satellite,
-        region=region,
-        start_time=start_time,
-        end_time=end_time,
-        channel=channel,
-        s3=True,
+    prefixes = utilities.list_hour_prefixes(
+        directory=satellite, region=region, start_time=start_time, end_time=end_time
     )
-    _logger.info("Listing files in S3 using glob patterns: %s", glob_patterns)
-    filepaths = multiprocessing.map_function(  # only parallel across local hardware
-        function=s3.glob, function_args=glob_patterns
+    cache = listing_cache.ListingCache()
+    listings = {
+        prefix: cache.get(prefix=prefix) if use_cache else None for prefix in prefixes
+    }
+    to_list = [prefix for prefix, files in listings.items() if files is None]
+    _logger.info(
+        "Listing %d of %d hour prefixes in S3 (the rest are cached)...",
+        len(to_list),
+        len(prefixes),
     )
-    filepaths = multiprocessing.flatten_array(filepaths)
+    if len(to_list) == 1:
+        listings[to_list[0]] = list_prefix(prefix=to_list[0])
+    elif to_list:
+        listings.update(
+            zip(
+                to_list,
+                multiprocessing.map_function(
+                    function=list_prefix, function_args=to_list, backend="threads"
+                ),
+            )
+        )
+
+    satellite_short = utilities.SATELLITE_SHORT_HAND[satellite]
+    files = {}
+    for prefix in prefixes:
+        for file_info in listings[prefix]:
+            file_region, file_channel, file_satellite, _ = utilities.parse_filename(
+                filename=file_info["name"]
+            )
+            if (
+                file_region == region
+                and file_satellite == satellite_short
+                and (channel is None or file_channel == channel)
+            ):
+                files[file_info["name"]] = file_info
+
     if end_time is None:
-        return filepaths
-    return utilities.filter_filepaths(
-        filepaths=filepaths, start_time=start_time, end_time=end_time,
+        scan_start = f"_s{start_time:%Y%j%H%M}"
+        filepaths = [filepath for filepath in files if scan_start in filepath]
+    else:
+        filepaths = utilities.filter_filepaths(
+            filepaths=list(files), start_time=start_time, end_time=end_time,
+        )
+    return [files[filepath] for filepath in filepaths] if detail else filepaths
+
+
+def list_prefix(prefix):
+    """List an hour prefix in Amazon S3 and update the persistent listing cache.
+
+    Parameters
+    ----------
+    prefix : str
+        e.g. noaa-goes17/ABI-L1b-RadM/2019/300/20
+
+    Returns
+    -------
+    list of dict
+        Each of the form {"name": str, "size": int, "etag": str}.
+    """
+    return listing_cache.ListingCache().list_prefix(
+        prefix=prefix, filesystem=get_s3_filesystem(), refresh=True
     )
 
 
+def get_s3_filesystem():
+    """Get an anonymous filesystem for the public NOAA buckets on Amazon S3.
+
+    Returns
+    -------
+    s3fs.S3FileSystem
+    """
+    import s3fs  # pylint: disable=import-outside-toplevel
+
+    return s3fs.S3FileSystem(anon=True, use_ssl=False)
+
+
 def s3_filepath_to_local(s3_filepath, local_directory):
     """Translate s3fs filepath to local filesystem filepath."""
+    import s3fs  # pylint: disable=import-outside-toplevel
+
     _, key = s3fs.core.split_path(s3_filepath)
     return LOCAL_FILEPATH_FORMAT.format(local_directory=local_directory, s3_key=key)
 
@@ -86,20 +161,28 @@ def download_file(s3_filepath, local_directory, s3_filesystem=None):
     str
         Local filepath to the downloaded file.
     """
-    s3_filesystem = (
-        s3_filesystem if s3_filesystem else s3fs.S3FileSystem(anon=True, use_ssl=False)
-    )
+    s3_filesystem = s3_filesystem if s3_filesystem else get_s3_filesystem()
     local_path = s3_filepath_to_local(
         s3_filepath=s3_filepath, local_directory=local_directory
     )
     os.makedirs(name=os.path.dirname(local_path), exist_ok=True)
-    s3_filesystem.get(rpath=s3_filepath, lpath=local_path)
+    with instrumentation.timer("download"):
+        s3_filesystem.get(rpath=s3_filepath, lpath=local_path)
+    instrumentation.add_bytes("download", os.path.getsize(local_path))
     return local_path
 
 
-def download_files(local_directory, satellite, region, start_time, end_time=None):
+def download_files(  # pylint: disable=too-many-locals
+    local_directory, satellite, region, start_time, end_time=None, use_checksum=False
+):
     """Download files matching parameters to disk in parallel.
 
+    Files already on disk are verified against the local archive's manifests (see
+    `archive`) and the sizes listed in Amazon S3, and only missing, partial or corrupt
+    files are downloaded. Bands in a compact store (see `compact`) are never downloaded
+    again. Every downloaded file is recorded in the manifests, with the size and ETag
+    listed in Amazon S3.
+
     Parameters
     ----------
     local_directory : str
@@ -111,14 +194,22 @@ def download_files(local_directory, satellite, region, start_time, end_time=None
     end_time : datetime.datetime, optional
         By default `None`, which will list all files whose scan start time matches
         `start_time`.
+    use_checksum : bool, optional
+        Whether to verify the checksums of files already on disk, and record those of
+        downloaded files and of files without one in their manifest. By default False,
+        which only compares file sizes, and never reads the files.
 
     Returns
     -------
     list of str
         Local filepaths to downloaded files.
     """
-    s3_filepaths = list_s3_files(
-        satellite=satellite, region=region, start_time=start_time, end_time=end_time
+    s3_files = list_s3_files(
+        satellite=satellite,
+        region=region,
+        start_time=start_time,
+        end_time=end_time,
+        detail=True,
     )
     already_local_filepaths = utilities.list_local_files(
         local_directory=local_directory,
@@ -126,13 +217,38 @@ def download_files(local_directory, satellite, region, start_time, end_time=None
         region=region,
         start_time=start_time,
         end_time=end_time,
+        use_compact=False,
+    )
+    compacted_filepaths = utilities.list_compact_files(
+        local_directory=local_directory,
+        satellite=satellite,
+        region=region,
+        start_time=start_time,
+        end_time=end_time,
     )
 
-    filepath_mapping = {  # local -> s3 filepath
-        s3_filepath_to_local(s3_filepath, local_directory=local_directory): s3_filepath
-        for s3_filepath in s3_filepaths
+    file_mapping = {  # local filepath -> s3 file
+        s3_filepath_to_local(s3_file["name"], local_directory=local_directory): s3_file
+        for s3_file in s3_files
     }
-    to_download = set(filepath_mapping.keys()) - set(already_local_filepaths)
+    statuses = archive.verify_files(
+        local_filepaths=sorted(set(already_local_filepaths) & set(file_mapping)),
+        expected_sizes={
+            filepath: s3_file["size"] for filepath, s3_file in file_mapping.items()
+        },
+        use_checksum=use_checksum,
+    )
+    invalid_filepaths = [
+        filepath for filepath, status in statuses.items() if status != "ok"
+    ]
+    if invalid_filepaths:
+        _logger.warning(
+            "Re-downloading %d partial or corrupt files.", len(invalid_filepaths)
+        )
+    to_download = (
+        sorted(set(file_mapping) - set(statuses) - set(compacted_filepaths))
+        + invalid_filepaths
+    )
 
     _logger.info(
         "Downloading %d files using %d workers...", len(to_download), os.cpu_count(),
@@ -140,7 +256,7 @@ def download_files(local_directory, satellite, region, start_time, end_time=None
     downloaded_filepaths = multiprocessing.map_function(
         function=download_file,
         function_args=[
-            [filepath_mapping[filepath] for filepath in to_download],
+            [file_mapping[filepath]["name"] for filepath in to_download],
             [local_directory] * len(to_download),
         ],
     )
@@ -148,4 +264,20 @@ def download_files(local_directory, satellite, region, start_time, end_time=None
         "Downloaded %.5f GB of satellite data.",
         sum(os.path.getsize(f) for f in downloaded_filepaths) / 1e9,
     )
-    return list(filepath_mapping.keys())
+
+    to_record = list(downloaded_filepaths)
+    if use_checksum:
+        manifests = {}
+        for filepath in statuses:
+            directory = os.path.dirname(filepath)
+            if directory not in manifests:
+                manifests[directory] = archive.read_manifest(directory=directory)
+            if not manifests[directory].get(os.path.basename(filepath), {}).get("md5"):
+                to_record.append(filepath)
+    archive.record_files(
+        local_filepaths=sorted(set(to_record)),
+        etags={filepath: file_mapping[filepath]["etag"] for filepath in to_record},
+        sizes={filepath: file_mapping[filepath]["size"] for filepath in to_record},
+        use_checksum=use_checksum,
+    )
+    return list(file_mapping.keys())
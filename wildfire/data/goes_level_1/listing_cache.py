@@ -0,0 +1,148 @@
+"""Persistent cache of Amazon S3 listings of GOES level 1 data.
+
+NOAA never modifies an hour prefix (e.g. noaa-goes17/ABI-L1b-RadM/2019/300/20) once
+every scan of that hour has been published. A listing of a prefix taken after that point
+is marked as final and is never refreshed, so repeatedly listing historical data issues
+no LIST requests. Listings of hours still being published are refreshed on every request.
+
+Each prefix is cached in its own small json file so that concurrent workers never
+contend over a single file.
+"""
+import datetime
+import json
+import logging
+import os
+import tempfile
+
+LISTING_CACHE_DIRECTORY = os.environ.get(
+    "WILDFIRE_CACHE_DIRECTORY",
+    os.path.join(os.path.expanduser("~"), ".cache", "wildfire", "s3_listings"),
+)
+# bands of the last scans of an hour may be published a few minutes after the hour
+PUBLICATION_DELAY = datetime.timedelta(minutes=15)
+
+_logger = logging.getLogger(__name__)
+
+
+class ListingCache:
+    """Cache of S3 listings keyed by hour prefix.
+
+    Attributes
+    ----------
+    directory : str
+        Directory in which the listings are persisted.
+    """
+
+    def __init__(self, directory=None):
+        """Initialize.
+
+        Parameters
+        ----------
+        directory : str, optional
+            By default `None`, which uses `LISTING_CACHE_DIRECTORY`.
+        """
+        self.directory = directory if directory is not None else LISTING_CACHE_DIRECTORY
+
+    def __repr__(self):
+        """Represent a ListingCache as a string."""
+        return f"ListingCache(directory={self.directory})"
+
+    def get(self, prefix):
+        """Get the cached listing of `prefix` if it is final.
+
+        Parameters
+        ----------
+        prefix : str
+            e.g. noaa-goes17/ABI-L1b-RadM/2019/300/20
+
+        Returns
+        -------
+        list of dict | None
+            Each file is of the form {"name": str, "size": int, "etag": str}. `None` if
+            `prefix` has not been listed since it became final.
+        """
+        try:
+            with open(self._filepath(prefix=prefix)) as buffer:
+                listing = json.load(buffer)
+        except (OSError, ValueError):
+            return None
+        return listing["files"] if listing["final"] else None
+
+    def put(self, prefix, files, final):
+        """Persist the listing of `prefix`.
+
+        Parameters
+        ----------
+        prefix : str
+        files : list of dict
+            Each of the form {"name": str, "size": int, "etag": str}.
+        final : bool
+            Whether the listing can no longer change.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_descriptor, temporary_filepath = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(file_descriptor, "w") as buffer:
+            json.dump({"prefix": prefix, "final": final, "files": files}, buffer)
+        os.replace(temporary_filepath, self._filepath(prefix=prefix))
+
+    def list_prefix(self, prefix, filesystem, now=None, refresh=False):
+        """List `prefix`, only requesting a listing from `filesystem` if not final.
+
+        Parameters
+        ----------
+        prefix : str
+            An hour prefix of the form {bucket}/{product}/{year}/{day_of_year}/{hour}.
+        filesystem : fsspec.AbstractFileSystem
+        now : datetime.datetime, optional
+            Current UTC time, by default `None` which uses `datetime.datetime.utcnow()`.
+        refresh : bool, optional
+            Whether to list `prefix` even if its cached listing is final, by default
+            False.
+
+        Returns
+        -------
+        list of dict
+            Each of the form {"name": str, "size": int, "etag": str}.
+        """
+        files = self.get(prefix=prefix) if not refresh else None
+        if files is not None:
+            return files
+
+        now = now if now is not None else datetime.datetime.utcnow()
+        filesystem.invalidate_cache(prefix)
+        try:
+            listing = filesystem.ls(prefix, detail=True)
+        except FileNotFoundError:
+            listing = []
+        files = [
+            {
+                "name": file_info["name"],
+                "size": file_info["size"],
+                "etag": file_info.get("ETag", "").strip('"'),
+            }
+            for file_info in listing
+            if file_info.get("type", "file") == "file"
+        ]
+        self.put(prefix=prefix, files=files, final=is_final(prefix=prefix, now=now))
+        return files
+
+    def _filepath(self, prefix):
+        return os.path.join(self.directory, prefix.strip("/").replace("/", "_") + ".json")
+
+
+def is_final(prefix, now):
+    """Whether every scan of the hour prefix `prefix` has been published by `now`.
+
+    Parameters
+    ----------
+    prefix : str
+        Ends in {year}/{day_of_year}/{hour}.
+    now : datetime.datetime
+
+    Returns
+    -------
+    bool
+    """
+    year, day_of_year, hour = prefix.strip("/").split("/")[-3:]
+    hour_start = datetime.datetime.strptime(f"{year}{day_of_year}{hour}", "%Y%j%H")
+    return hour_start + datetime.timedelta(hours=1) + PUBLICATION_DELAY < now
@@ -1,17 +1,36 @@
 """Wrapper around the 16 bands of a GOES level 1 satellite scan."""
+from concurrent.futures import ProcessPoolExecutor
+import functools
 import math
+import os
+import re
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from . import band, downloader, utilities
+from wildfire import instrumentation
+from . import band, compact, downloader, utilities
 
+# bands decoded concurrently by top-level callers that opt in to a pool of processes
+READ_MAX_WORKERS = min(16, os.cpu_count() or 1)
 
-def get_goes_scan(satellite, region, scan_time_utc, local_directory, s3=True):
+
+def get_goes_scan(
+    satellite,
+    region,
+    scan_time_utc,
+    local_directory,
+    s3=True,
+    max_workers=1,
+    remote=False,
+    x_slice=None,
+    y_slice=None,
+):
     """Read the GoesScan defined by parameters from the local filesystem or s3.
 
-    Gives preference to scans already on the local filesystem with downloading from
-    Amazon S3 used as a backup.
+    Gives preference to scans already on the local filesystem, in a compact store (see
+    `compact`) or as the original files, with downloading from Amazon S3 used as a
+    backup. If `remote`, scans are instead read directly from Amazon S3 without being
+    written to `local_directory` (see `band.read_netcdf_remote`).
 
     Parameters
     ----------
@@ -23,20 +42,74 @@ def get_goes_scan(satellite, region, scan_time_utc, local_directory, s3=True):
     local_directory : str
     s3 : bool, optional
         Whether to download scan data from Amazon S3, if not already local.
+    max_workers : int, optional
+        Number of bands to decode concurrently. See `read_netcdfs`.
+    remote : bool, optional
+        Whether to read from Amazon S3 without downloading, by default False.
+    x_slice : slice, optional
+        Bounds on the x coordinate (scan angle in radians, increasing) to read. By
+        default `None`, which reads the entire scan.
+    y_slice : slice, optional
+        Bounds on the y coordinate (scan angle in radians, decreasing) to read. By
+        default `None`, which reads the entire scan. Bounds should fall on the 2km grid
+        for the subset to be rescaled with `GoesScan.rescale_to_2km`.
 
     Returns
     -------
     GoesScan
     """
+    transform_func = None
+    if x_slice is not None or y_slice is not None:
+        transform_func = functools.partial(band.subset, x_slice=x_slice, y_slice=y_slice)
+
+    bands = compact.read_bands(
+        store_filepath=compact.get_store_filepath(
+            day_directory=os.path.join(
+                local_directory,
+                f"ABI-L1b-Rad{region[0]}",
+                f"{scan_time_utc:%Y}",
+                f"{scan_time_utc:%j}",
+            ),
+            region=region,
+            satellite_short=utilities.SATELLITE_SHORT_HAND[satellite],
+        ),
+        scan_time_utc=scan_time_utc,
+        transform_func=transform_func,
+    )
+    if bands is not None:
+        return GoesScan(bands=bands)
+
     local_filepaths = utilities.list_local_files(
         local_directory=local_directory,
         satellite=satellite,
         region=region,
         start_time=scan_time_utc,
     )
-
     if len(local_filepaths) == 16:
-        return read_netcdfs(local_filepaths=local_filepaths)
+        return read_netcdfs(
+            local_filepaths=local_filepaths,
+            transform_func=transform_func,
+            max_workers=max_workers,
+        )
+
+    if s3 and remote:
+        s3_filepaths = downloader.list_s3_files(
+            satellite=satellite, region=region, start_time=scan_time_utc
+        )
+        if len(s3_filepaths) == 16:
+            return GoesScan(
+                bands=_map_bands(
+                    function=functools.partial(
+                        band.read_netcdf_remote, x_slice=x_slice, y_slice=y_slice
+                    ),
+                    iterable=s3_filepaths,
+                    max_workers=max_workers,
+                )
+            )
+        raise ValueError(
+            f"Could not find well-formed scan. local: {len(local_filepaths)} files; "
+            f"remote: {len(s3_filepaths)} files"
+        )
 
     if s3:
         downloaded_filepaths = downloader.download_files(
@@ -46,7 +119,11 @@ def get_goes_scan(satellite, region, scan_time_utc, local_directory, s3=True):
             start_time=scan_time_utc,
         )
         if len(downloaded_filepaths) == 16:
-            return read_netcdfs(local_filepaths=downloaded_filepaths)
+            return read_netcdfs(
+                local_filepaths=downloaded_filepaths,
+                transform_func=transform_func,
+                max_workers=max_workers,
+            )
 
         raise ValueError(
             f"Could not find well-formed scan. local: {len(local_filepaths)} files; "
@@ -55,16 +132,68 @@ def get_goes_scan(satellite, region, scan_time_utc, local_directory, s3=True):
     raise ValueError(f"Could not find scan. local: {len(local_filepaths)} files")
 
 
-def read_netcdfs(local_filepaths, transform_func=None):
+def read_netcdfs(local_filepaths, transform_func=None, max_workers=1, use_compact=True):
     """Read scan defined by `filepaths` from the local filesystem as GoesScan.
 
     If `transform_func` is provided, then transform datasets defined by `filepaths` before
     returning.
 
+    If the scan has been packed into a compact store (see `compact`), it is read from the
+    store with a single file open instead, and `local_filepaths` need not exist.
+
+    With `max_workers` > 1, bands are decoded concurrently in a pool of processes. Most
+    of the time spent reading a scan is HDF5's zlib decompression, and the HDF5 library
+    is not safe to use from multiple threads. Files are submitted largest first (band 2
+    at 500m is 16 times the size of a 2km band) so that the slowest band does not start
+    last.
+
     Parameters
     ----------
     local_filepaths : list of str
     transform_func : function
+        f(xr.core.dataset.Dataset) -> (xr.core.dataset.Dataset). Must be picklable.
+    max_workers : int, optional
+        Number of bands to decode concurrently, by default 1, which reads serially. Only
+        top-level processes should use more, e.g. `READ_MAX_WORKERS`: the daemonic
+        workers of `multiprocessing.map_function` cannot start processes, and already
+        occupy every CPU.
+    use_compact : bool, optional
+        Whether to read from the compact store of the scan, if there is one. By default
+        True.
+
+    Returns
+    -------
+    GoesScan
+    """
+    if use_compact and local_filepaths:
+        _, _, _, scan_time_utc = utilities.parse_filename(filename=local_filepaths[0])
+        bands = compact.read_bands(
+            store_filepath=compact.get_store_filepath_of_file(
+                local_filepath=local_filepaths[0]
+            ),
+            scan_time_utc=scan_time_utc,
+            transform_func=transform_func,
+        )
+        if bands is not None:
+            return GoesScan(bands=bands)
+
+    local_filepaths = sorted(local_filepaths, key=_file_size, reverse=True)
+    return GoesScan(
+        bands=_map_bands(
+            function=functools.partial(band.read_netcdf, transform_func=transform_func),
+            iterable=local_filepaths,
+            max_workers=max_workers,
+        )
+    )
+
+
+def read_netcdf_groups(local_filepath, transform_func=None):
+    """Read a scan persisted with `GoesScan.to_netcdf(..., single_file=True)`.
+
+    Parameters
+    ----------
+    local_filepath : str
+    transform_func : function, optional
         f(xr.core.dataset.Dataset) -> (xr.core.dataset.Dataset)
 
     Returns
@@ -73,12 +202,36 @@ def read_netcdfs(local_filepaths, transform_func=None):
     """
     return GoesScan(
         bands=[
-            band.read_netcdf(local_filepath=filepath, transform_func=transform_func)
-            for filepath in local_filepaths
+            band.read_netcdf(
+                local_filepath=local_filepath,
+                transform_func=transform_func,
+                group=f"band_{band_id}",
+            )
+            for band_id in range(1, 17)
         ]
     )
 
 
+def _map_bands(function, iterable, max_workers=1):
+    """Apply `function` to each element of `iterable` concurrently, preserving order."""
+    iterable = list(iterable)
+    max_workers = min(len(iterable), max_workers or 1)
+    if max_workers <= 1:
+        return [function(element) for element in iterable]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return instrumentation.unpack(
+            executor.map(instrumentation.InstrumentedFunction(function), iterable)
+        )
+
+
+def _file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+
 class GoesScan:
     """Wrapper around the 16 bands of a GOES satellite scan.
 
@@ -96,14 +249,19 @@ class GoesScan:
     region : str
         In the set (C, F, M1, M2). The region over which the scan was made. The same for
         all bands.
+    cache : wildfire.data.goes_level_1.band.ProductCache
+        Where the derived products of all the bands are kept, within a single budget.
     """
 
-    def __init__(self, bands):
+    def __init__(self, bands, cache=None):
         """Initialize.
 
         Parameters
         ----------
         bands : list of wildfire.data.goes_level_1.GoesBand
+        cache : wildfire.data.goes_level_1.band.ProductCache, optional
+            By default `None`, which gives the scan a cache of its own. Replaces the
+            caches of `bands`.
 
         Raises
         ------
@@ -112,6 +270,9 @@ class GoesScan:
             `bands` is not of length 16, with one element for each band scanned.
         """
         self.bands = self._parse_input(bands=bands)
+        self.cache = cache if cache is not None else band.ProductCache()
+        for goes_band in self.bands.values():
+            goes_band.cache = self.cache
         self.region, _, self.satellite, self.scan_time_utc = utilities.parse_filename(
             filename=bands[0].dataset.dataset_name
         )
@@ -186,6 +347,15 @@ class GoesScan:
         """
         return self.bands.items()
 
+    def release(self):
+        """Drop the derived products kept by the bands, e.g. once done with the scan.
+
+        Also drops those of the scans derived from it, e.g. by `rescale_to_2km`, which
+        share its cache. See `GoesBand.release`.
+        """
+        self.cache.release()
+
+    @instrumentation.timed("rescale")
     def rescale_to_2km(self):
         """Scale all bands to 2 kilometers.
 
@@ -214,17 +384,28 @@ class GoesScan:
             "x": self["band_16"].dataset.x.values,
             "y": self["band_16"].dataset.y.values,
         }
+        rescaled_bands = [band_ds.rescale_to_2km() for _, band_ds in self.iteritems()]
         return GoesScan(
             bands=[
                 band.GoesBand(
-                    band_ds.rescale_to_2km().dataset.assign_coords(**band_16_coords)
+                    dataset=rescaled.dataset.assign_coords(**band_16_coords),
+                    mask=rescaled.mask,
                 )
-                for _, band_ds in self.iteritems()
-            ]
+                for rescaled in rescaled_bands
+            ],
+            cache=self.cache,
         )
 
-    def to_netcdf(self, directory):
-        """Persist a netcdf4 file for each band.
+    def to_netcdf(
+        self,
+        directory,
+        complevel=None,
+        chunksizes=None,
+        pack=False,
+        single_file=False,
+        max_workers=1,
+    ):
+        """Persist a netcdf4 file for each band, or a single file holding every band.
 
         Persists files in a form matching the file struture in Amazon S3:
             {directory}/{s3_key}
@@ -232,20 +413,59 @@ class GoesScan:
             {directory}/ABI-L1b-RadM/2019/300/20/
             OR_ABI-L1b-RadM1-M6C14_G17_s20193002048275_e20193002048332_c20193002048405.nc
 
+        If `single_file`, the bands are persisted as the groups band_1 - band_16 of a
+        single file in the same directory, named after band 1 without its channel, e.g.
+            OR_ABI-L1b-RadM1-M6_G17_s20193002048275_e20193002048332_c20193002048405.nc
+        Read it back with `read_netcdf_groups`.
+
         Parameters
         ----------
         directory : str
             Path to local directory in which to persist the datasets.
+        complevel : int, optional
+            zlib compression level. See `band.get_encoding`.
+        chunksizes : tuple of int, optional
+            HDF5 chunk shape (y, x). See `band.get_encoding`.
+        pack : bool, optional
+            Whether to store `Rad` as 16 bit integers. See `band.get_encoding`.
+        single_file : bool, optional
+            Whether to persist every band to a single file, by default False.
+        max_workers : int, optional
+            Number of bands to write concurrently, in a pool of processes, when not
+            `single_file`. By default 1, which writes serially. See `read_netcdfs`.
 
         Returns
         -------
         list of str
             The filepaths of the persisted files.
         """
-        filepaths = []
-        for _, goes_band in self.iteritems():
-            filepaths.append(goes_band.to_netcdf(directory=directory))
-        return filepaths
+        encoding_kwargs = {"complevel": complevel, "chunksizes": chunksizes, "pack": pack}
+        if not single_file:
+            return _map_bands(
+                function=functools.partial(
+                    band.GoesBand.to_netcdf, directory=directory, **encoding_kwargs
+                ),
+                iterable=[goes_band for _, goes_band in self.iteritems()],
+                max_workers=max_workers,
+            )
+
+        local_filepath = re.sub(
+            r"C01_(G\d{2}_s)", r"_\1", self["band_1"].get_filepath(directory=directory)
+        )
+        os.makedirs(os.path.dirname(local_filepath), exist_ok=True)
+        mode = "w"
+        with instrumentation.timer("persist"):
+            for band_name, goes_band in self.iteritems():
+                dataset = goes_band.masked_dataset
+                dataset.to_netcdf(
+                    path=local_filepath,
+                    mode=mode,
+                    group=band_name,
+                    encoding=band.get_encoding(dataset=dataset, **encoding_kwargs),
+                )
+                mode = "a"
+        instrumentation.add_bytes("persist", os.path.getsize(local_filepath))
+        return [local_filepath]
 
     def plot(self, bands=range(1, 17), use_radiance=False):
         """Plot the specified bands.
@@ -270,6 +490,8 @@ class GoesScan:
         num_bands = len(bands)
         num_cols = min([num_bands, max_cols])
         num_rows = math.ceil(num_bands / max_cols)
+        import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
         _, axes = plt.subplots(
             ncols=num_cols, nrows=num_rows, figsize=(10 * num_cols, 7 * num_rows)
         )
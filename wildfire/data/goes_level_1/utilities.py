@@ -5,9 +5,10 @@ import logging
 import os
 import re
 
+import netCDF4
 import numpy as np
 
-from wildfire import multiprocessing
+from wildfire import instrumentation, multiprocessing
 
 SATELLITE_SHORT_HAND = {"noaa-goes16": "G16", "noaa-goes17": "G17"}
 SATELLITE_LONG_HAND = {"G16": "noaa-goes16", "G17": "noaa-goes17"}
@@ -19,10 +20,47 @@ BASE_PATTERN_FORMAT = os.path.join(
     "{hour}",
     "OR_ABI-L1b-Rad{region}-M?C{channel}_{satellite_short}_s{start_time}*.nc",
 )
+# rough single core seconds of work per scan, and the most PBS jobs worth requesting when
+# scaling adaptively, for each region
+REGION_SCAN_SECONDS = {"M1": 10, "M2": 10, "C": 60, "F": 300}
+REGION_MAXIMUM_JOBS = {"M1": 4, "M2": 4, "C": 16, "F": 32}
+# (rows, columns) of the 2km bands of each region, and the number of pixels of each
+# band for every pixel of a 2km band (bands 1, 3 and 5 are at 1km and band 2 at 0.5km)
+REGION_SHAPES = {"M1": (500, 500), "M2": (500, 500), "C": (1500, 2500), "F": (5424, 5424)}
+BAND_PIXEL_FACTORS = {1: 4, 2: 16, 3: 4, 5: 4}
+HOUR_PREFIX_FORMAT = "{directory}/ABI-L1b-Rad{region[0]}/{hour:%Y}/{hour:%j}/{hour:%H}"
+# compact store of a day, in the day directory (see `compact`)
+COMPACT_FILENAME_FORMAT = "compact_{region}_{satellite_short}.nc"
 
 _logger = logging.getLogger(__name__)
 
 
+def estimate_scan_memory(region, num_copies=2):
+    """Estimate the bytes of memory needed to process a single scan of `region`.
+
+    A scan is read as float32 `Rad` and `DQF` for each of its 16 bands at their native
+    resolution, and is then processed as float64 arrays of the 16 bands at 2km.
+
+    Parameters
+    ----------
+    region : str
+        Must be in set (M1, M2, C, F).
+    num_copies : int, optional
+        Number of float64 copies of the 16 bands at 2km made during processing, e.g. by
+        `GoesScan.rescale_to_2km` and the features of a model, by default 2.
+
+    Returns
+    -------
+    int
+    """
+    rows, columns = REGION_SHAPES[region]
+    num_pixels = rows * columns
+    native_pixels = sum(BAND_PIXEL_FACTORS.get(band_id, 1) for band_id in range(1, 17))
+    read_bytes = native_pixels * num_pixels * 2 * np.dtype(np.float32).itemsize
+    processing_bytes = num_copies * 16 * num_pixels * np.dtype(np.float64).itemsize
+    return read_bytes + processing_bytes
+
+
 def group_filepaths_into_scans(filepaths):
     """Group bands in `filepaths` that belong to the same scan.
 
@@ -152,6 +190,35 @@ def decide_fastest_glob_patterns(
     ]
 
 
+def list_hour_prefixes(directory, region, start_time, end_time=None):
+    """List the hour prefixes that contain the scans between `start_time` and `end_time`.
+
+    Parameters
+    ----------
+    directory : str
+        Root directory or S3 bucket, e.g. noaa-goes17.
+    region : str
+        Must be in set (M1, M2, C, F).
+    start_time : datetime.datetime
+    end_time : datetime.datetime, optional
+        By default `None`, which only lists the hour of `start_time`.
+
+    Returns
+    -------
+    list of str
+        Of the form {directory}/ABI-L1b-Rad{region[0]}/{year}/{day_of_year}/{hour}.
+    """
+    end_time = end_time if end_time is not None else start_time
+    hour = start_time.replace(minute=0, second=0, microsecond=0)
+    prefixes = []
+    while hour <= end_time:
+        prefixes.append(
+            HOUR_PREFIX_FORMAT.format(directory=directory, region=region, hour=hour)
+        )
+        hour += datetime.timedelta(hours=1)
+    return prefixes
+
+
 def filter_filepaths(filepaths, start_time, end_time):
     """Remove filepaths that are outside of `start_time` and `end_time`.
 
@@ -172,13 +239,24 @@ def filter_filepaths(filepaths, start_time, end_time):
     ]
 
 
+@instrumentation.timed("list")
 def list_local_files(
-    local_directory, satellite, region, start_time, end_time=None, channel=None
+    local_directory,
+    satellite,
+    region,
+    start_time,
+    end_time=None,
+    channel=None,
+    use_compact=True,
 ):
     """List local files that match parameters.
 
     Only parallelizes across locally available hardware.
 
+    Bands packed into a compact store (see `compact`) are listed by the filepaths their
+    original files had, whether or not those files still exist, since
+    `scan.read_netcdfs` reads them from the store.
+
     Parameters
     ----------
     local_directory : str
@@ -194,6 +272,9 @@ def list_local_files(
     end_time : datetime.datetime, optional
         By default `None`, which will list all files whose scan start time matches
         `start_time`.
+    use_compact : bool, optional
+        Whether to also list the bands in compact stores, by default True. Use False to
+        list only the files on disk, e.g. to verify or compact them.
 
     Returns
     -------
@@ -208,18 +289,97 @@ def list_local_files(
         end_time=end_time,
     )
     # only parallel across local hardware
-    filepaths = multiprocessing.map_function(glob.glob, glob_patterns)
+    filepaths = multiprocessing.map_function(glob.glob, glob_patterns, backend="threads")
     if len(filepaths) < 0:
         raise ValueError(f"No files found using patterns {glob_patterns}")
 
     filepaths = multiprocessing.flatten_array(filepaths)
     if end_time is not None:
-        return filter_filepaths(
+        filepaths = filter_filepaths(
             filepaths=filepaths, start_time=start_time, end_time=end_time,
         )
+    if use_compact:
+        on_disk = set(filepaths)
+        filepaths = list(filepaths) + [
+            filepath
+            for filepath in list_compact_files(
+                local_directory=local_directory,
+                satellite=satellite,
+                region=region,
+                start_time=start_time,
+                end_time=end_time,
+                channel=channel,
+            )
+            if filepath not in on_disk
+        ]
     return filepaths
 
 
+def list_compact_files(
+    local_directory, satellite, region, start_time, end_time=None, channel=None
+):
+    """List the bands in compact stores that match parameters.
+
+    Parameters are as for `list_local_files`.
+
+    Returns
+    -------
+    list of str
+        The filepaths that the original files of the bands had in `local_directory`,
+        which need not exist anymore.
+    """
+    if end_time is None:  # as the glob patterns, match the minute of `start_time`
+        start_time = start_time.replace(second=0, microsecond=0)
+        end_time = start_time + datetime.timedelta(minutes=1, microseconds=-1)
+
+    filepaths = []
+    day = start_time.date()
+    while day <= end_time.date():
+        day_directory = os.path.join(
+            local_directory, f"ABI-L1b-Rad{region[0]}", f"{day:%Y}", f"{day:%j}"
+        )
+        store_filepath = os.path.join(
+            day_directory,
+            COMPACT_FILENAME_FORMAT.format(
+                region=region, satellite_short=SATELLITE_SHORT_HAND[satellite]
+            ),
+        )
+        filepaths.extend(
+            os.path.join(day_directory, f"{parse_filename(filename)[3]:%H}", filename)
+            for filename in read_compact_filenames(
+                store_filepath=store_filepath, channel=channel
+            )
+        )
+        day += datetime.timedelta(days=1)
+    return filter_filepaths(filepaths=filepaths, start_time=start_time, end_time=end_time)
+
+
+def read_compact_filenames(store_filepath, channel=None):
+    """Read the names of the original files of the bands in a compact store.
+
+    Parameters
+    ----------
+    store_filepath : str
+    channel : int, optional
+        By default `None`, which reads those of all channels.
+
+    Returns
+    -------
+    list of str
+        Empty if there is no store at `store_filepath`.
+    """
+    if not os.path.exists(store_filepath):
+        return []
+    channels = [channel] if channel is not None else range(1, 17)
+    filenames = []
+    with netCDF4.Dataset(store_filepath) as store:
+        for group_channel in channels:
+            group = store.groups.get(f"C{group_channel:02d}")
+            if group is not None:
+                filenames.extend(group["dataset_name"][:])
+    return filenames
+
+
 def parse_filename(filename):
     """Parse region, channel, satellite and started_at from filename.
 
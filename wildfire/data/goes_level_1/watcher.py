@@ -0,0 +1,204 @@
+"""Watch Amazon S3 for GOES level 1 scans as they are published.
+
+NOAA publishes each band of a scan as its own file, usually within a minute or two of
+the scan starting. `ScanWatcher` polls the prefix of the current (and previous) hour,
+downloads each band as soon as it appears, and reports a scan as soon as all 16 of its
+bands are on the local filesystem. A band is only marked as seen once it has been
+downloaded, so that bands whose download failed are retried by the next poll. Scans that
+started before the first poll are skipped, unless the watcher is given an earlier
+`since`, so that starting to watch does not download up to two hours of backlog.
+
+Any fsspec filesystem can stand in for the bucket, e.g.
+`fsspec.filesystem("file")` pointed at a local directory laid out like Amazon S3.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import logging
+import os
+import posixpath
+
+from . import downloader, utilities
+
+DOWNLOAD_MAX_WORKERS = 16
+
+_logger = logging.getLogger(__name__)
+
+
+class ScanWatcher:  # pylint: disable=too-many-instance-attributes
+    """Incrementally download the bands of new GOES level 1 scans.
+
+    Attributes
+    ----------
+    satellite : str
+        In the set (noaa-goes16, noaa-goes17).
+    region : str
+        In the set (M1, M2, C, F).
+    local_directory : str
+        Directory in which bands are downloaded, in the same layout as
+        `downloader.download_file`.
+    remote_directory : str
+        Root of the bucket on `filesystem`.
+    filesystem : fsspec.AbstractFileSystem
+    max_scan_age : datetime.timedelta
+        How long to wait for the remaining bands of a scan before giving up on it.
+    since : datetime.datetime | None
+        Scans that started before this UTC time are never downloaded. `None` until the
+        first poll if not given.
+    """
+
+    def __init__(
+        self,
+        satellite,
+        region,
+        local_directory,
+        remote_directory=None,
+        filesystem=None,
+        max_scan_age=datetime.timedelta(minutes=30),
+        since=None,
+    ):
+        """Initialize.
+
+        Parameters
+        ----------
+        satellite : str
+            Must be in set (noaa-goes16, noaa-goes17).
+        region : str
+            Must be in set (M1, M2, C, F).
+        local_directory : str
+        remote_directory : str, optional
+            By default `None`, which uses `satellite`, the name of the bucket in Amazon
+            S3.
+        filesystem : fsspec.AbstractFileSystem, optional
+            By default `None`, which uses an anonymous `s3fs.S3FileSystem`.
+        max_scan_age : datetime.timedelta, optional
+        since : datetime.datetime, optional
+            Only download scans that started at or after this UTC time. By default
+            `None`, which uses the time of the first poll.
+        """
+        self.satellite = satellite
+        self.region = region
+        self.local_directory = local_directory
+        self.filesystem = filesystem if filesystem else downloader.get_s3_filesystem()
+        remote_directory = remote_directory if remote_directory else satellite
+        # pylint: disable=protected-access
+        self.remote_directory = self.filesystem._strip_protocol(remote_directory)
+        self.remote_directory = self.remote_directory.rstrip("/")
+        self.max_scan_age = max_scan_age
+        self.since = since
+        self._seen = {}  # hour prefix -> set of remote filepaths
+        self._pending = {}  # scan start time -> {channel: local filepath}
+
+    def __repr__(self):
+        """Represent a ScanWatcher as a string."""
+        return (
+            f"ScanWatcher(satellite={self.satellite}, region={self.region}, "
+            f"remote_directory={self.remote_directory}, pending={len(self._pending)})"
+        )
+
+    def poll(self, now=None):
+        """Download any newly published bands and return the scans they complete.
+
+        Parameters
+        ----------
+        now : datetime.datetime, optional
+            Current UTC time, by default `None` which uses `datetime.datetime.utcnow()`.
+
+        Returns
+        -------
+        list of list of str
+            Local filepaths of the 16 bands of each newly completed scan, ordered by scan
+            start time.
+
+        Raises
+        ------
+        OSError
+            If the remote directory cannot be listed. Errors downloading a band are
+            logged, and the band is retried by the next poll.
+        """
+        now = now if now is not None else datetime.datetime.utcnow()
+        if self.since is None:
+            self.since = now
+        prefixes = utilities.list_hour_prefixes(
+            directory=self.remote_directory,
+            region=self.region,
+            start_time=now - datetime.timedelta(hours=1),
+            end_time=now,
+        )
+        self._seen = {prefix: self._seen.get(prefix, set()) for prefix in prefixes}
+
+        new_filepaths = []
+        for prefix in prefixes:
+            new_filepaths.extend(
+                (prefix, filepath) for filepath in self._list_new(prefix=prefix)
+            )
+        if new_filepaths:
+            _logger.info("Downloading %d new bands...", len(new_filepaths))
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_MAX_WORKERS) as executor:
+                local_filepaths = list(
+                    executor.map(
+                        self._try_download, [filepath for _, filepath in new_filepaths]
+                    )
+                )
+            for (prefix, filepath), local_filepath in zip(new_filepaths, local_filepaths):
+                if local_filepath is None:
+                    continue
+                self._seen[prefix].add(filepath)
+                _, channel, _, scan_time = utilities.parse_filename(local_filepath)
+                self._pending.setdefault(scan_time, {})[channel] = local_filepath
+
+        completed = []
+        for scan_time in sorted(self._pending):
+            if len(self._pending[scan_time]) == 16:
+                bands = self._pending.pop(scan_time)
+                completed.append([bands[channel] for channel in sorted(bands)])
+            elif now - scan_time > self.max_scan_age:
+                _logger.warning(
+                    "Giving up on scan at %s with %d bands.",
+                    scan_time,
+                    len(self._pending.pop(scan_time)),
+                )
+        return completed
+
+    def _list_new(self, prefix):
+        """List the files under `prefix` for our region that we have not yet downloaded.
+
+        Other files, and those of scans that started before `since`, are marked as seen,
+        since they are never downloaded.
+        """
+        self.filesystem.invalidate_cache(prefix)
+        try:
+            filepaths = self.filesystem.ls(prefix, detail=False)
+        except FileNotFoundError:  # nothing published for this hour yet
+            return []
+
+        new_filepaths = []
+        for filepath in sorted(set(filepaths) - self._seen[prefix]):
+            if filepath.endswith(".nc"):
+                region, _, _, scan_time = utilities.parse_filename(
+                    posixpath.basename(filepath)
+                )
+                if region == self.region and scan_time >= self.since:
+                    new_filepaths.append(filepath)
+                    continue
+            self._seen[prefix].add(filepath)
+        return new_filepaths
+
+    def _try_download(self, remote_filepath):
+        """Download a band as `_download` does, or return `None` if it fails."""
+        try:
+            return self._download(remote_filepath)
+        except Exception:  # pylint: disable=broad-except
+            _logger.exception(
+                "Failed to download %s. Retrying next poll.", remote_filepath
+            )
+            return None
+
+    def _download(self, remote_filepath):
+        """Download to {local_directory}/{key relative to remote_directory}."""
+        local_filepath = os.path.join(
+            self.local_directory,
+            *posixpath.relpath(remote_filepath, self.remote_directory).split("/"),
+        )
+        os.makedirs(os.path.dirname(local_filepath), exist_ok=True)
+        self.filesystem.get(remote_filepath, local_filepath)
+        return local_filepath
@@ -1,12 +1,15 @@
 """Utilities for the GOES level 2 product."""
 import datetime
+import os
+import re
 
 from .. import goes_level_1
 
 SCAN_TYPE = {"Full Disk": "F", "CONUS": "C"}
+REGION_PATTERN = re.compile(r"ABI-L2-FDC([CF])")
 
 
-def match_level_1(level_2, level_1_directory, download=False):
+def match_level_1(level_2, level_1_directory, download=False, max_workers=1):
     """For a given GOES level 2 product, find the level 1 product from the same scan.
 
     Parameters
@@ -15,6 +18,9 @@ def match_level_1(level_2, level_1_directory, download=False):
     level_1_directory : str
     download : bool, optional
         Whether to download missing data from Amazon S3. Defaults to False.
+    max_workers : int, optional
+        Number of bands to decode concurrently. See
+        `wildfire.data.goes_level_1.read_netcdfs`.
 
     Returns
     -------
@@ -40,5 +46,23 @@ def match_level_1(level_2, level_1_directory, download=False):
             region=region,
             start_time=start_time,
         )
-    level_1_scan = goes_level_1.read_netcdfs(local_filepaths=level_1_files)
+    level_1_scan = goes_level_1.read_netcdfs(
+        local_filepaths=level_1_files, max_workers=max_workers
+    )
     return level_1_scan
+
+
+def get_region(level_2_filepath):
+    """Get the region of a GOES level 2 fire file from its name.
+
+    Parameters
+    ----------
+    level_2_filepath : str
+
+    Returns
+    -------
+    str
+        "C" or "F", assuming Full Disk if the name is not that of a fire product.
+    """
+    match = REGION_PATTERN.search(os.path.basename(level_2_filepath))
+    return match.group(1) if match else "F"
@@ -0,0 +1,321 @@
+"""Timers and counters of the stages of the pipelines.
+
+Stages (e.g. "list", "download", "read_netcdf", "calibrate", "rescale", "model",
+"patches" and "persist") are timed with `timer` or `timed`, which record, per stage:
+    count
+        Number of times the stage ran.
+    wall_seconds, cpu_seconds
+        Wall and CPU time of the thread that ran the stage, excluding the stages run
+        within it, e.g. "model" excludes the "rescale" and "calibrate" of its scan, so
+        that the times of the stages add up rather than double count.
+    bytes
+        Bytes read or written by the stage, where known (see `add_bytes`).
+    peak_rss_bytes
+        Peak resident memory of the process, as of the end of the stage.
+
+Records are kept per thread while `wildfire.multiprocessing.map_function` runs a task,
+returned alongside its result and merged into those of the calling process, so that
+`summary` covers the work of every worker. The CLIs emit the summary as JSON at the end
+of each command, and optionally write it as a Prometheus textfile (see `report`).
+
+Examples
+--------
+```
+with instrumentation.timer("read_netcdf", nbytes=os.path.getsize(filepath)):
+    dataset = xr.load_dataset(filepath)
+
+@instrumentation.timed("model")
+def predict_wildfires(goes_scan):
+    ...
+```
+"""
+from contextlib import contextmanager, nullcontext
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+FIELDS = ("count", "wall_seconds", "cpu_seconds", "bytes", "peak_rss_bytes")
+PROMETHEUS_PREFIX = "wildfire_stage"
+PROMETHEUS_HELP = {
+    "count": "Number of times the stage ran.",
+    "wall_seconds": "Wall time spent in the stage.",
+    "cpu_seconds": "CPU time spent in the stage.",
+    "bytes": "Bytes read or written by the stage.",
+    "peak_rss_bytes": "Peak resident memory of a process running the stage.",
+}
+# ru_maxrss is in kilobytes on Linux, and bytes on macOS
+RSS_UNIT_BYTES = 1 if sys.platform == "darwin" else 1024
+
+_RECORDS = {}
+_LOCK = threading.Lock()
+_LOCAL = threading.local()  # records of the running task, and the stack of timers
+
+_logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timer(stage, nbytes=0):
+    """Time the surrounded block as a run of `stage`.
+
+    The time of the timers run within the block is not counted in `stage`.
+
+    Parameters
+    ----------
+    stage : str
+    nbytes : int, optional
+        Bytes read or written by the block, by default 0.
+    """
+    if getattr(_LOCAL, "timers", None) is None:
+        _LOCAL.timers = []
+    nested = [0.0, 0.0]  # wall and CPU seconds of the timers run within the block
+    _LOCAL.timers.append(nested)
+    started_wall = time.perf_counter()
+    started_cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        wall_seconds = time.perf_counter() - started_wall
+        cpu_seconds = time.thread_time() - started_cpu
+        _LOCAL.timers.pop()
+        if _LOCAL.timers:
+            _LOCAL.timers[-1][0] += wall_seconds
+            _LOCAL.timers[-1][1] += cpu_seconds
+        record(
+            stage=stage,
+            wall_seconds=wall_seconds - nested[0],
+            cpu_seconds=cpu_seconds - nested[1],
+            nbytes=nbytes,
+        )
+
+
+def timed(stage):  # noqa: D202 (black puts a blank line before a nested def)
+    """Decorate a function to time each of its calls as a run of `stage`.
+
+    Parameters
+    ----------
+    stage : str
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(stage=stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record(stage, wall_seconds=0.0, cpu_seconds=0.0, nbytes=0, count=1):
+    """Record a run of `stage`.
+
+    Parameters
+    ----------
+    stage : str
+    wall_seconds : float, optional
+    cpu_seconds : float, optional
+    nbytes : int, optional
+    count : int, optional
+        Number of runs, by default 1.
+    """
+    merge(
+        {
+            stage: {
+                "count": count,
+                "wall_seconds": wall_seconds,
+                "cpu_seconds": cpu_seconds,
+                "bytes": nbytes,
+                "peak_rss_bytes": get_peak_rss(),
+            }
+        }
+    )
+
+
+def add_bytes(stage, nbytes):
+    """Add `nbytes` to the bytes of `stage`, without counting a run.
+
+    Parameters
+    ----------
+    stage : str
+    nbytes : int
+    """
+    record(stage=stage, nbytes=nbytes, count=0)
+
+
+def get_peak_rss():
+    """Get the peak resident memory of this process in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT_BYTES
+
+
+def merge(records):
+    """Merge `records`, as returned by `collect`, into those of this thread.
+
+    Parameters
+    ----------
+    records : dict
+        Of the form {stage: {field: value}} with fields in `FIELDS`.
+    """
+    current, lock = _current()
+    with lock:
+        for stage, stats in records.items():
+            merged = current.setdefault(stage, dict.fromkeys(FIELDS, 0))
+            for field, value in stats.items():
+                if field == "peak_rss_bytes":
+                    merged[field] = max(merged[field], value)
+                else:
+                    merged[field] += value
+
+
+def summary():
+    """Get the records of this process, merged with those of the tasks it ran.
+
+    Returns
+    -------
+    dict
+        Of the form {stage: {field: value}} with fields in `FIELDS`.
+    """
+    with _LOCK:
+        return {stage: dict(stats) for stage, stats in sorted(_RECORDS.items())}
+
+
+def reset():
+    """Clear the records of this process."""
+    with _LOCK:
+        _RECORDS.clear()
+
+
+@contextmanager
+def collect():
+    """Collect the records of the surrounded block separately from the process's.
+
+    Used to return the records of a task to the process that submitted it.
+
+    Yields
+    ------
+    dict
+        The records of the block, filled in as it runs.
+    """
+    previous = getattr(_LOCAL, "records", None)
+    _LOCAL.records = {}
+    try:
+        yield _LOCAL.records
+    finally:
+        _LOCAL.records = previous
+
+
+class InstrumentedFunction:  # pylint: disable=too-few-public-methods
+    """Wrap `function` to return the records of each call along with its return value.
+
+    For functions run in other threads or processes. Pass the results to `unpack` in the
+    calling thread.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.__name__ = getattr(function, "__name__", repr(function))
+
+    def __call__(self, *args, **kwargs):
+        """Call `function`, returning its return value and the records of the call."""
+        with collect() as records:
+            return_value = self.function(*args, **kwargs)
+        return return_value, records
+
+
+def unpack(results):
+    """Merge the records of results of `InstrumentedFunction`, returning their values.
+
+    Parameters
+    ----------
+    results : iterable of tuple
+
+    Returns
+    -------
+    list
+    """
+    return_values = []
+    for return_value, records in results:
+        merge(records)
+        return_values.append(return_value)
+    return return_values
+
+
+def _current():
+    records = getattr(_LOCAL, "records", None)
+    if records is None:
+        return _RECORDS, _LOCK
+    return records, nullcontext()  # belong to this thread alone
+
+
+def report(json_filepath=None, prometheus_filepath=None, labels=None):
+    """Log the summary as JSON, and optionally write it to files.
+
+    Parameters
+    ----------
+    json_filepath : str, optional
+        File in which to write the summary as JSON, by default `None`.
+    prometheus_filepath : str, optional
+        File in which to write the summary in the Prometheus text format, e.g. in the
+        directory of node_exporter's textfile collector, by default `None`. Replaced
+        atomically, so that it is never read half written.
+    labels : dict, optional
+        Prometheus labels added to every sample, e.g. {"command": "goes-threshold"}.
+
+    Returns
+    -------
+    dict
+        The summary.
+    """
+    records = summary()
+    _logger.info("Performance summary: %s", json.dumps(records))
+    if json_filepath is not None:
+        with open(json_filepath, "w") as buffer:
+            json.dump(records, buffer, indent=2)
+    if prometheus_filepath is not None:
+        _write_atomically(
+            filepath=prometheus_filepath,
+            text=to_prometheus(records=records, labels=labels),
+        )
+    return records
+
+
+def to_prometheus(records, labels=None):
+    """Format `records` in the Prometheus text exposition format.
+
+    Parameters
+    ----------
+    records : dict
+        As returned by `summary`.
+    labels : dict, optional
+
+    Returns
+    -------
+    str
+    """
+    lines = []
+    for field in FIELDS:
+        name = f"{PROMETHEUS_PREFIX}_{field}"
+        metric_type = "gauge" if field == "peak_rss_bytes" else "counter"
+        lines.append(f"# HELP {name} {PROMETHEUS_HELP[field]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for stage, stats in records.items():
+            sample_labels = ",".join(
+                f'{key}="{value}"'
+                for key, value in {**(labels or {}), "stage": stage}.items()
+            )
+            lines.append(f"{name}{{{sample_labels}}} {stats[field]}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomically(filepath, text):
+    directory = os.path.dirname(os.path.abspath(filepath))
+    file_descriptor, temporary_filepath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(file_descriptor, "w") as buffer:
+        buffer.write(text)
+    os.replace(temporary_filepath, filepath)
@@ -0,0 +1,416 @@
+"""Predict wildfires in GOES scans with a trained CNN on CPU.
+
+Each scan is normalized as for training (see `training_data.normalize_scan`), with the
+same statistics of the archive if the training data was (see `normalization`), tiled into
+patches of the same geometry as `training_data.extract_patches_2d`, and the patches are
+run through the model in batches. The predicted probabilities of overlapping patches are
+averaged back into a map of the whole scan.
+
+Models are loaded by `load_model` according to their file extension:
+    .onnx
+        An ONNX model run with the optional `onnxruntime`, which must take a float32
+        batch of shape (batch, height, width, 16) and return probabilities of shape
+        (batch, height, width) or (batch, height, width, 1).
+    .npz
+        A `NumpyModel`, a per-pixel logistic regression run with numpy, e.g. as a
+        baseline.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import functools
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from wildfire import instrumentation, multiprocessing
+from wildfire.data import goes_level_1
+from . import normalization, training_data
+
+WILDFIRE_FILENAME = "deep_wildfires_{satellite}_{region}_s{start}_e{end}_c{created}.json"
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_PROBABILITY_THRESHOLD = 0.5
+# retries of a scan that raised, e.g. a MemoryError (see `map_function` for dead workers)
+SCAN_RETRIES = 2
+# float copies of a scan made by `predict_scan`: the rescaled bands, the normalized
+# scan, and the sums and counts of the stitched probabilities
+PROCESSING_COPIES = 3
+
+_logger = logging.getLogger(__name__)
+
+
+class NumpyModel:
+    """Per-pixel logistic regression over the 16 normalized bands, run with numpy.
+
+    Persisted with `save` as an .npz file of `weights` of shape (16,) and a `bias`.
+
+    Parameters
+    ----------
+    weights : np.ndarray of float
+    bias : float
+    num_threads : int, optional
+        Number of threads over which to split each batch, by default 1.
+    """
+
+    def __init__(self, weights, bias, num_threads=1):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.float32(bias)
+        self.num_threads = num_threads
+
+    def __call__(self, batch):
+        """Predict the probability of a wildfire at each pixel of a batch of patches."""
+        if self.num_threads <= 1 or len(batch) < self.num_threads:
+            return self._predict(batch)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            return np.concatenate(
+                list(
+                    executor.map(
+                        self._predict, np.array_split(batch, self.num_threads, axis=0)
+                    )
+                )
+            )
+
+    def _predict(self, batch):
+        logits = batch @ self.weights + self.bias
+        return 0.5 * (1 + np.tanh(logits / 2))  # the logistic function, without overflow
+
+    def save(self, filepath):
+        """Persist the model to the .npz file `filepath`."""
+        np.savez(filepath, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, filepath, num_threads=1):
+        """Load a model persisted with `save`."""
+        with np.load(filepath) as arrays:
+            return cls(
+                weights=arrays["weights"], bias=arrays["bias"], num_threads=num_threads
+            )
+
+
+class OnnxModel:  # pylint: disable=too-few-public-methods
+    """An ONNX model run with `onnxruntime` on CPU.
+
+    Parameters
+    ----------
+    filepath : str
+    num_threads : int, optional
+        Number of threads used by each operator, by default 1.
+    """
+
+    def __init__(self, filepath, num_threads=1):
+        import onnxruntime  # pylint: disable=import-outside-toplevel
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(filepath, sess_options=options)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        """Predict the probability of a wildfire at each pixel of a batch of patches."""
+        probabilities = self.session.run(None, {self.input_name: batch})[0]
+        return probabilities.reshape(batch.shape[:3])
+
+
+@functools.lru_cache(maxsize=4)
+def load_model(filepath, num_threads=1):
+    """Load the model at `filepath`, once per process.
+
+    Parameters
+    ----------
+    filepath : str
+        Of a .onnx or .npz model. See the module documentation.
+    num_threads : int, optional
+        Number of threads with which to run each batch, by default 1.
+
+    Returns
+    -------
+    callable
+        Of the form f(batch) -> probabilities, for a float32 batch of shape
+        (batch, height, width, 16) and probabilities of shape (batch, height, width).
+    """
+    extension = os.path.splitext(filepath)[1]
+    if extension == ".onnx":
+        return OnnxModel(filepath=filepath, num_threads=num_threads)
+    if extension == ".npz":
+        return NumpyModel.load(filepath=filepath, num_threads=num_threads)
+    raise ValueError(f"Unknown model format {extension}. Must be .onnx or .npz.")
+
+
+def predict_tiles(  # pylint: disable=too-many-locals
+    data, model, height, width, stride, batch_size=DEFAULT_BATCH_SIZE
+):
+    """Predict the probability of a wildfire at each pixel of an image, tile by tile.
+
+    Tiles are those of `training_data.get_tile_indices`. Only one batch of tiles is
+    copied out of `data` at a time, and the probabilities of pixels covered by several
+    tiles are averaged. Pixels covered by no tile, when `stride` is larger than `height`
+    or `width`, are `np.nan`.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Of shape (y, x, 16).
+    model : callable
+        As returned by `load_model`.
+    height : int
+    width : int
+    stride : int
+    batch_size : int, optional
+        Number of tiles run through the model at once, by default `DEFAULT_BATCH_SIZE`.
+
+    Returns
+    -------
+    np.ndarray of float32
+        Of shape (y, x).
+    """
+    tile_indices = training_data.get_tile_indices(
+        shape=data.shape, height=height, width=width, stride=stride
+    )
+    sums = np.zeros(data.shape[:2], dtype=np.float32)
+    counts = np.zeros(data.shape[:2], dtype=np.float32)
+    for start in range(0, len(tile_indices), batch_size):
+        batch_indices = tile_indices[start : start + batch_size]
+        batch = np.stack(
+            [
+                data[row : row + height, column : column + width]
+                for row, column in batch_indices
+            ]
+        ).astype(np.float32, copy=False)
+        probabilities = model(batch)
+        for (row, column), tile in zip(batch_indices, probabilities):
+            sums[row : row + height, column : column + width] += tile
+            counts[row : row + height, column : column + width] += 1
+    with np.errstate(invalid="ignore"):
+        return sums / counts
+
+
+@instrumentation.timed("model")
+def predict_scan(
+    goes_scan,
+    model,
+    height,
+    width,
+    stride,
+    batch_size=DEFAULT_BATCH_SIZE,
+    statistics=None,
+):
+    """Predict the probability of a wildfire at each pixel of a `GoesScan`.
+
+    Parameters
+    ----------
+    goes_scan : wildfire.data.goes_level_1.GoesScan
+    model : callable
+        As returned by `load_model`.
+    height : int
+    width : int
+    stride : int
+        Geometry of the tiles, usually that of the training data.
+    batch_size : int, optional
+        By default `DEFAULT_BATCH_SIZE`.
+    statistics : wildfire.models.dnn.normalization.RunningStatistics, optional
+        See `training_data.normalize_scan`, by default `None`.
+
+    Returns
+    -------
+    np.ndarray of float32
+        Of shape (y, x) of the scan at 2km.
+    """
+    # shape = (y, x, 16), with missing pixels at the mean of their band
+    data = np.nan_to_num(
+        training_data.normalize_scan(
+            goes_scan=goes_scan, statistics=statistics
+        ).transpose([1, 2, 0]),
+        copy=False,
+    )
+    return predict_tiles(
+        data=data,
+        model=model,
+        height=height,
+        width=width,
+        stride=stride,
+        batch_size=batch_size,
+    )
+
+
+def parse_scan_for_wildfire(
+    filepaths,
+    model_filepath,
+    height,
+    width,
+    stride,
+    batch_size=DEFAULT_BATCH_SIZE,
+    num_threads=1,
+    probability_threshold=DEFAULT_PROBABILITY_THRESHOLD,
+    statistics_filepath=None,
+):
+    """Determine if scan defined by `filepaths` has a wildfire according to the CNN.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        Must be a set of 16 files, which together define the 16 bands of a complete scan.
+    model_filepath : str
+        See `load_model`.
+    height : int
+    width : int
+    stride : int
+    batch_size : int, optional
+        By default `DEFAULT_BATCH_SIZE`.
+    num_threads : int, optional
+        By default 1, since this is usually already run in parallel across scans.
+    probability_threshold : float, optional
+        Probability above which a pixel is a wildfire, by default
+        `DEFAULT_PROBABILITY_THRESHOLD`.
+    statistics_filepath : str, optional
+        Statistics persisted by `normalization.save_statistics`, which must be those of
+        the training data of the model. By default `None`, which normalizes each scan
+        with its own statistics.
+
+    Returns
+    -------
+    dict | None
+        Of the same form as
+        `wildfire.models.threshold_model.goes_level_1_wildfires.parse_scan_for_wildfire`.
+    """
+    try:
+        goes_scan = goes_level_1.scan.read_netcdfs(
+            local_filepaths=filepaths, max_workers=1
+        )
+    except ValueError as error_message:
+        _logger.warning(
+            "\nSkipping malformed goes_scan comprised of %s.\nError: %s",
+            filepaths,
+            error_message,
+        )
+        return None
+
+    statistics = None
+    if statistics_filepath is not None:
+        statistics = normalization.select_statistics(
+            normalization.load_statistics(statistics_filepath), region=goes_scan.region
+        )
+    probabilities = predict_scan(
+        goes_scan=goes_scan,
+        model=load_model(filepath=model_filepath, num_threads=num_threads),
+        height=height,
+        width=width,
+        stride=stride,
+        batch_size=batch_size,
+        statistics=statistics,
+    )
+    goes_scan.release()
+    if (probabilities > probability_threshold).any():
+        return {
+            "scan_time_utc": goes_scan.scan_time_utc.strftime("%Y-%m-%dT%H:%M:%S%f"),
+            "region": goes_scan.region,
+            "satellite": goes_scan.satellite,
+        }
+    return None
+
+
+def label_wildfires(  # pylint: disable=too-many-arguments,too-many-locals
+    scan_filepaths,
+    model_filepath,
+    persist_directory,
+    satellite,
+    region,
+    start,
+    end,
+    height,
+    width,
+    stride,
+    batch_size=DEFAULT_BATCH_SIZE,
+    num_threads=1,
+    probability_threshold=DEFAULT_PROBABILITY_THRESHOLD,
+    statistics_filepath=None,
+    pbs=False,
+    **cluster_kwargs,
+):
+    """Create a list of all scans that have wildfires according to the CNN.
+
+    Logs the throughput in scans per second, to compare with the threshold model.
+
+    Parameters
+    ----------
+    scan_filepaths : list of list of str
+    model_filepath : str
+        See `load_model`.
+    persist_directory : str
+    satellite : str
+        Must be either "noaa-goes16" or "noaa-goes17".
+    region : str
+        Must be one of ("M1", "M2", "C", "F")
+    start : datetime.datetime
+    end : datetime.datetime
+    height : int
+    width : int
+    stride : int
+    batch_size : int, optional
+        By default `DEFAULT_BATCH_SIZE`.
+    num_threads : int, optional
+        Threads with which each worker runs the model, by default 1.
+    probability_threshold : float, optional
+        By default `DEFAULT_PROBABILITY_THRESHOLD`.
+    statistics_filepath : str, optional
+        See `parse_scan_for_wildfire`, by default `None`.
+    pbs : bool, optional
+        Whether or not to launch and parallize using PBS, by default False
+
+    Returns
+    -------
+    list of dict
+    """
+    num_scans = len(scan_filepaths)
+    started_at = time.perf_counter()
+    wildfires = multiprocessing.map_function(
+        function=parse_scan_for_wildfire,
+        function_args=[
+            scan_filepaths,
+            [model_filepath] * num_scans,
+            [height] * num_scans,
+            [width] * num_scans,
+            [stride] * num_scans,
+            [batch_size] * num_scans,
+            [num_threads] * num_scans,
+            [probability_threshold] * num_scans,
+            [statistics_filepath] * num_scans,
+        ],
+        pbs=pbs,
+        memory=goes_level_1.utilities.estimate_scan_memory(
+            region=region, num_copies=PROCESSING_COPIES
+        ),
+        retries=SCAN_RETRIES,
+        **cluster_kwargs,
+    )
+    elapsed = time.perf_counter() - started_at
+    _logger.info(
+        "Ran the CNN over %d scans in %.1fs: %.3f scans per second.",
+        num_scans,
+        elapsed,
+        num_scans / elapsed if elapsed else 0.0,
+    )
+    wildfires = list(filter(None, wildfires))
+    _logger.info("Found %d wildfires.", len(wildfires))
+
+    if wildfires:
+        wildfires_filepath = os.path.join(
+            persist_directory,
+            WILDFIRE_FILENAME.format(
+                satellite=satellite,
+                region=region,
+                start=start.strftime(DATETIME_FORMAT),
+                end=end.strftime(DATETIME_FORMAT),
+                created=datetime.datetime.utcnow().strftime(DATETIME_FORMAT),
+            ),
+        )
+        _logger.info("Persisting wildfires to %s", wildfires_filepath)
+        with open(wildfires_filepath, "w+") as buffer:
+            json.dump(dict(enumerate(wildfires)), buffer)
+    else:
+        _logger.info("No wildfires found...")
+
+    return wildfires
@@ -0,0 +1,349 @@
+"""Stream shuffled mini-batches of the training data written by `training_data`.
+
+The files written by `training_data.process_file` are indexed by their number of patches
+(`PatchIndex`), and a `BatchLoader` streams mini-batches across all of them without ever
+loading a whole file:
+    - Files are visited in a random order each epoch, and read in contiguous blocks of
+      patches, which are drawn at random from a shuffle buffer of bounded size.
+    - Variables are read through memory maps of the netCDF files, which are uncompressed
+      and contiguous as written by `process_file`, falling back to reads with h5py.
+    - Batches are assembled, and optionally augmented with random flips and rotations, by
+      a background thread, which keeps up to `prefetch` batches ahead of the model.
+
+Examples
+--------
+```
+patch_index = loader.PatchIndex.from_directory("./training_data")
+for abi, fire_temp in loader.BatchLoader(patch_index, batch_size=32, augment=True):
+    ...  # e.g. torch.from_numpy(abi)
+```
+"""
+import glob
+import logging
+import math
+import os
+import queue
+import threading
+
+import h5py
+import numpy as np
+import xarray as xr
+
+VARIABLES = ("abi", "fire_temp")
+TRAINING_DATA_PATTERN = "cnn_training_*.nc"
+DEFAULT_BUFFER_SIZE = 4096
+DEFAULT_BLOCK_SIZE = 256
+DEFAULT_PREFETCH = 4
+
+# HDF5 is not thread safe, so netCDF reads that cannot be memory mapped are serialized
+_NETCDF_LOCK = threading.Lock()
+
+_logger = logging.getLogger(__name__)
+
+
+class PatchIndex:
+    """Number of patches in each training data file, to address patches across files.
+
+    Parameters
+    ----------
+    filepaths : list of str
+    counts : list of int
+        Number of patches in each file.
+    """
+
+    def __init__(self, filepaths, counts):
+        self.filepaths = list(filepaths)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    def __len__(self):
+        """Count the patches of every file."""
+        return int(self.offsets[-1])
+
+    def __repr__(self):
+        """Summarize the numbers of patches and files."""
+        return f"PatchIndex({len(self)} patches in {len(self.filepaths)} files)"
+
+    @classmethod
+    def from_filepaths(cls, filepaths):
+        """Index the training data files at `filepaths`, reading only their metadata.
+
+        Parameters
+        ----------
+        filepaths : list of str
+
+        Returns
+        -------
+        PatchIndex
+        """
+        counts = []
+        for filepath in filepaths:
+            with _NETCDF_LOCK, xr.open_dataset(filepath) as dataset:
+                counts.append(dataset.abi.shape[0])
+        patch_index = cls(filepaths=filepaths, counts=counts)
+        _logger.info("Indexed %s", patch_index)
+        return patch_index
+
+    @classmethod
+    def from_directory(cls, directory, pattern=TRAINING_DATA_PATTERN):
+        """Index the training data files written by `process_file` into `directory`.
+
+        Parameters
+        ----------
+        directory : str
+        pattern : str, optional
+            Glob of the files to index, by default `TRAINING_DATA_PATTERN`.
+
+        Returns
+        -------
+        PatchIndex
+        """
+        return cls.from_filepaths(
+            sorted(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+        )
+
+    def locate(self, index):
+        """Get the file and the index within it of the patch `index`.
+
+        Parameters
+        ----------
+        index : int
+
+        Returns
+        -------
+        tuple of (str, int)
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Patch {index} out of range of {self}.")
+        file_index = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return self.filepaths[file_index], int(index - self.offsets[file_index])
+
+
+def open_variables(filepath):
+    """Open the variables of a training data file as memory maps, where possible.
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    dict
+        Of the form {variable: array-like} for `VARIABLES`, where each is a read-only
+        `np.memmap`, or, for chunked or compressed variables, read through h5py.
+    """
+    variables = {}
+    with _NETCDF_LOCK, h5py.File(filepath, "r") as h5_file:
+        for name in VARIABLES:
+            dataset = h5_file[name]
+            offset = dataset.id.get_offset()
+            if dataset.chunks is None and offset is not None:
+                variables[name] = np.memmap(
+                    filepath,
+                    dtype=dataset.dtype,
+                    mode="r",
+                    offset=offset,
+                    shape=dataset.shape,
+                )
+            else:
+                _logger.debug("Reading %s of %s without a memory map", name, filepath)
+                variables[name] = _LockedVariable(filepath=filepath, name=name)
+    return variables
+
+
+class _LockedVariable:  # pylint: disable=too-few-public-methods
+    """A variable of an HDF5 file, read under the lock of this module."""
+
+    def __init__(self, filepath, name):
+        self.filepath = filepath
+        self.name = name
+
+    def __getitem__(self, key):
+        with _NETCDF_LOCK, h5py.File(self.filepath, "r") as h5_file:
+            return h5_file[self.name][key]
+
+
+def augment_batch(abi, fire_temp, random_state):
+    """Randomly flip and rotate each patch of a batch.
+
+    The same transformation is applied to the bands and the fire temperature of a patch.
+    Non-square patches are only rotated by 180 degrees.
+
+    Parameters
+    ----------
+    abi : np.ndarray
+        Of shape (batch, height, width, 16).
+    fire_temp : np.ndarray
+        Of shape (batch, height, width).
+    random_state : np.random.RandomState
+
+    Returns
+    -------
+    tuple of (np.ndarray, np.ndarray)
+        The augmented batch, in new arrays.
+    """
+    is_square = abi.shape[1] == abi.shape[2]
+    abi_patches, fire_temp_patches = [], []
+    for abi_patch, fire_temp_patch in zip(abi, fire_temp):
+        rotations = random_state.randint(4) if is_square else 2 * random_state.randint(2)
+        abi_patch = np.rot90(abi_patch, k=rotations, axes=(0, 1))
+        fire_temp_patch = np.rot90(fire_temp_patch, k=rotations, axes=(0, 1))
+        if random_state.randint(2):
+            abi_patch, fire_temp_patch = abi_patch[:, ::-1], fire_temp_patch[:, ::-1]
+        abi_patches.append(abi_patch)
+        fire_temp_patches.append(fire_temp_patch)
+    return np.stack(abi_patches), np.stack(fire_temp_patches)
+
+
+class BatchLoader:  # pylint: disable=too-many-instance-attributes
+    """Iterate over shuffled mini-batches of the patches of a `PatchIndex`.
+
+    Each iteration is an epoch over every patch, yielding tuples of `abi` of shape
+    (batch_size, height, width, 16) and `fire_temp` of shape (batch_size, height, width),
+    both float32. The last batch of an epoch may be smaller.
+
+    Parameters
+    ----------
+    patch_index : PatchIndex
+    batch_size : int
+    buffer_size : int, optional
+        Most patches held in the shuffle buffer, by default `DEFAULT_BUFFER_SIZE`. Larger
+        buffers shuffle better across files, for more memory.
+    block_size : int, optional
+        Number of contiguous patches read from a file at once, by default
+        `DEFAULT_BLOCK_SIZE`.
+    prefetch : int, optional
+        Most batches prepared ahead of the consumer, by default `DEFAULT_PREFETCH`.
+    augment : bool, optional
+        Whether to randomly flip and rotate patches, by default False.
+    shuffle : bool, optional
+        Whether to shuffle patches, by default True. Otherwise, patches are yielded in
+        the order of the index.
+    seed : int, optional
+        Seed of the shuffling and augmentation, by default `None`.
+    """
+
+    def __init__(
+        self,
+        patch_index,
+        batch_size,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        block_size=DEFAULT_BLOCK_SIZE,
+        prefetch=DEFAULT_PREFETCH,
+        augment=False,
+        shuffle=True,
+        seed=None,
+    ):
+        self.patch_index = patch_index
+        self.batch_size = batch_size
+        self.buffer_size = max(buffer_size, batch_size)
+        self.block_size = block_size
+        self.prefetch = prefetch
+        self.augment = augment
+        self.shuffle = shuffle
+        self.random_state = np.random.RandomState(seed)
+
+    def __len__(self):
+        """Count the batches of an epoch."""
+        return math.ceil(len(self.patch_index) / self.batch_size)
+
+    def __iter__(self):
+        """Iterate over the batches of an epoch, read ahead by a background thread."""
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(batches, stop), name="BatchLoader", daemon=True
+        )
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            while producer.is_alive():  # unblock a producer waiting on a full queue
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.1)
+
+    def _produce(self, batches, stop):
+        try:
+            for batch in self._iterate_batches():
+                if stop.is_set():
+                    return
+                batches.put(batch)
+            batches.put(None)
+        except BaseException as error:  # pylint: disable=broad-except
+            batches.put(error)
+
+    def _iterate_batches(self):
+        # preallocated, so that memory stays bounded however patches are drawn
+        buffers, size = None, 0
+        for block in self._iterate_blocks():
+            if buffers is None:
+                buffers = [
+                    np.empty(
+                        (self.buffer_size + self.block_size,) + array.shape[1:],
+                        np.float32,
+                    )
+                    for array in block
+                ]
+            for buffer, array in zip(buffers, block):
+                buffer[size : size + len(array)] = array
+            size += len(block[0])
+            while size >= self.buffer_size:
+                batch, size = self._take_batch(buffers=buffers, size=size)
+                yield batch
+        while size:
+            batch, size = self._take_batch(buffers=buffers, size=size)
+            yield batch
+
+    def _iterate_blocks(self):
+        file_order = np.arange(len(self.patch_index.filepaths))
+        if self.shuffle:
+            self.random_state.shuffle(file_order)
+        for file_index in file_order:
+            count = self.patch_index.counts[file_index]
+            if count == 0:
+                continue
+            variables = open_variables(self.patch_index.filepaths[file_index])
+            starts = np.arange(0, count, self.block_size)
+            if self.shuffle:
+                self.random_state.shuffle(starts)
+            for start in starts:
+                block = slice(start, min(start + self.block_size, count))
+                yield (
+                    np.asarray(variables["abi"][block], dtype=np.float32),
+                    np.asarray(variables["fire_temp"][block], dtype=np.float32),
+                )
+
+    def _take_batch(self, buffers, size):
+        """Remove a batch of patches from the first `size` patches of `buffers`.
+
+        The patches are chosen at random, or are the first ones if not shuffling. Returns
+        the batch and the new size.
+        """
+        batch_size = min(self.batch_size, size)
+        remaining = size - batch_size
+        if self.shuffle:
+            indices = self.random_state.choice(size, size=batch_size, replace=False)
+            abi, fire_temp = (buffer[indices] for buffer in buffers)
+            # move the patches left at the end of the buffers into the holes
+            holes = indices[indices < remaining]
+            tail = np.setdiff1d(np.arange(remaining, size), indices)
+            for buffer in buffers:
+                buffer[holes] = buffer[tail]
+        else:
+            abi, fire_temp = (buffer[:batch_size].copy() for buffer in buffers)
+            for buffer in buffers:
+                buffer[:remaining] = buffer[batch_size:size]
+        if self.augment:
+            abi, fire_temp = augment_batch(
+                abi=abi, fire_temp=fire_temp, random_state=self.random_state
+            )
+        return (abi, fire_temp), remaining
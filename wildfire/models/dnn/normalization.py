@@ -0,0 +1,452 @@
+"""Normalize the bands of GOES scans with statistics of the whole archive.
+
+Normalizing each scan with its own mean and standard deviation (see
+`goes_level_1.band.normalize`) makes the same radiance map to different inputs by day and
+by night, or at Mesoscale and CONUS. Instead, `compute_statistics` makes one streaming
+pass over the archive, accumulating the count, mean, sum of squared deviations, extrema
+and a histogram of the calibrated values of each band in a `RunningStatistics`.
+
+Accumulators are mergeable (Chan et al.'s parallel algorithm for the variance), so scans
+are reduced in chunks on the workers and the client merges at most `MAX_CHUNKS` of them.
+Statistics are kept for the whole archive (`GLOBAL`) and, optionally, for each region, and
+are persisted as a small JSON file, which `training_data.process_file` and `inference`
+apply in place of the statistics of each scan.
+
+Examples
+--------
+```
+statistics = normalization.compute_statistics(scan_filepaths, by_region=True)
+normalization.save_statistics(statistics, "./statistics.json")
+...
+running_statistics = normalization.select_statistics(
+    normalization.load_statistics("./statistics.json"), region=goes_scan.region
+)
+data = normalization.calibrate_scan(goes_scan)
+normalized = running_statistics.normalize(data)
+```
+"""
+import functools
+import json
+import logging
+import math
+
+import numpy as np
+
+from wildfire import instrumentation, multiprocessing, precision
+from wildfire.data import goes_level_1
+
+NUM_BANDS = 16
+NUM_BINS = 256
+# range of the histogram of the reflectance factor (bands 1 - 6) and of the brightness
+# temperature in Kelvin (bands 7 - 16), outside of which values are counted in the first
+# or last bin
+REFLECTANCE_FACTOR_RANGE = (-0.1, 1.5)
+BRIGHTNESS_TEMPERATURE_RANGE = (150.0, 420.0)
+# key of the statistics of every scan, whatever its region
+GLOBAL = "all"
+# most chunks of scans reduced at once, bounding the results held by the client
+MAX_CHUNKS = 1024
+# float copies of a scan made by `get_scan_statistics`: the rescaled bands and their stack
+PROCESSING_COPIES = 2
+# retries of a chunk of scans that raised
+RETRIES = 2
+
+_logger = logging.getLogger(__name__)
+
+
+def get_default_bin_edges(num_bins=NUM_BINS):
+    """Get the edges of the histogram of each band.
+
+    Parameters
+    ----------
+    num_bins : int, optional
+        By default `NUM_BINS`.
+
+    Returns
+    -------
+    np.ndarray
+        Of shape (16, num_bins + 1).
+    """
+    return np.stack(
+        [
+            np.linspace(
+                *(REFLECTANCE_FACTOR_RANGE if band < 7 else BRIGHTNESS_TEMPERATURE_RANGE),
+                num=num_bins + 1,
+            )
+            for band in range(1, NUM_BANDS + 1)
+        ]
+    )
+
+
+class RunningStatistics:
+    """Mergeable count, mean, variance, extrema and histogram of each band.
+
+    Missing (`np.nan`) values are ignored.
+
+    Parameters
+    ----------
+    bin_edges : np.ndarray, optional
+        Of shape (num_bands, num_bins + 1). By default `get_default_bin_edges()`. Only
+        statistics with the same edges can be merged.
+
+    Attributes
+    ----------
+    count : np.ndarray of int
+    mean : np.ndarray of float
+    sum_squares : np.ndarray of float
+        Sum of the squared deviations from the mean.
+    minimum : np.ndarray of float
+    maximum : np.ndarray of float
+        Each of shape (num_bands,).
+    histogram : np.ndarray of int
+        Of shape (num_bands, num_bins).
+    """
+
+    FIELDS = (
+        "count",
+        "mean",
+        "sum_squares",
+        "minimum",
+        "maximum",
+        "histogram",
+        "bin_edges",
+    )
+
+    def __init__(self, bin_edges=None):
+        self.bin_edges = np.asarray(
+            bin_edges if bin_edges is not None else get_default_bin_edges(),
+            dtype=np.float64,
+        )
+        num_bands, num_bins = self.bin_edges.shape[0], self.bin_edges.shape[1] - 1
+        self.count = np.zeros(num_bands, dtype=np.int64)
+        self.mean = np.zeros(num_bands)
+        self.sum_squares = np.zeros(num_bands)
+        self.minimum = np.full(num_bands, np.inf)
+        self.maximum = np.full(num_bands, -np.inf)
+        self.histogram = np.zeros((num_bands, num_bins), dtype=np.int64)
+
+    def __eq__(self, other):
+        """Compare every field, including the histogram bins."""
+        return isinstance(other, RunningStatistics) and all(
+            np.array_equal(getattr(self, field), getattr(other, field))
+            for field in self.FIELDS
+        )
+
+    def __repr__(self):
+        """Summarize the count, mean and standard deviation of each band."""
+        return (
+            f"RunningStatistics(count={self.count.tolist()}, mean={self.mean.tolist()}, "
+            f"std={self.std.tolist()})"
+        )
+
+    @property
+    def variance(self):
+        """Compute the population variance of each band, `np.nan` for empty bands."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 0, self.sum_squares / self.count, np.nan)
+
+    @property
+    def std(self):
+        """Compute the population standard deviation of each band, as `band.normalize`."""
+        return np.sqrt(self.variance)
+
+    @instrumentation.timed("statistics")
+    def update(self, data):
+        """Add the values of `data` to the statistics.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Of shape (num_bands, ...), e.g. as returned by `calibrate_scan`.
+
+        Returns
+        -------
+        RunningStatistics
+            self
+        """
+        if data.shape[0] != len(self.count):
+            raise ValueError(f"Expected {len(self.count)} bands. Got {data.shape[0]}.")
+        batch = RunningStatistics(bin_edges=self.bin_edges)
+        for index, band in enumerate(data):
+            values = np.asarray(band, dtype=np.float64).ravel()
+            values = values[np.isfinite(values)]
+            if values.size == 0:
+                continue
+            edges = self.bin_edges[index]
+            batch.count[index] = values.size
+            batch.mean[index] = values.mean()
+            batch.sum_squares[index] = np.square(values - batch.mean[index]).sum()
+            batch.minimum[index] = values.min()
+            batch.maximum[index] = values.max()
+            batch.histogram[index] = np.histogram(
+                np.clip(values, edges[0], edges[-1]), bins=edges
+            )[0]
+        return self.merge(batch)
+
+    def merge(self, other):
+        """Add the statistics of `other` to these statistics.
+
+        Parameters
+        ----------
+        other : RunningStatistics
+
+        Returns
+        -------
+        RunningStatistics
+            self
+        """
+        if not np.array_equal(self.bin_edges, other.bin_edges):
+            raise ValueError("Cannot merge statistics with different histogram bins.")
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.where(count > 0, other.count / count, 0.0)
+        self.sum_squares = (
+            self.sum_squares + other.sum_squares + np.square(delta) * self.count * ratio
+        )
+        self.mean = self.mean + delta * ratio
+        self.count = count
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.histogram = self.histogram + other.histogram
+        return self
+
+    def normalize(self, data):
+        """Center and scale each band of `data` by these statistics.
+
+        Bands of zero (or unknown) standard deviation are only centered, rather than
+        divided by zero.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Of shape (num_bands, ...).
+
+        Returns
+        -------
+        np.ndarray
+            Of the shape of `data`, in the dtype of `wildfire.precision`.
+        """
+        shape = (-1,) + (1,) * (data.ndim - 1)
+        dtype = precision.get_dtype()
+        with np.errstate(invalid="ignore"):
+            std = np.where(self.std > 0, self.std, 1.0)
+        return (data - self.mean.astype(dtype).reshape(shape)) / std.astype(
+            dtype
+        ).reshape(shape)
+
+    def to_dict(self):
+        """Represent the statistics with lists, e.g. to persist them as JSON."""
+        return {field: getattr(self, field).tolist() for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, dictionary):
+        """Inverse of `to_dict`."""
+        running_statistics = cls(bin_edges=dictionary["bin_edges"])
+        for field in cls.FIELDS:
+            setattr(
+                running_statistics,
+                field,
+                np.asarray(
+                    dictionary[field], dtype=getattr(running_statistics, field).dtype
+                ),
+            )
+        return running_statistics
+
+
+def calibrate_scan(goes_scan):
+    """Rescale each band of a scan to 2km, in the units of `GoesBand.parse`.
+
+    Parameters
+    ----------
+    goes_scan : wildfire.data.goes_level_1.GoesScan
+
+    Returns
+    -------
+    np.ndarray
+        Of shape (16, y, x), in the dtype of `wildfire.precision`.
+    """
+    return np.stack(
+        [
+            band.rescale_to_2km().parse().values.astype(precision.get_dtype(), copy=False)
+            for _, band in goes_scan.iteritems()
+        ]
+    )
+
+
+def get_scan_statistics(filepaths):
+    """Compute the statistics of one scan.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        Must be a set of 16 files, which together define the 16 bands of a complete scan.
+
+    Returns
+    -------
+    tuple of (str, RunningStatistics) | None
+        The region of the scan and its statistics, or `None` if the scan is malformed.
+    """
+    try:
+        goes_scan = goes_level_1.scan.read_netcdfs(
+            local_filepaths=filepaths, max_workers=1
+        )
+    except ValueError as error_message:
+        _logger.warning(
+            "\nSkipping malformed goes_scan comprised of %s.\nError: %s",
+            filepaths,
+            error_message,
+        )
+        return None
+    statistics = RunningStatistics().update(calibrate_scan(goes_scan))
+    goes_scan.release()
+    return goes_scan.region, statistics
+
+
+def merge_statistics(statistics, other):
+    """Merge the statistics of `other` into `statistics`, group by group.
+
+    Parameters
+    ----------
+    statistics : dict
+        Of the form {group: RunningStatistics}. Updated in place.
+    other : dict
+        Of the same form.
+
+    Returns
+    -------
+    dict
+        `statistics`
+    """
+    for group, running_statistics in other.items():
+        if group in statistics:
+            statistics[group].merge(running_statistics)
+        else:
+            statistics[group] = RunningStatistics(
+                bin_edges=running_statistics.bin_edges
+            ).merge(running_statistics)
+    return statistics
+
+
+def _get_chunk_statistics(scan_filepaths, by_region):
+    statistics = {}
+    for filepaths in scan_filepaths:
+        scan_statistics = get_scan_statistics(filepaths=filepaths)
+        if scan_statistics is None:
+            continue
+        region, running_statistics = scan_statistics
+        groups = {GLOBAL: running_statistics}
+        if by_region:
+            groups[region] = running_statistics
+        merge_statistics(statistics, groups)
+    return statistics
+
+
+def compute_statistics(scan_filepaths, by_region=False, pbs=False, **cluster_kwargs):
+    """Compute the statistics of each band over many scans.
+
+    Parameters
+    ----------
+    scan_filepaths : list of list of str
+        As returned by `goes_level_1.utilities.group_filepaths_into_scans`.
+    by_region : bool, optional
+        Whether to also compute the statistics of each region, by default False.
+    pbs : bool, optional
+        Whether or not to launch and parallize using PBS, by default False
+
+    Returns
+    -------
+    dict
+        Of the form {group: RunningStatistics}, where `group` is `GLOBAL`, or a region.
+    """
+    scans_per_chunk = max(1, math.ceil(len(scan_filepaths) / MAX_CHUNKS))
+    chunks = [
+        scan_filepaths[start : start + scans_per_chunk]
+        for start in range(0, len(scan_filepaths), scans_per_chunk)
+    ]
+    _logger.info(
+        "Computing the statistics of %d scans in %d chunks...",
+        len(scan_filepaths),
+        len(chunks),
+    )
+    memory = max(
+        (
+            goes_level_1.utilities.estimate_scan_memory(
+                region=goes_level_1.utilities.parse_filename(filepaths[0])[0],
+                num_copies=PROCESSING_COPIES,
+            )
+            for filepaths in scan_filepaths
+        ),
+        default=None,
+    )
+
+    statistics = {}
+    for chunk_statistics in multiprocessing.map_function(
+        function=_get_chunk_statistics,
+        function_args=[chunks, [by_region] * len(chunks)],
+        pbs=pbs,
+        batch_size=None,
+        memory=memory,
+        retries=RETRIES,
+        **cluster_kwargs,
+    ):
+        merge_statistics(statistics, chunk_statistics)
+    _logger.info("Computed statistics: %s", statistics.get(GLOBAL))
+    return statistics
+
+
+def save_statistics(statistics, filepath):
+    """Persist statistics as JSON.
+
+    Parameters
+    ----------
+    statistics : dict
+        Of the form {group: RunningStatistics}.
+    filepath : str
+    """
+    with open(filepath, "w") as buffer:
+        json.dump(
+            {
+                group: running_statistics.to_dict()
+                for group, running_statistics in statistics.items()
+            },
+            buffer,
+        )
+
+
+@functools.lru_cache(maxsize=4)
+def load_statistics(filepath):
+    """Load statistics persisted with `save_statistics`, once per process.
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    dict
+        Of the form {group: RunningStatistics}.
+    """
+    with open(filepath) as buffer:
+        return {
+            group: RunningStatistics.from_dict(dictionary)
+            for group, dictionary in json.load(buffer).items()
+        }
+
+
+def select_statistics(statistics, region):
+    """Get the statistics of `region`, or of the whole archive if there are none.
+
+    Parameters
+    ----------
+    statistics : dict
+        Of the form {group: RunningStatistics}.
+    region : str
+
+    Returns
+    -------
+    RunningStatistics
+    """
+    if region in statistics:
+        return statistics[region]
+    return statistics[GLOBAL]
@@ -1,14 +1,25 @@
 """Create and load data to be used by the CNNs."""
 import datetime
 import glob
+import itertools
 import logging
 import os
 
 import numpy as np
 import xarray as xr
 
-from wildfire import multiprocessing
-from wildfire.data import goes_level_2
+from wildfire import instrumentation, multiprocessing, precision
+from wildfire.data import goes_level_1, goes_level_2
+from wildfire.models.threshold_model import goes_level_1_wildfires
+from . import normalization
+
+# float64 copies of a scan made by `process_file`: the rescaled bands, the stacked data
+# and its patches
+PROCESSING_COPIES = 4
+# retries of a file whose processing raised, e.g. on a transient read error
+RETRIES = 2
+# most patches without fire kept per scan, whatever the size of the scene
+DEFAULT_MAX_NEGATIVES = 256
 
 _logger = logging.getLogger(__name__)
 
@@ -42,6 +53,180 @@ def get_patch_indices(max_index, length, stride):
     return np.append(indices, [last_patch])
 
 
+def get_tile_indices(shape, height, width, stride):
+    """Get the top left corner of each patch of an image of `shape`.
+
+    Patches are in the same order as those of `extract_patches_2d`.
+
+    Parameters
+    ----------
+    shape : tuple of int
+    height : int
+    width : int
+    stride : int
+
+    Returns
+    -------
+    list of tuple of (int, int)
+    """
+    return list(
+        itertools.product(
+            get_patch_indices(max_index=shape[0], length=height, stride=stride),
+            get_patch_indices(max_index=shape[1], length=width, stride=stride),
+        )
+    )
+
+
+def count_tiles(mask, tile_indices, height, width):
+    """Count the pixels of `mask` that are True in each tile.
+
+    Uses the integral image of `mask`, so that each tile costs the same however large.
+
+    Parameters
+    ----------
+    mask : np.ndarray of bool
+        2 dimensional.
+    tile_indices : list of tuple of (int, int)
+        As returned by `get_tile_indices`.
+    height : int
+    width : int
+
+    Returns
+    -------
+    np.ndarray of int
+    """
+    integral = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    integral[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+    rows, columns = np.asarray(tile_indices, dtype=np.int64).reshape(-1, 2).T
+    return (
+        integral[rows + height, columns + width]
+        - integral[rows, columns + width]
+        - integral[rows + height, columns]
+        + integral[rows, columns]
+    )
+
+
+class ReservoirSampler:  # pylint: disable=too-few-public-methods
+    """Uniform random sample of at most `size` items of a stream of unknown length.
+
+    Implements Algorithm R, keeping only the sample in memory.
+
+    Parameters
+    ----------
+    size : int
+    random_state : np.random.RandomState, optional
+    """
+
+    def __init__(self, size, random_state=None):
+        self.size = size
+        self.random_state = (
+            random_state if random_state is not None else np.random.RandomState()
+        )
+        self.items = []
+        self.num_seen = 0
+
+    def add(self, item):
+        """Offer `item` to the sample."""
+        self.num_seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+            return
+        index = self.random_state.randint(self.num_seen)
+        if index < self.size:
+            self.items[index] = item
+
+
+def sample_tiles(  # pylint: disable=too-many-locals
+    is_fire,
+    height,
+    width,
+    stride,
+    negative_ratio=0.0,
+    max_negatives=DEFAULT_MAX_NEGATIVES,
+    min_negatives=0,
+    strata=None,
+    random_state=None,
+):
+    """Select the patches of a scan to keep as training data.
+
+    Every patch with a fire is kept, along with a uniform random sample of the patches
+    without one, of `negative_ratio` negatives per fire patch, but at least
+    `min_negatives`, so that scans without fire contribute backgrounds, and at most
+    `max_negatives`.
+    With `strata`, negatives are sampled evenly from each combination of strata (e.g.
+    cloudy water at night), so that rare backgrounds are represented.
+
+    Parameters
+    ----------
+    is_fire : np.ndarray of bool
+        Whether each pixel of the scan is a fire.
+    height : int
+    width : int
+    stride : int
+    negative_ratio : float, optional
+        By default 0, which keeps only patches with fires.
+    max_negatives : int, optional
+        Most negative patches kept, by default `DEFAULT_MAX_NEGATIVES`.
+    min_negatives : int, optional
+        Fewest negative patches kept, whatever the number of patches with fires, by
+        default 0.
+    strata : dict, optional
+        Of the form {name: np.ndarray of bool} of the shape of `is_fire`. A patch is in a
+        stratum if most of its pixels are.
+    random_state : np.random.RandomState, optional
+
+    Returns
+    -------
+    tuple of (list, list)
+        The top left corners of the patches with fires, and of the sampled negatives,
+        each in the order of `get_tile_indices`.
+    """
+    random_state = random_state if random_state is not None else np.random.RandomState()
+    tile_indices = get_tile_indices(
+        shape=is_fire.shape, height=height, width=width, stride=stride
+    )
+    has_fire = count_tiles(is_fire, tile_indices, height=height, width=width) > 0
+    positives = [tile for tile, fire in zip(tile_indices, has_fire) if fire]
+
+    num_negatives = min(
+        max(int(round(negative_ratio * len(positives))), min_negatives), max_negatives
+    )
+    if num_negatives <= 0:
+        return positives, []
+
+    tile_strata = np.zeros(len(tile_indices), dtype=np.int64)
+    for bit, mask in enumerate((strata or {}).values()):
+        is_mostly = 2 * count_tiles(mask, tile_indices, height, width) > height * width
+        tile_strata |= is_mostly.astype(np.int64) << bit
+
+    reservoirs = {}
+    for tile, fire, stratum in zip(tile_indices, has_fire, tile_strata):
+        if not fire:
+            reservoirs.setdefault(
+                stratum, ReservoirSampler(size=num_negatives, random_state=random_state)
+            ).add(tile)
+
+    # share the negatives evenly between strata, giving the shares of small strata to
+    # the others
+    samples = [reservoir.items for reservoir in reservoirs.values()]
+    quotas = [0] * len(samples)
+    remaining = num_negatives
+    while remaining > 0 and any(
+        quota < len(sample) for quota, sample in zip(quotas, samples)
+    ):
+        for index, sample in enumerate(samples):
+            if remaining > 0 and quotas[index] < len(sample):
+                quotas[index] += 1
+                remaining -= 1
+
+    negatives = []
+    for quota, sample in zip(quotas, samples):
+        chosen = random_state.choice(len(sample), size=quota, replace=False)
+        negatives.extend(sample[index] for index in chosen)
+    return positives, sorted(negatives)
+
+
+@instrumentation.timed("patches")
 def extract_patches_2d(arr, height, width, stride):
     """Extract 2d patches from array.
 
@@ -74,13 +259,53 @@ def extract_patches_2d(arr, height, width, stride):
     return np.array(patches)
 
 
-def process_file(
-    level_2_filepath, level_1_directory, height, width, stride, persist_directory
+def normalize_scan(goes_scan, statistics=None):
+    """Rescale each band of a scan to 2km and normalize it, as input to the DNN.
+
+    Parameters
+    ----------
+    goes_scan : wildfire.data.goes_level_1.GoesScan
+    statistics : wildfire.models.dnn.normalization.RunningStatistics, optional
+        Statistics of the archive with which to normalize the scan. By default `None`,
+        which normalizes each band with its own mean and standard deviation.
+
+    Returns
+    -------
+    np.ndarray
+        Of shape (16, y, x), in the dtype of `wildfire.precision`.
+    """
+    if statistics is not None:
+        return statistics.normalize(normalization.calibrate_scan(goes_scan=goes_scan))
+    return np.stack(
+        [
+            band.rescale_to_2km()
+            .normalize()
+            .values.astype(precision.get_dtype(), copy=False)
+            for _, band in goes_scan.iteritems()
+        ]
+    )
+
+
+def process_file(  # pylint: disable=too-many-arguments,too-many-locals
+    level_2_filepath,
+    level_1_directory,
+    height,
+    width,
+    stride,
+    persist_directory,
+    return_data=True,
+    negative_ratio=0.0,
+    max_negatives=DEFAULT_MAX_NEGATIVES,
+    min_negatives=0,
+    stratify=False,
+    seed=None,
+    statistics_filepath=None,
 ):
     """Create training data from a GOES level 2 fire dataset.
 
     For a given GOES L2 fire product, find the accompanying GOES L1 data, and return the
-    pixels with fire in it.
+    pixels with fire in it, along with a sample of patches without fire (see
+    `sample_tiles`). Only the kept patches are copied out of the scan.
 
     Parameters
     ----------
@@ -89,66 +314,130 @@ def process_file(
     height : int
     width : int
     stride : int
+    persist_directory : str
+    return_data : bool, optional
+        Whether to return the training data, by default True. If False, only return
+        metadata about the persisted file, which keeps the cost of gathering results
+        from workers constant per task.
+    negative_ratio : float, optional
+        Number of patches without fire to keep per patch with fire, by default 0.
+    max_negatives : int, optional
+        Most patches without fire to keep, by default `DEFAULT_MAX_NEGATIVES`.
+    min_negatives : int, optional
+        Fewest patches without fire to keep, even from a scan without fire, by default 0.
+    stratify : bool, optional
+        Whether to sample patches without fire evenly from the cloud, water and night
+        pixels of the threshold model, by default False.
+    seed : int, optional
+        Seed of the sampling of patches without fire, by default `None`.
+    statistics_filepath : str, optional
+        Statistics persisted by `normalization.save_statistics` with which to normalize
+        the scan. By default `None`, which normalizes the scan with its own statistics.
 
     Returns
     -------
-    array-like
-        shape: (num_fire_patches, height, width, 17)
+    xr.core.dataset.Dataset | dict
+        If `return_data`, the training data with `abi` of shape
+        (num_patches, height, width, 16) and `fire_temp` of shape
+        (num_patches, height, width), where `fire_temp` is all `np.nan` for patches
+        without fire. Otherwise a dictionary of the form:
+        {
+            "level_2_filepath": str,
+            "persist_filepath": str,
+            "num_patches": int
+        }
     """
     _logger.info("Processing %s...", level_2_filepath)
 
     level_2 = xr.load_dataset(level_2_filepath)
     level_1 = goes_level_2.utilities.match_level_1(
-        level_2=level_2, level_1_directory=level_1_directory
-    )
-
-    two_km_coords = {
-        "x": level_1["band_16"].dataset.x.values,
-        "y": level_1["band_16"].dataset.y.values,
-    }
-
-    level_1 = xr.concat(
-        objs=[
-            band.rescale_to_2km().normalize().assign_coords(**two_km_coords)
-            for _, band in level_1.iteritems()
-        ],
-        dim="band",
+        level_2=level_2, level_1_directory=level_1_directory, max_workers=1
     )
 
+    statistics = None
+    if statistics_filepath is not None:
+        statistics = normalization.select_statistics(
+            normalization.load_statistics(statistics_filepath), region=level_1.region
+        )
     # shape = (x, y, 17)
     data = np.concatenate(
-        [level_1.values, np.expand_dims(level_2.Temp.values, axis=0)]
+        [
+            normalize_scan(goes_scan=level_1, statistics=statistics),
+            np.expand_dims(level_2.Temp.values, axis=0).astype(
+                precision.get_dtype(), copy=False
+            ),
+        ],
+        axis=0,
     ).transpose([1, 2, 0])
 
-    # shape = (num_patches, height, width, 17)
-    data = extract_patches_2d(arr=data, height=height, width=width, stride=stride)
-    fire_indices = np.any(np.isfinite(data[:, :, :, -1]), axis=(1, 2))
-
-    # shape = (num_fire_pathces, height, width, 17)
-    data = data[fire_indices]
+    strata = None
+    if stratify:
+        model_features = goes_level_1_wildfires.get_model_features(goes_scan=level_1)
+        strata = {
+            "cloud": model_features.is_cloud,
+            "water": model_features.is_water,
+            "night": model_features.is_night,
+        }
+    level_1.release()
+    with instrumentation.timer("patches"):
+        positives, negatives = sample_tiles(
+            is_fire=np.isfinite(data[:, :, -1]),
+            height=height,
+            width=width,
+            stride=stride,
+            negative_ratio=negative_ratio,
+            max_negatives=max_negatives,
+            min_negatives=min_negatives,
+            strata=strata,
+            random_state=np.random.RandomState(seed),
+        )
+        # shape = (num_patches, height, width, 17)
+        num_channels = data.shape[-1]  # pylint: disable=unsubscriptable-object
+        patches = np.empty(
+            (len(positives) + len(negatives), height, width, num_channels),
+            dtype=data.dtype,
+        )
+        for index, (row, column) in enumerate(positives + negatives):
+            patches[index] = data[row : row + height, column : column + width]
 
     now = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
     basename = os.path.basename(level_2_filepath)
     persist_filepath = os.path.join(persist_directory, f"cnn_training_c{now}_{basename}")
 
-    data = xr.Dataset(
+    dataset = xr.Dataset(
         {
-            "abi": xr.DataArray(data[:, :, :, :-1].astype(np.float32)),
-            "fire_temp": xr.DataArray(data[:, :, :, -1].astype(np.float32)),
+            "abi": xr.DataArray(patches[:, :, :, :-1].astype(np.float32, copy=False)),
+            "fire_temp": xr.DataArray(
+                patches[:, :, :, -1].astype(np.float32, copy=False)
+            ),
         }
     )
-    data.to_netcdf(persist_filepath)
+    with instrumentation.timer("persist"):
+        dataset.to_netcdf(persist_filepath)
+    instrumentation.add_bytes("persist", os.path.getsize(persist_filepath))
     _logger.info("Saved training data to file: %s", persist_filepath)
-    return data
+    if return_data:
+        return dataset
+    return {
+        "level_2_filepath": level_2_filepath,
+        "persist_filepath": persist_filepath,
+        "num_patches": dataset.abi.shape[0],
+    }
 
 
-def create_goes_level_2_training_data(
+def create_goes_level_2_training_data(  # pylint: disable=too-many-arguments,too-many-locals
     level_2_directory,
     level_1_directory,
     persist_directory,
     height,
     width,
     stride,
+    negative_ratio=0.0,
+    max_negatives=DEFAULT_MAX_NEGATIVES,
+    min_negatives=0,
+    stratify=False,
+    seed=None,
+    statistics_filepath=None,
     pbs=False,
     **cluster_kwargs,
 ):
@@ -162,9 +451,23 @@ def create_goes_level_2_training_data(
     height : int
     width : int
     stride : int
+    negative_ratio : float, optional
+        See `process_file`, by default 0.
+    max_negatives : int, optional
+        See `process_file`, by default `DEFAULT_MAX_NEGATIVES`.
+    min_negatives : int, optional
+        See `process_file`, by default 0.
+    stratify : bool, optional
+        See `process_file`, by default False.
+    seed : int, optional
+        Seed of the sampling of the first file, incremented for each following file, by
+        default `None`.
+    statistics_filepath : str, optional
+        See `process_file`, by default `None`.
     """
-    goes_l2_filepaths = glob.glob(
-        os.path.join(level_2_directory, "**", "*.nc"), recursive=True
+    # sorted, so that the files and their seeds are paired the same on every run
+    goes_l2_filepaths = sorted(
+        glob.glob(os.path.join(level_2_directory, "**", "*.nc"), recursive=True)
     )
 
     num_filepaths = len(goes_l2_filepaths)
@@ -173,7 +476,7 @@ def create_goes_level_2_training_data(
         num_filepaths,
         os.cpu_count(),
     )
-    multiprocessing.map_function(
+    processed = multiprocessing.map_function(
         function=process_file,
         function_args=[
             goes_l2_filepaths,
@@ -182,8 +485,30 @@ def create_goes_level_2_training_data(
             [width] * num_filepaths,
             [stride] * num_filepaths,
             [persist_directory] * num_filepaths,
+            [False] * num_filepaths,
+            [negative_ratio] * num_filepaths,
+            [max_negatives] * num_filepaths,
+            [min_negatives] * num_filepaths,
+            [stratify] * num_filepaths,
+            [None if seed is None else seed + index for index in range(num_filepaths)],
+            [statistics_filepath] * num_filepaths,
         ],
         pbs=pbs,
+        memory=max(
+            (
+                goes_level_1.utilities.estimate_scan_memory(
+                    region=goes_level_2.utilities.get_region(filepath),
+                    num_copies=PROCESSING_COPIES,
+                )
+                for filepath in goes_l2_filepaths
+            ),
+            default=None,
+        ),
+        retries=RETRIES,
         **cluster_kwargs,
     )
-    _logger.info("Saved training data to directory: %s", persist_directory)
+    _logger.info(
+        "Saved %d patches of training data to directory: %s",
+        sum(metadata["num_patches"] for metadata in processed),
+        persist_directory,
+    )
@@ -1,10 +1,16 @@
 """Threshold model for detecting wildfires."""
 from .model import (
+    DEFAULT_THRESHOLDS,
+    Features,
     ModelFeatures,
+    Thresholds,
+    classify,
+    get_features,
     is_cloud_pixel,
     is_night_pixel,
     is_hot_pixel,
     is_water_pixel,
     predict,
 )
-from .goes_level_1_wildfires import label_wildfires
+from .goes_level_1_wildfires import label_wildfires, watch_wildfires
+from . import climatology, evaluation
@@ -0,0 +1,608 @@
+"""Per-pixel climatology of the background of GOES scans, to score anomalies.
+
+The threshold model compares each pixel to the rest of its scene, so that persistently
+hot surfaces (e.g. deserts in the afternoon) look like fires, and small fires in hot
+scenes are missed. A `Climatology` keeps, for each pixel of a satellite and region and
+each hour of the day (UTC), the running mean and variance of:
+    band_7
+        The brightness temperature at 3.89 micrometers.
+    band_7_14
+        The difference of the brightness temperatures at 3.89 and 11.19 micrometers.
+
+Statistics are updated one scan at a time with Welford's algorithm, and stored as
+memory-mapped .npy files of shape (hour bin, [variable,] y, x), so that the pixels of one
+hour bin are contiguous. Updating or scoring a scan only touches its hour bin, in
+O(pixels).
+
+`update_climatology` splits the scans of each hour bin into tasks, each of which
+accumulates its scans into partial statistics in a file of its own. The client then
+merges the partial statistics into the climatology with Chan et al.'s parallel algorithm,
+so that only the client writes to the climatology, and tasks can be retried. The start
+times of the scans added are kept with the climatology, so that scans already in it are
+skipped when they are added again.
+
+Mesoscale sectors (M1, M2) move with the weather, so their climatology is only meaningful
+over periods in which the sector was fixed.
+
+Examples
+--------
+```
+climatology.update_climatology(scan_filepaths, "./climatology", "noaa-goes17", "C")
+store = climatology.load_climatology("./climatology", "noaa-goes17", "C")
+anomaly = store.score_scan(goes_scan)  # z-scores of band_7 and band_7_14
+```
+"""
+from collections import defaultdict, namedtuple
+import functools
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from wildfire import instrumentation, multiprocessing
+from wildfire.data import goes_level_1
+
+VARIABLES = ("band_7", "band_7_14")
+NUM_HOUR_BINS = 24
+# fewest scans in an hour bin for the climatology of a pixel to be used
+DEFAULT_MIN_COUNT = 10
+# z-score of both variables above which a pixel is anomalous
+DEFAULT_ANOMALY_SIGMA = 3.0
+FILENAME = "climatology_{satellite}_{region}_{name}.npy"
+# scans accumulated by each task of `update_climatology`
+DEFAULT_SCANS_PER_TASK = 32
+# retries of a task of `update_climatology` that raised
+RETRIES = 2
+
+Anomaly = namedtuple("Anomaly", VARIABLES)
+
+_logger = logging.getLogger(__name__)
+
+
+def get_hour_bin(scan_time_utc, num_hour_bins=NUM_HOUR_BINS):
+    """Get the hour of day bin of a scan.
+
+    Parameters
+    ----------
+    scan_time_utc : datetime.datetime
+    num_hour_bins : int, optional
+        By default `NUM_HOUR_BINS`.
+
+    Returns
+    -------
+    int
+    """
+    return (scan_time_utc.hour * 60 + scan_time_utc.minute) * num_hour_bins // (24 * 60)
+
+
+def get_values(goes_scan):
+    """Get the variables of the climatology of a scan.
+
+    Parameters
+    ----------
+    goes_scan : wildfire.data.goes_level_1.GoesScan
+
+    Returns
+    -------
+    np.ndarray of float32
+        Of shape (len(VARIABLES), y, x) at 2km.
+    """
+    rescaled_scan = goes_scan.rescale_to_2km()
+    brightness_temperature_3_89 = rescaled_scan["band_7"].brightness_temperature.data
+    brightness_temperature_11_19 = rescaled_scan["band_14"].brightness_temperature.data
+    return np.stack(
+        [
+            brightness_temperature_3_89,
+            brightness_temperature_3_89 - brightness_temperature_11_19,
+        ]
+    ).astype(np.float32, copy=False)
+
+
+class Climatology:
+    """Running mean and variance of each pixel by hour of day, in memory-mapped files.
+
+    Use `create` to make a new climatology.
+
+    Parameters
+    ----------
+    directory : str
+    satellite : str
+        Must be either "noaa-goes16" or "noaa-goes17".
+    region : str
+        Must be one of ("M1", "M2", "C", "F").
+    mode : str, optional
+        Mode of `np.load`, by default "r". Must be "r+" to update the climatology.
+
+    Attributes
+    ----------
+    count : np.ndarray of int32
+        Of shape (num_hour_bins, y, x).
+    mean : np.ndarray of float32
+    sum_squares : np.ndarray of float32
+        Sum of the squared deviations from the mean. Both of shape
+        (num_hour_bins, len(VARIABLES), y, x).
+    scan_times : np.ndarray of datetime64[ms]
+        Sorted start times of the scans added by `update_scan` or `update_climatology`.
+    """
+
+    ARRAYS = ("count", "mean", "sum_squares")
+
+    def __init__(self, directory, satellite, region, mode="r"):
+        self.directory = directory
+        self.satellite = satellite
+        self.region = region
+        self.mode = mode
+        for name in self.ARRAYS:
+            setattr(
+                self,
+                name,
+                np.load(
+                    self.get_filepath(directory, satellite, region, name), mmap_mode=mode
+                ),
+            )
+        self.scan_times = np.load(
+            self.get_filepath(directory, satellite, region, "scan_times")
+        )
+
+    def __repr__(self):
+        """Summarize the satellite, region and shape of the climatology."""
+        return (
+            f"Climatology(satellite={self.satellite}, region={self.region}, "
+            f"shape={self.shape}, num_hour_bins={self.num_hour_bins})"
+        )
+
+    @property
+    def shape(self):
+        """Shape (y, x) of the scans of the climatology."""
+        return self.count.shape[1:]
+
+    @property
+    def num_hour_bins(self):
+        """Count the hour of day bins."""
+        return self.count.shape[0]
+
+    @staticmethod
+    def get_filepath(directory, satellite, region, name):
+        """Get the filepath of an array, or of the scan times, of a climatology."""
+        return os.path.join(
+            directory, FILENAME.format(satellite=satellite, region=region, name=name)
+        )
+
+    @classmethod
+    def create(
+        cls, directory, satellite, region, shape=None, num_hour_bins=NUM_HOUR_BINS
+    ):
+        """Create an empty climatology, overwriting any in `directory`.
+
+        Parameters
+        ----------
+        directory : str
+        satellite : str
+        region : str
+        shape : tuple of int, optional
+            By default that of `region` at 2km. See
+            `goes_level_1.utilities.REGION_SHAPES`.
+        num_hour_bins : int, optional
+            By default `NUM_HOUR_BINS`.
+
+        Returns
+        -------
+        Climatology
+            Opened for updates.
+        """
+        shape = tuple(shape or goes_level_1.utilities.REGION_SHAPES[region])
+        for name, dtype, array_shape in (
+            ("count", np.int32, (num_hour_bins,) + shape),
+            ("mean", np.float32, (num_hour_bins, len(VARIABLES)) + shape),
+            ("sum_squares", np.float32, (num_hour_bins, len(VARIABLES)) + shape),
+        ):
+            # zero filled, without writing the zeros
+            array = np.lib.format.open_memmap(
+                cls.get_filepath(directory, satellite, region, name),
+                mode="w+",
+                dtype=dtype,
+                shape=array_shape,
+            )
+            del array
+        _save_atomically(
+            cls.get_filepath(directory, satellite, region, "scan_times"),
+            np.array([], dtype="datetime64[ms]"),
+        )
+        _logger.info("Created climatology of %s %s in %s", satellite, region, directory)
+        return cls(directory=directory, satellite=satellite, region=region, mode="r+")
+
+    def _check_shape(self, values):
+        if values.shape != (len(VARIABLES),) + self.shape:
+            raise ValueError(
+                f"Expected values of shape {(len(VARIABLES),) + self.shape}. "
+                f"Got {values.shape}."
+            )
+
+    @instrumentation.timed("climatology")
+    def update(self, values, hour_bin):
+        """Add the values of a scan to the climatology of its hour bin.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Of shape (len(VARIABLES), y, x), as returned by `get_values`. Pixels at which
+            any variable is `np.nan` are not updated.
+        hour_bin : int
+        """
+        self._check_shape(values)
+        _update(
+            count=self.count[hour_bin],
+            mean=self.mean[hour_bin],
+            sum_squares=self.sum_squares[hour_bin],
+            values=values,
+        )
+
+    @instrumentation.timed("climatology")
+    def merge(self, count, mean, sum_squares, hour_bin):
+        """Add partial statistics to the climatology of an hour bin.
+
+        Parameters
+        ----------
+        count : np.ndarray
+            Of shape (y, x).
+        mean : np.ndarray
+        sum_squares : np.ndarray
+            Of shape (len(VARIABLES), y, x), e.g. accumulated by `_update`.
+        hour_bin : int
+        """
+        self._check_shape(mean)
+        total = self.count[hour_bin] + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.where(total > 0, count / np.maximum(total, 1), 0).astype(
+                np.float32
+            )
+        delta = mean - self.mean[hour_bin]
+        self.sum_squares[hour_bin] += (
+            sum_squares + np.square(delta) * self.count[hour_bin] * ratio
+        )
+        self.mean[hour_bin] += delta * ratio
+        self.count[hour_bin] = total
+
+    def has_scan(self, scan_time_utc):
+        """Check whether the scan that started at `scan_time_utc` was added."""
+        index = np.searchsorted(self.scan_times, np.datetime64(scan_time_utc, "ms"))
+        return bool(
+            index < len(self.scan_times)
+            and self.scan_times[index] == np.datetime64(scan_time_utc, "ms")
+        )
+
+    def add_scan_times(self, scan_times_utc):
+        """Record the start times of scans added to the climatology.
+
+        They are written to disk by `flush`.
+
+        Parameters
+        ----------
+        scan_times_utc : list of datetime.datetime
+        """
+        self.scan_times = np.union1d(
+            self.scan_times, np.array(scan_times_utc, dtype="datetime64[ms]")
+        )
+
+    def update_scan(self, goes_scan):
+        """Add a scan to the climatology of its hour bin, unless it was already added.
+
+        Returns
+        -------
+        bool
+            Whether the scan was added.
+        """
+        if self.has_scan(goes_scan.scan_time_utc):
+            _logger.info("Skipping scan of %s already added.", goes_scan.scan_time_utc)
+            return False
+        self.update(
+            values=get_values(goes_scan=goes_scan),
+            hour_bin=get_hour_bin(goes_scan.scan_time_utc, self.num_hour_bins),
+        )
+        self.add_scan_times([goes_scan.scan_time_utc])
+        return True
+
+    @instrumentation.timed("climatology")
+    def score(self, values, hour_bin, min_count=DEFAULT_MIN_COUNT):
+        """Score the departure of each pixel of a scan from its climatology.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Of shape (len(VARIABLES), y, x), as returned by `get_values`.
+        hour_bin : int
+        min_count : int, optional
+            Fewest values for the climatology of a pixel to be used, by default
+            `DEFAULT_MIN_COUNT`.
+
+        Returns
+        -------
+        np.ndarray of float32
+            Of the shape of `values`, the z-score of each variable at each pixel. `np.nan`
+            where there is not enough history.
+        """
+        self._check_shape(values)
+        count = np.asarray(self.count[hour_bin])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self.sum_squares[hour_bin] / count)
+            scores = (values - self.mean[hour_bin]) / std
+        scores[:, count < min_count] = np.nan
+        return scores
+
+    def score_scan(self, goes_scan, min_count=DEFAULT_MIN_COUNT):
+        """Score a scan against the climatology of its hour bin.
+
+        Parameters
+        ----------
+        goes_scan : wildfire.data.goes_level_1.GoesScan
+        min_count : int, optional
+            By default `DEFAULT_MIN_COUNT`.
+
+        Returns
+        -------
+        Anomaly
+            Namedtuple of the z-scores of each variable. See `score`.
+        """
+        return Anomaly(
+            *self.score(
+                values=get_values(goes_scan=goes_scan),
+                hour_bin=get_hour_bin(goes_scan.scan_time_utc, self.num_hour_bins),
+                min_count=min_count,
+            )
+        )
+
+    def is_anomalous(
+        self, goes_scan, anomaly_sigma=DEFAULT_ANOMALY_SIGMA, min_count=DEFAULT_MIN_COUNT
+    ):
+        """Classify the pixels of a scan as whether they are hotter than usual.
+
+        Pixels without enough history are anomalous, so that the threshold model falls
+        back to its comparisons to the scene.
+
+        Parameters
+        ----------
+        goes_scan : wildfire.data.goes_level_1.GoesScan
+        anomaly_sigma : float, optional
+            By default `DEFAULT_ANOMALY_SIGMA`.
+        min_count : int, optional
+            By default `DEFAULT_MIN_COUNT`.
+
+        Returns
+        -------
+        np.ndarray of bool
+        """
+        anomaly = self.score_scan(goes_scan=goes_scan, min_count=min_count)
+        with np.errstate(invalid="ignore"):
+            return ~(anomaly.band_7 <= anomaly_sigma) & ~(
+                anomaly.band_7_14 <= anomaly_sigma
+            )
+
+    def flush(self):
+        """Write the updates of the climatology to disk."""
+        for name in self.ARRAYS:
+            getattr(self, name).flush()
+        if self.mode != "r":
+            _save_atomically(
+                self.get_filepath(
+                    self.directory, self.satellite, self.region, "scan_times"
+                ),
+                self.scan_times,
+            )
+
+
+@functools.lru_cache(maxsize=4)
+def load_climatology(directory, satellite, region):
+    """Open a climatology read only, once per process.
+
+    Parameters
+    ----------
+    directory : str
+    satellite : str
+    region : str
+
+    Returns
+    -------
+    Climatology
+    """
+    return Climatology(directory=directory, satellite=satellite, region=region)
+
+
+def check_climatology(directory, satellite, region):
+    """Check that there is a climatology of `satellite` and `region` in `directory`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If any of its files is missing.
+    """
+    for name in Climatology.ARRAYS + ("scan_times",):
+        filepath = Climatology.get_filepath(directory, satellite, region, name)
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(
+                f"No climatology of {satellite} {region} in {directory}: missing "
+                f"{filepath}. Create it with `training-data goes-climatology`."
+            )
+
+
+def _save_atomically(filepath, array):
+    """Save `array` to `filepath`, leaving any previous file whole if this fails."""
+    temporary_filepath = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_filepath, "wb") as buffer:
+            np.save(buffer, array)
+        os.replace(temporary_filepath, filepath)
+    finally:
+        if os.path.exists(temporary_filepath):
+            os.remove(temporary_filepath)
+
+
+def _update(count, mean, sum_squares, values):
+    """Add `values` to running statistics in place, with Welford's algorithm."""
+    is_valid = np.isfinite(values).all(axis=0)
+    count += is_valid
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.where(is_valid, values - mean, 0)
+        mean += delta / np.maximum(count, 1)
+        sum_squares += delta * np.where(is_valid, values - mean, 0)
+
+
+def _accumulate_scans(scan_filepaths, shape, partial_filepath):
+    """Accumulate the statistics of scans of one hour bin into `partial_filepath`.
+
+    Returns the start times of the scans accumulated.
+    """
+    count = np.zeros(shape, dtype=np.int32)
+    mean = np.zeros((len(VARIABLES),) + tuple(shape), dtype=np.float32)
+    sum_squares = np.zeros_like(mean)
+    scan_times_utc = []
+    for filepaths in scan_filepaths:
+        try:
+            goes_scan = goes_level_1.scan.read_netcdfs(
+                local_filepaths=filepaths, max_workers=1
+            )
+            values = get_values(goes_scan=goes_scan)
+            goes_scan.release()
+        except ValueError as error_message:
+            _logger.warning(
+                "\nSkipping goes_scan comprised of %s.\nError: %s",
+                filepaths,
+                error_message,
+            )
+            continue
+        if values.shape[1:] != tuple(shape):
+            _logger.warning(
+                "Skipping goes_scan comprised of %s of shape %s instead of %s.",
+                filepaths,
+                values.shape[1:],
+                shape,
+            )
+            continue
+        with instrumentation.timer("climatology"):
+            _update(count=count, mean=mean, sum_squares=sum_squares, values=values)
+        scan_times_utc.append(goes_scan.scan_time_utc)
+    np.savez(partial_filepath, count=count, mean=mean, sum_squares=sum_squares)
+    return scan_times_utc
+
+
+def update_climatology(  # pylint: disable=too-many-arguments,too-many-locals
+    scan_filepaths,
+    directory,
+    satellite,
+    region,
+    create=False,
+    scans_per_task=DEFAULT_SCANS_PER_TASK,
+    pbs=False,
+    **cluster_kwargs,
+):
+    """Add many scans to a climatology, in parallel.
+
+    Each task accumulates up to `scans_per_task` scans of one hour bin into partial
+    statistics, written to its own file in `multiprocessing.SHARED_DIRECTORY`, which are
+    then merged into the climatology by this process, the only one to write to it.
+
+    Scans already in the climatology, by start time, are skipped, as are repeats in
+    `scan_filepaths`, so that re-running an update does not count scans twice.
+
+    Parameters
+    ----------
+    scan_filepaths : list of list of str
+        As returned by `goes_level_1.utilities.group_filepaths_into_scans`, all of
+        `satellite` and `region`.
+    directory : str
+    satellite : str
+    region : str
+    create : bool, optional
+        Whether to create a new climatology, by default False, which creates one only if
+        there is none in `directory`.
+    scans_per_task : int, optional
+        By default `DEFAULT_SCANS_PER_TASK`.
+    pbs : bool, optional
+        Whether or not to launch and parallize using PBS, by default False
+
+    Returns
+    -------
+    int
+        Number of scans added, without those skipped.
+    """
+    if create or not os.path.exists(
+        Climatology.get_filepath(directory, satellite, region, "count")
+    ):
+        Climatology.create(directory=directory, satellite=satellite, region=region)
+    climatology = Climatology(
+        directory=directory, satellite=satellite, region=region, mode="r+"
+    )
+
+    new_scans = {}
+    for filepaths in scan_filepaths:
+        scan_time_utc = goes_level_1.utilities.parse_filename(filepaths[0])[3]
+        if scan_time_utc not in new_scans and not climatology.has_scan(scan_time_utc):
+            new_scans[scan_time_utc] = filepaths
+    if len(new_scans) < len(scan_filepaths):
+        _logger.info(
+            "Skipping %d scans already in the climatology.",
+            len(scan_filepaths) - len(new_scans),
+        )
+    hour_bins = defaultdict(list)
+    for scan_time_utc, filepaths in new_scans.items():
+        hour_bins[get_hour_bin(scan_time_utc, climatology.num_hour_bins)].append(
+            filepaths
+        )
+    tasks = [
+        (hour_bin, filepaths[start : start + scans_per_task])
+        for hour_bin, filepaths in sorted(hour_bins.items())
+        for start in range(0, len(filepaths), scans_per_task)
+    ]
+    _logger.info(
+        "Updating the climatology of %s %s with %d scans of %d hour bins in %d tasks...",
+        satellite,
+        region,
+        len(new_scans),
+        len(hour_bins),
+        len(tasks),
+    )
+
+    # partial statistics of a task, as held by `_accumulate_scans`
+    partial_bytes = int(np.prod(climatology.shape)) * (4 + 2 * 4 * len(VARIABLES))
+    partial_directory = tempfile.mkdtemp(dir=multiprocessing.SHARED_DIRECTORY)
+    try:
+        partial_filepaths = [
+            os.path.join(partial_directory, f"partial_{index}.npz")
+            for index in range(len(tasks))
+        ]
+        scan_times_utc = multiprocessing.map_function(
+            function=_accumulate_scans,
+            function_args=[
+                [filepaths for _, filepaths in tasks],
+                [climatology.shape] * len(tasks),
+                partial_filepaths,
+            ],
+            pbs=pbs,
+            memory=goes_level_1.utilities.estimate_scan_memory(region=region)
+            + partial_bytes,
+            retries=RETRIES,
+            **cluster_kwargs,
+        )
+        for (hour_bin, _), partial_filepath in zip(tasks, partial_filepaths):
+            with np.load(partial_filepath) as partial:
+                climatology.merge(
+                    count=partial["count"],
+                    mean=partial["mean"],
+                    sum_squares=partial["sum_squares"],
+                    hour_bin=hour_bin,
+                )
+            os.remove(partial_filepath)
+        climatology.add_scan_times(
+            [
+                scan_time_utc
+                for task_times in scan_times_utc
+                for scan_time_utc in task_times
+            ]
+        )
+        climatology.flush()
+    finally:
+        shutil.rmtree(partial_directory, ignore_errors=True)
+    num_scans = sum(map(len, scan_times_utc))
+    _logger.info("Added %d scans to the climatology.", num_scans)
+    return num_scans
@@ -0,0 +1,414 @@
+"""Evaluate the threshold model against the GOES level 2 fire product (FDCC/FDCF).
+
+Each level 2 scan is paired with its level 1 scan (see
+`wildfire.data.goes_level_2.match_level_1`), the predictions of the threshold model are
+compared pixel by pixel to the fires of the level 2 `Mask` (or `Temp`), and the confusion
+counts of every scan are added up in a `ConfusionCounts`.
+
+With a `tolerance` of n pixels, a predicted pixel is a true positive if a level 2 fire is
+within n pixels of it (and vice versa for false negatives), which forgives the small
+offsets between the two products.
+
+Scans are evaluated in chunks, each reduced to a single `ConfusionCounts` on its worker,
+so that the memory of the client stays constant however many scans are evaluated.
+"""
+import json
+import logging
+import math
+
+import numpy as np
+import scipy.ndimage
+import xarray as xr
+
+from wildfire import instrumentation, multiprocessing
+from wildfire.data import goes_level_1, goes_level_2
+from . import goes_level_1_wildfires
+from . import model as threshold_model
+
+# fire categories of the level 2 Mask: good, saturated, cloud contaminated, high, medium
+# and low probability fire pixels, and their temporally filtered counterparts
+FIRE_CODES = (10, 11, 12, 13, 14, 15, 30, 31, 32, 33, 34, 35)
+# pixels of the level 2 Mask that were not evaluated by its fire algorithm: unprocessed,
+# off earth, in the local zenith and solar zenith or glint angle block out zones, with
+# missing, saturated, invalid or below threshold 3.89um or 11.19um input, and those for
+# which no background or brightness temperature could be computed. Pixels of ecosystems
+# in which the algorithm does not look for fires (water, bright desert) and of clouds
+# are kept as evaluated, since the product rules out fires there, as a model should
+NOT_EVALUATED_CODES = (
+    (0, 40, 50, 60)
+    + (120, 121, 123, 124, 125, 126, 127)
+    + (170, 180, 182, 185, 186, 187, 188)
+)
+LEVEL_2_TRUTHS = ("mask", "temp")
+# most chunks of scans evaluated at once, bounding the results held by the client
+MAX_CHUNKS = 1024
+
+_logger = logging.getLogger(__name__)
+
+
+class ConfusionCounts:  # pylint: disable=too-many-instance-attributes
+    """Pixel and scan confusion counts of predictions against the level 2 fire product.
+
+    Attributes
+    ----------
+    true_positives : int
+        Predicted pixels within `tolerance` of a level 2 fire.
+    false_positives : int
+        Predicted pixels with no level 2 fire within `tolerance`.
+    detected_fires : int
+        Level 2 fire pixels within `tolerance` of a predicted pixel.
+    false_negatives : int
+        Level 2 fire pixels with no predicted pixel within `tolerance`.
+    true_negatives : int
+        Evaluated pixels that are neither predicted nor level 2 fires.
+    scan_true_positives, scan_false_positives, scan_false_negatives,
+    scan_true_negatives : int
+        Confusion counts of whether a scan has any predicted and any level 2 fire pixel.
+    num_scans : int
+    num_skipped : int
+        Scans that could not be evaluated, e.g. for lack of a matching level 1 scan.
+    """
+
+    FIELDS = (
+        "true_positives",
+        "false_positives",
+        "detected_fires",
+        "false_negatives",
+        "true_negatives",
+        "scan_true_positives",
+        "scan_false_positives",
+        "scan_false_negatives",
+        "scan_true_negatives",
+        "num_scans",
+        "num_skipped",
+    )
+
+    def __init__(self, **counts):
+        for field in self.FIELDS:
+            setattr(self, field, int(counts.pop(field, 0)))
+        if counts:
+            raise ValueError(f"Unknown counts {sorted(counts)}.")
+
+    def __eq__(self, other):
+        """Compare the counts of two ConfusionCounts."""
+        return isinstance(other, ConfusionCounts) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        """Represent ConfusionCounts as a string."""
+        return f"ConfusionCounts({self.to_dict()})"
+
+    def update(self, predictions, fires, tolerance=0, is_evaluated=None):
+        """Add the counts of the predictions of one scan.
+
+        Parameters
+        ----------
+        predictions : np.ndarray of bool
+            Whether a wildfire is predicted at each pixel.
+        fires : np.ndarray of bool
+            Whether the level 2 product has a fire at each pixel. Must be of the same
+            shape as `predictions`.
+        tolerance : int, optional
+            Distance in pixels within which a prediction matches a fire, by default 0.
+        is_evaluated : np.ndarray of bool, optional
+            Pixels to count, by default all of them.
+
+        Returns
+        -------
+        ConfusionCounts
+            self
+        """
+        if predictions.shape != fires.shape:
+            raise ValueError(
+                f"Shapes do no match! Got shapes {predictions.shape} and {fires.shape}"
+            )
+        if is_evaluated is not None:
+            predictions = predictions & is_evaluated
+            fires = fires & is_evaluated
+        near_fires = dilate(fires, tolerance=tolerance)
+        near_predictions = dilate(predictions, tolerance=tolerance)
+
+        true_positives = np.count_nonzero(predictions & near_fires)
+        num_predictions = np.count_nonzero(predictions)
+        detected_fires = np.count_nonzero(fires & near_predictions)
+        num_fires = np.count_nonzero(fires)
+        num_evaluated = predictions.size if is_evaluated is None else is_evaluated.sum()
+
+        self.true_positives += true_positives
+        self.false_positives += num_predictions - true_positives
+        self.detected_fires += detected_fires
+        self.false_negatives += num_fires - detected_fires
+        self.true_negatives += int(num_evaluated) - np.count_nonzero(predictions | fires)
+        has_prediction, has_fire = num_predictions > 0, num_fires > 0
+        self.scan_true_positives += has_prediction and has_fire
+        self.scan_false_positives += has_prediction and not has_fire
+        self.scan_false_negatives += has_fire and not has_prediction
+        self.scan_true_negatives += not (has_prediction or has_fire)
+        self.num_scans += 1
+        return self
+
+    def merge(self, other):
+        """Add the counts of `other` to these counts.
+
+        Parameters
+        ----------
+        other : ConfusionCounts
+
+        Returns
+        -------
+        ConfusionCounts
+            self
+        """
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    def get_metrics(self):
+        """Get the precision, recall and F1 score of pixels and of scans.
+
+        Metrics without any counts to divide are `nan`.
+
+        Returns
+        -------
+        dict
+        """
+        pixel_precision = _divide(
+            self.true_positives, self.true_positives + self.false_positives
+        )
+        pixel_recall = _divide(
+            self.detected_fires, self.detected_fires + self.false_negatives
+        )
+        scan_precision = _divide(
+            self.scan_true_positives, self.scan_true_positives + self.scan_false_positives
+        )
+        scan_recall = _divide(
+            self.scan_true_positives, self.scan_true_positives + self.scan_false_negatives
+        )
+        return {
+            "pixel_precision": pixel_precision,
+            "pixel_recall": pixel_recall,
+            "pixel_f1": _divide(
+                2 * pixel_precision * pixel_recall, pixel_precision + pixel_recall
+            ),
+            "scan_precision": scan_precision,
+            "scan_recall": scan_recall,
+            "scan_f1": _divide(
+                2 * scan_precision * scan_recall, scan_precision + scan_recall
+            ),
+        }
+
+    def to_dict(self):
+        """Get the counts.
+
+        Returns
+        -------
+        dict
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+def _divide(numerator, denominator):
+    return numerator / denominator if denominator else math.nan
+
+
+def dilate(mask, tolerance):
+    """Mark the pixels within `tolerance` pixels of each pixel of `mask`.
+
+    Parameters
+    ----------
+    mask : np.ndarray of bool
+    tolerance : int
+
+    Returns
+    -------
+    np.ndarray of bool
+    """
+    if tolerance <= 0 or not mask.any():
+        return mask
+    return scipy.ndimage.binary_dilation(
+        mask, structure=np.ones((2 * tolerance + 1, 2 * tolerance + 1), dtype=bool)
+    )
+
+
+def get_level_2_fires(level_2, truth="mask", fire_codes=FIRE_CODES):
+    """Get the fire pixels and the evaluated pixels of a level 2 fire dataset.
+
+    Parameters
+    ----------
+    level_2 : xr.core.dataset.Dataset
+    truth : str, optional
+        One of `LEVEL_2_TRUTHS`, by default "mask". "mask" takes fires to be the pixels
+        of the `Mask` in `fire_codes`, and "temp" the pixels with a finite `Temp`, as in
+        `wildfire.models.dnn.training_data`.
+    fire_codes : tuple of int, optional
+        By default `FIRE_CODES`.
+
+    Returns
+    -------
+    tuple of (np.ndarray of bool, np.ndarray of bool)
+        Whether each pixel is a fire, and whether it was evaluated by the level 2
+        algorithm.
+    """
+    if truth not in LEVEL_2_TRUTHS:
+        raise ValueError(f"Unknown truth {truth}. Must be one of {LEVEL_2_TRUTHS}.")
+    mask = level_2.Mask.values
+    is_evaluated = np.isfinite(mask) & ~np.isin(mask, NOT_EVALUATED_CODES)
+    if truth == "temp":
+        fires = np.isfinite(level_2.Temp.values)
+    else:
+        fires = np.isin(mask, fire_codes)
+    return fires & is_evaluated, is_evaluated
+
+
+def evaluate_scan(
+    level_2_filepath,
+    level_1_directory,
+    tolerance=0,
+    truth="mask",
+    thresholds=threshold_model.DEFAULT_THRESHOLDS,
+):
+    """Compare the predictions of the threshold model to a level 2 fire scan.
+
+    Parameters
+    ----------
+    level_2_filepath : str
+    level_1_directory : str
+        Directory in which to look for the matching level 1 scan.
+    tolerance : int, optional
+        See `ConfusionCounts.update`, by default 0.
+    truth : str, optional
+        See `get_level_2_fires`, by default "mask".
+    thresholds : wildfire.models.threshold_model.Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
+
+    Returns
+    -------
+    ConfusionCounts
+        The counts of the scan, with `num_skipped` of 1 if it could not be evaluated.
+    """
+    try:
+        with instrumentation.timer("read_netcdf"):
+            level_2 = xr.load_dataset(level_2_filepath)
+        goes_scan = goes_level_2.utilities.match_level_1(
+            level_2=level_2, level_1_directory=level_1_directory, max_workers=1
+        )
+        predictions = goes_level_1_wildfires.predict_wildfires(
+            goes_scan=goes_scan, thresholds=thresholds
+        )
+        goes_scan.release()
+        fires, is_evaluated = get_level_2_fires(level_2=level_2, truth=truth)
+        return ConfusionCounts().update(
+            predictions=predictions,
+            fires=fires,
+            tolerance=tolerance,
+            is_evaluated=is_evaluated,
+        )
+    except (ValueError, OSError, KeyError) as error_message:
+        # unmatched, unreadable, or missing the variables of a fire product
+        _logger.warning(
+            "\nSkipping level 2 scan %s.\nError: %s", level_2_filepath, error_message
+        )
+        return ConfusionCounts(num_skipped=1)
+
+
+def _evaluate_scans(level_2_filepaths, level_1_directory, tolerance, truth, thresholds):
+    confusion_counts = ConfusionCounts()
+    for level_2_filepath in level_2_filepaths:
+        confusion_counts.merge(
+            evaluate_scan(
+                level_2_filepath=level_2_filepath,
+                level_1_directory=level_1_directory,
+                tolerance=tolerance,
+                truth=truth,
+                thresholds=thresholds,
+            )
+        )
+    return confusion_counts
+
+
+def evaluate(
+    level_2_filepaths,
+    level_1_directory,
+    tolerance=0,
+    truth="mask",
+    thresholds=threshold_model.DEFAULT_THRESHOLDS,
+    pbs=False,
+    **cluster_kwargs,
+):
+    """Compare the predictions of the threshold model to many level 2 fire scans.
+
+    Parameters
+    ----------
+    level_2_filepaths : list of str
+    level_1_directory : str
+        Directory in which to look for the matching level 1 scans.
+    tolerance : int, optional
+        See `ConfusionCounts.update`, by default 0.
+    truth : str, optional
+        See `get_level_2_fires`, by default "mask".
+    thresholds : wildfire.models.threshold_model.Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
+    pbs : bool, optional
+        Whether or not to launch and parallize using PBS, by default False
+
+    Returns
+    -------
+    ConfusionCounts
+    """
+    scans_per_chunk = max(1, math.ceil(len(level_2_filepaths) / MAX_CHUNKS))
+    chunks = [
+        level_2_filepaths[start : start + scans_per_chunk]
+        for start in range(0, len(level_2_filepaths), scans_per_chunk)
+    ]
+    _logger.info(
+        "Evaluating %d scans in %d chunks...", len(level_2_filepaths), len(chunks)
+    )
+    memory = None
+    if level_2_filepaths:
+        memory = goes_level_1.utilities.estimate_scan_memory(
+            region=goes_level_2.utilities.get_region(level_2_filepaths[0])
+        )
+
+    confusion_counts = ConfusionCounts()
+    for chunk_counts in multiprocessing.map_function(
+        function=_evaluate_scans,
+        function_args=[
+            chunks,
+            [level_1_directory] * len(chunks),
+            [tolerance] * len(chunks),
+            [truth] * len(chunks),
+            [thresholds] * len(chunks),
+        ],
+        pbs=pbs,
+        batch_size=None,
+        memory=memory,
+        retries=goes_level_1_wildfires.SCAN_RETRIES,
+        **cluster_kwargs,
+    ):
+        confusion_counts.merge(chunk_counts)
+    _logger.info("Evaluated %d scans: %s", confusion_counts.num_scans, confusion_counts)
+    return confusion_counts
+
+
+def write_report(confusion_counts, filepath, **metadata):
+    """Write the counts and metrics of an evaluation as JSON.
+
+    Parameters
+    ----------
+    confusion_counts : ConfusionCounts
+    filepath : str
+    **metadata
+        Also written to the report, e.g. the tolerance and thresholds evaluated.
+
+    Returns
+    -------
+    dict
+        The report.
+    """
+    report = {
+        **metadata,
+        "counts": confusion_counts.to_dict(),
+        "metrics": confusion_counts.get_metrics(),
+    }
+    with open(filepath, "w") as buffer:
+        json.dump(report, buffer, indent=2)
+    return report
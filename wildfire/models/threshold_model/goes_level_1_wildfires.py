@@ -3,16 +3,20 @@ import datetime
 import json
 import logging
 import os
+import time
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from wildfire import multiprocessing
+from wildfire import instrumentation, multiprocessing
 from wildfire.data import goes_level_1
+from wildfire.data.goes_level_1 import watcher
 from . import model as threshold_model
+from .climatology import DEFAULT_ANOMALY_SIGMA, check_climatology, load_climatology
 
 WILDFIRE_FILENAME = "wildfires_{satellite}_{region}_s{start}_e{end}_c{created}.json"
 DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# retries of a scan that raised, e.g. a MemoryError
+SCAN_RETRIES = 2
 
 _logger = logging.getLogger(__name__)
 
@@ -46,10 +50,16 @@ def find_wildfires(filepaths, pbs=False, **cluster_kwargs):
     _logger.info(
         "Processing %d scans with %d workers...", len(scan_filepaths), os.cpu_count()
     )
+    memory = None
+    if scan_filepaths:
+        region = goes_level_1.utilities.parse_filename(filename=filepaths[0])[0]
+        memory = goes_level_1.utilities.estimate_scan_memory(region=region)
     wildfires = multiprocessing.map_function(
         function=parse_scan_for_wildfire,
         function_args=[scan_filepaths],
         pbs=pbs,
+        memory=memory,
+        retries=SCAN_RETRIES,
         **cluster_kwargs,
     )
     wildfires = list(filter(None, wildfires))
@@ -58,13 +68,27 @@ def find_wildfires(filepaths, pbs=False, **cluster_kwargs):
     return wildfires
 
 
-def parse_scan_for_wildfire(filepaths):
+def parse_scan_for_wildfire(
+    filepaths,
+    max_workers=1,
+    climatology_directory=None,
+    anomaly_sigma=DEFAULT_ANOMALY_SIGMA,
+):
     """Determine if scan defined by `filepaths` has a wildfire.
 
     Parameters
     ----------
     filepaths : list of str
         Must be a set of 16 files, which together define the 16 bands of a complete scan.
+    max_workers : int, optional
+        Number of bands to decode concurrently, by default 1 since this is usually
+        already run in parallel across scans. See
+        `wildfire.data.goes_level_1.read_netcdfs`.
+    climatology_directory : str, optional
+        Directory of the `Climatology` of the satellite and region of the scan. By
+        default `None`, which does not compare pixels to their climatology.
+    anomaly_sigma : float, optional
+        See `predict_wildfires`, by default `DEFAULT_ANOMALY_SIGMA`.
 
     Returns
     -------
@@ -79,7 +103,9 @@ def parse_scan_for_wildfire(filepaths):
         complete scan.
     """
     try:
-        goes_scan = goes_level_1.scan.read_netcdfs(local_filepaths=filepaths)
+        goes_scan = goes_level_1.scan.read_netcdfs(
+            local_filepaths=filepaths, max_workers=max_workers
+        )
     except ValueError as error_message:
         _logger.warning(
             "\nSkipping malformed goes_scan comprised of %s.\nError: %s",
@@ -88,7 +114,21 @@ def parse_scan_for_wildfire(filepaths):
         )
         return None
 
-    if predict_wildfires(goes_scan=goes_scan).mean() > 0:
+    climatology = None
+    if climatology_directory is not None:
+        climatology = load_climatology(
+            directory=climatology_directory,
+            satellite=goes_scan.satellite,
+            region=goes_scan.region,
+        )
+    has_wildfire = (
+        predict_wildfires(
+            goes_scan=goes_scan, climatology=climatology, anomaly_sigma=anomaly_sigma
+        ).mean()
+        > 0
+    )
+    goes_scan.release()
+    if has_wildfire:
         return {
             "scan_time_utc": goes_scan.scan_time_utc.strftime("%Y-%m-%dT%H:%M:%S%f"),
             "region": goes_scan.region,
@@ -97,11 +137,11 @@ def parse_scan_for_wildfire(filepaths):
     return None
 
 
-def get_model_features(goes_scan):
-    """Calculate features of the threshold model from a `GoesScan`.
+def get_features(goes_scan):
+    """Calculate the continuous features of the threshold model from a `GoesScan`.
 
     To do this, the provided `GoesScan` is first rescaled such that all bands are in the
-    same spatial resoltuion (namely 500m).
+    same spatial resoltuion (namely 2km).
 
     Parameters
     ----------
@@ -110,54 +150,85 @@ def get_model_features(goes_scan):
 
     Returns
     -------
-    wildfire.models.threshold_model.ModelFeatures
-        Namedtuple of features used as input to the `predict` method.
+    wildfire.models.threshold_model.Features
+        Namedtuple of features compared to the thresholds of the model. See
+        `wildfire.models.threshold_model.classify`.
     """
     rescaled_scan = goes_scan.rescale_to_2km()
 
     with np.errstate(invalid="ignore"):
-        is_hot = threshold_model.is_hot_pixel(
+        return threshold_model.get_features(
             brightness_temperature_3_89=rescaled_scan[
                 "band_7"
             ].brightness_temperature.data,
             brightness_temperature_11_19=rescaled_scan[
                 "band_14"
             ].brightness_temperature.data,
-        )
-        is_night = threshold_model.is_night_pixel(
-            reflectance_factor_0_64=rescaled_scan["band_2"].reflectance_factor.data,
-            reflectance_factor_0_87=rescaled_scan["band_3"].reflectance_factor.data,
-        )
-        is_water = threshold_model.is_water_pixel(
-            reflectance_factor_2_25=rescaled_scan["band_6"].reflectance_factor.data
-        )
-        is_cloud = threshold_model.is_cloud_pixel(
-            reflectance_factor_0_64=rescaled_scan["band_2"].reflectance_factor.data,
-            reflectance_factor_0_87=rescaled_scan["band_3"].reflectance_factor.data,
             brightness_temperature_12_27=rescaled_scan[
                 "band_15"
             ].brightness_temperature.data,
+            reflectance_factor_0_64=rescaled_scan["band_2"].reflectance_factor.data,
+            reflectance_factor_0_87=rescaled_scan["band_3"].reflectance_factor.data,
+            reflectance_factor_2_25=rescaled_scan["band_6"].reflectance_factor.data,
         )
-    return threshold_model.ModelFeatures(
-        is_hot=is_hot, is_night=is_night, is_water=is_water, is_cloud=is_cloud,
+
+
+def get_model_features(goes_scan, thresholds=threshold_model.DEFAULT_THRESHOLDS):
+    """Calculate features of the threshold model from a `GoesScan`.
+
+    To do this, the provided `GoesScan` is first rescaled such that all bands are in the
+    same spatial resoltuion (namely 2km).
+
+    Parameters
+    ----------
+    goes_scan : wildfire.data.goes_level_1.GoesScan
+        A scan of 16 bands of light over some region on Earth.
+    thresholds : wildfire.models.threshold_model.Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
+
+    Returns
+    -------
+    wildfire.models.threshold_model.ModelFeatures
+        Namedtuple of features used as input to the `predict` method.
+    """
+    return threshold_model.classify(
+        features=get_features(goes_scan=goes_scan), thresholds=thresholds
     )
 
 
-def predict_wildfires(goes_scan):
+@instrumentation.timed("model")
+def predict_wildfires(
+    goes_scan,
+    thresholds=threshold_model.DEFAULT_THRESHOLDS,
+    climatology=None,
+    anomaly_sigma=DEFAULT_ANOMALY_SIGMA,
+):
     """Get model predictions for wildfire detection for a `GoesScan`.
 
     Parameters
     ----------
     goes_scan : wildfire.data.goes_level_1.GoesScan
+    thresholds : wildfire.models.threshold_model.Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
+    climatology : wildfire.models.threshold_model.climatology.Climatology, optional
+        If given, hot pixels must also be hotter than usual for the pixel at that hour of
+        the day (see `Climatology.is_anomalous`). By default `None`.
+    anomaly_sigma : float, optional
+        By default `DEFAULT_ANOMALY_SIGMA`.
 
     Returns
     -------
     np.ndarray of bool
         A prediction (True/False) of whether a wildfire is detected at each pixel.
     """
-    model_features = get_model_features(goes_scan=goes_scan)
+    model_features = get_model_features(goes_scan=goes_scan, thresholds=thresholds)
+    is_hot = model_features.is_hot
+    if climatology is not None:
+        is_hot = is_hot & climatology.is_anomalous(
+            goes_scan=goes_scan, anomaly_sigma=anomaly_sigma
+        )
     model_predictions = threshold_model.predict(
-        is_hot=model_features.is_hot,
+        is_hot=is_hot,
         is_cloud=model_features.is_cloud,
         is_night=model_features.is_night,
         is_water=model_features.is_water,
@@ -178,6 +249,8 @@ def plot_wildfires(goes_scan):
     """
     model_predictions = predict_wildfires(goes_scan=goes_scan)
 
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
     _, (axis_fire, axis_scan) = plt.subplots(ncols=2, figsize=(20, 8))
     axis_fire.set_title(f"Wildfire Present: {model_predictions.mean() > 0}", fontsize=20)
 
@@ -190,13 +263,15 @@ def plot_wildfires(goes_scan):
     return [image_fire, image_scan]
 
 
-def label_wildfires(
+def label_wildfires(  # pylint: disable=too-many-locals
     scan_filepaths,
     persist_directory,
     satellite,
     region,
     start,
     end,
+    climatology_directory=None,
+    anomaly_sigma=DEFAULT_ANOMALY_SIGMA,
     pbs=False,
     **cluster_kwargs,
 ):
@@ -212,19 +287,49 @@ def label_wildfires(
         Must be one of ("M1", "M2", "C", "F")
     start : datetime.datetime
     end : datetime.datetime
+    climatology_directory : str, optional
+        See `parse_scan_for_wildfire`, by default `None`.
+    anomaly_sigma : float, optional
+        By default `DEFAULT_ANOMALY_SIGMA`.
     pbs : bool, optional
         Whether or not to launch and parallize using PBS, by default False
 
     Returns
     -------
     dict
+
+    Raises
+    ------
+    FileNotFoundError
+        If `climatology_directory` has no climatology of `satellite` and `region`.
     """
+    if climatology_directory is not None:
+        # fail before launching any task, rather than once per scan
+        check_climatology(
+            directory=climatology_directory, satellite=satellite, region=region
+        )
+    num_scans = len(scan_filepaths)
+    started_at = time.perf_counter()
     wildfires = multiprocessing.map_function(
         function=parse_scan_for_wildfire,
-        function_args=[scan_filepaths],
+        function_args=[
+            scan_filepaths,
+            [1] * num_scans,
+            [climatology_directory] * num_scans,
+            [anomaly_sigma] * num_scans,
+        ],
         pbs=pbs,
+        memory=goes_level_1.utilities.estimate_scan_memory(region=region),
+        retries=SCAN_RETRIES,
         **cluster_kwargs,
     )
+    elapsed = time.perf_counter() - started_at
+    _logger.info(
+        "Ran the threshold model over %d scans in %.1fs: %.3f scans per second.",
+        len(scan_filepaths),
+        elapsed,
+        len(scan_filepaths) / elapsed if elapsed else 0.0,
+    )
     wildfires = list(filter(None, wildfires))
     _logger.info("Found %d wildfires.", len(wildfires))
 
@@ -246,3 +351,98 @@ def label_wildfires(
         _logger.info("No wildfires found...")
 
     return wildfires
+
+
+def watch_wildfires(  # pylint: disable=too-many-locals
+    satellite,
+    region,
+    goes_directory,
+    persist_directory,
+    poll_seconds=10,
+    remote_directory=None,
+    filesystem=None,
+    max_polls=None,
+    since=None,
+):
+    """Label wildfires in GOES level 1 scans as they are published to Amazon S3.
+
+    Bands are downloaded as soon as they appear, and each scan is run through the
+    threshold model as soon as all 16 of its bands have been downloaded. Each detected
+    wildfire is persisted to its own json file in `persist_directory`. Errors polling
+    Amazon S3 or parsing a scan are logged, and watching goes on.
+
+    Parameters
+    ----------
+    satellite : str
+        Must be either "noaa-goes16" or "noaa-goes17".
+    region : str
+        Must be one of ("M1", "M2", "C", "F")
+    goes_directory : str
+        Directory in which to download GOES data.
+    persist_directory : str
+    poll_seconds : float, optional
+        Seconds to wait between polls of Amazon S3, by default 10.
+    remote_directory : str, optional
+        See `wildfire.data.goes_level_1.watcher.ScanWatcher`.
+    filesystem : fsspec.AbstractFileSystem, optional
+        See `wildfire.data.goes_level_1.watcher.ScanWatcher`.
+    max_polls : int, optional
+        By default `None`, which polls forever.
+    since : datetime.datetime, optional
+        Label the scans that started at or after this UTC time, including those already
+        published. By default `None`, which only labels scans that start once watching
+        starts.
+
+    Yields
+    ------
+    dict
+        Each wildfire as it is found, of the same form as `parse_scan_for_wildfire`.
+    """
+    scan_watcher = watcher.ScanWatcher(
+        satellite=satellite,
+        region=region,
+        local_directory=goes_directory,
+        remote_directory=remote_directory,
+        filesystem=filesystem,
+        since=since,
+    )
+    _logger.info("Watching for new scans with %s", scan_watcher)
+
+    num_polls = 0
+    while max_polls is None or num_polls < max_polls:
+        polled_at = time.monotonic()
+        try:
+            completed_scans = scan_watcher.poll()
+        except Exception:  # pylint: disable=broad-except
+            _logger.exception("Failed to poll for new scans. Retrying next poll.")
+            completed_scans = []
+        for scan_filepaths in completed_scans:
+            try:
+                wildfire = parse_scan_for_wildfire(
+                    filepaths=scan_filepaths,
+                    max_workers=goes_level_1.scan.READ_MAX_WORKERS,
+                )
+            except Exception:  # pylint: disable=broad-except
+                _logger.exception("Failed to parse scan of %s.", scan_filepaths)
+                continue
+            if wildfire is None:
+                continue
+
+            wildfire_filepath = os.path.join(
+                persist_directory,
+                WILDFIRE_FILENAME.format(
+                    satellite=satellite,
+                    region=region,
+                    start=wildfire["scan_time_utc"],
+                    end=wildfire["scan_time_utc"],
+                    created=datetime.datetime.utcnow().strftime(DATETIME_FORMAT),
+                ),
+            )
+            _logger.info("Found wildfire. Persisting to %s", wildfire_filepath)
+            with open(wildfire_filepath, "w+") as buffer:
+                json.dump(wildfire, buffer)
+            yield wildfire
+
+        num_polls += 1
+        if max_polls is None or num_polls < max_polls:
+            time.sleep(max(0, poll_seconds - (time.monotonic() - polled_at)))
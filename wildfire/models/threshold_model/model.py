@@ -1,5 +1,11 @@
-"""Threshold model for predicting wildfires."""
+"""Threshold model for predicting wildfires.
+
+Each pixel is classified by comparing continuous `Features` of the pixel to `Thresholds`,
+so that the features can be computed once and classified with many thresholds (see
+`wildfire.models.threshold_model.sweep`).
+"""
 from collections import namedtuple
+import operator
 
 import numpy as np
 
@@ -8,6 +14,45 @@ from wildfire.data import goes_level_1
 ModelFeatures = namedtuple(
     "ModelFeatures", ("is_hot", "is_cloud", "is_water", "is_night")
 )
+Features = namedtuple(
+    "Features",
+    (
+        "hot_3_89",
+        "hot_difference",
+        "cloud_reflectance",
+        "cloud_temperature",
+        "water_reflectance",
+        "night_reflectance",
+    ),
+)
+Thresholds = namedtuple(
+    "Thresholds",
+    (
+        "hot_sigma",
+        "hot_difference_sigma",
+        "cloud_reflectance",
+        "cloud_temperature",
+        "warm_cloud_reflectance",
+        "warm_cloud_temperature",
+        "water_reflectance",
+        "night_reflectance",
+    ),
+    defaults=(2, 3, 1.2, 265, 0.5, 285, 0.03, 0.008),
+)
+# the thresholds of Xu Zhong et al
+DEFAULT_THRESHOLDS = Thresholds()
+
+# the feature compared to each threshold, and how
+COMPARISONS = {
+    "hot_sigma": ("hot_3_89", operator.gt),
+    "hot_difference_sigma": ("hot_difference", operator.gt),
+    "cloud_reflectance": ("cloud_reflectance", operator.ge),
+    "cloud_temperature": ("cloud_temperature", operator.le),
+    "warm_cloud_reflectance": ("cloud_reflectance", operator.ge),
+    "warm_cloud_temperature": ("cloud_temperature", operator.le),
+    "water_reflectance": ("water_reflectance", operator.le),
+    "night_reflectance": ("night_reflectance", operator.lt),
+}
 
 
 def predict(is_hot, is_cloud, is_water, is_night):
@@ -44,7 +89,126 @@ def predict(is_hot, is_cloud, is_water, is_night):
     return is_hot & (is_night | (~is_cloud & ~is_water))
 
 
-def is_hot_pixel(brightness_temperature_3_89, brightness_temperature_11_19):
+def get_features(
+    brightness_temperature_3_89,
+    brightness_temperature_11_19,
+    brightness_temperature_12_27,
+    reflectance_factor_0_64,
+    reflectance_factor_0_87,
+    reflectance_factor_2_25,
+):
+    """Calculate the continuous features of each pixel that are compared to `Thresholds`.
+
+    Parameters
+    ----------
+    brightness_temperature_3_89 : ndarray of float
+        Band 7. See `is_hot_pixel()`.
+    brightness_temperature_11_19 : ndarray of float
+        Band 14. See `is_hot_pixel()`.
+    brightness_temperature_12_27 : ndarray of float
+        Band 15. See `is_cloud_pixel()`.
+    reflectance_factor_0_64 : ndarray of float
+        Band 2. See `is_cloud_pixel()`.
+    reflectance_factor_0_87 : ndarray of float
+        Band 3. See `is_cloud_pixel()`.
+    reflectance_factor_2_25 : ndarray of float
+        Band 6. See `is_water_pixel()`.
+
+    Returns
+    -------
+    Features
+        Namedtuple of arrays of the same shape as the inputs.
+    """
+    return Features(
+        hot_3_89=goes_level_1.band.normalize(data=brightness_temperature_3_89),
+        hot_difference=goes_level_1.band.normalize(
+            data=brightness_temperature_3_89 - brightness_temperature_11_19
+        ),
+        cloud_reflectance=reflectance_factor_0_64 + reflectance_factor_0_87,
+        cloud_temperature=brightness_temperature_12_27,
+        water_reflectance=reflectance_factor_2_25,
+        # fmin ignores nan, so that a pixel is at night if either reflectance is low
+        night_reflectance=np.fmin(
+            np.abs(reflectance_factor_0_64), np.abs(reflectance_factor_0_87)
+        ),
+    )
+
+
+def compare(features, thresholds, name):
+    """Compare a feature to the threshold `name`, as in `COMPARISONS`.
+
+    Parameters
+    ----------
+    features : Features
+    thresholds : Thresholds
+    name : str
+        A field of `Thresholds`.
+
+    Returns
+    -------
+    np.ndarray of bool
+    """
+    feature_name, comparison = COMPARISONS[name]
+    return comparison(getattr(features, feature_name), getattr(thresholds, name))
+
+
+def classify(features, thresholds=DEFAULT_THRESHOLDS):
+    """Classify the pixels described by `features` with `thresholds`.
+
+    Parameters
+    ----------
+    features : Features
+        As returned by `get_features()`.
+    thresholds : Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`, the thresholds of Xu Zhong et al.
+
+    Returns
+    -------
+    ModelFeatures
+        Namedtuple of features used as input to the `predict` method.
+    """
+    with np.errstate(invalid="ignore"):
+        return combine(
+            is_exceeded=lambda name: compare(
+                features=features, thresholds=thresholds, name=name
+            )
+        )
+
+
+def combine(is_exceeded):
+    """Combine the comparisons of each threshold into the input of `predict`.
+
+    Parameters
+    ----------
+    is_exceeded : callable
+        Of the form f(name) -> np.ndarray of bool, where `name` is a field of
+        `Thresholds`, and the array is whether the feature of each pixel passes the
+        comparison to that threshold in `COMPARISONS`.
+
+    Returns
+    -------
+    ModelFeatures
+    """
+    return ModelFeatures(
+        is_hot=is_exceeded("hot_sigma") & is_exceeded("hot_difference_sigma"),
+        is_cloud=(
+            is_exceeded("cloud_reflectance")
+            | is_exceeded("cloud_temperature")
+            | (
+                is_exceeded("warm_cloud_reflectance")
+                & is_exceeded("warm_cloud_temperature")
+            )
+        ),
+        is_water=is_exceeded("water_reflectance"),
+        is_night=is_exceeded("night_reflectance"),
+    )
+
+
+def is_hot_pixel(
+    brightness_temperature_3_89,
+    brightness_temperature_11_19,
+    thresholds=DEFAULT_THRESHOLDS,
+):
     """Classiify the pixels of an image as whether they are "hot".
 
     Parameters
@@ -55,23 +219,31 @@ def is_hot_pixel(brightness_temperature_3_89, brightness_temperature_11_19):
     brightness_temperature_11_19 : ndarray of float
         The brightness temperature (Kelvin) of each pixel of an image scanned over the
         11.19 micrometer wavelength. In the GOES data this corresponds to band 14.
+    thresholds : Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
 
     Returns
     -------
     np.ndarray of bool
     """
-    condition_1 = goes_level_1.band.normalize(data=brightness_temperature_3_89) > 2
+    condition_1 = (
+        goes_level_1.band.normalize(data=brightness_temperature_3_89)
+        > thresholds.hot_sigma
+    )
     condition_2 = (
         goes_level_1.band.normalize(
             data=brightness_temperature_3_89 - brightness_temperature_11_19
         )
-        > 3
+        > thresholds.hot_difference_sigma
     )
     return condition_1 & condition_2
 
 
 def is_cloud_pixel(
-    reflectance_factor_0_64, reflectance_factor_0_87, brightness_temperature_12_27
+    reflectance_factor_0_64,
+    reflectance_factor_0_87,
+    brightness_temperature_12_27,
+    thresholds=DEFAULT_THRESHOLDS,
 ):
     """Classiify the pixels of an image as whether they are in a cloud.
 
@@ -86,20 +258,23 @@ def is_cloud_pixel(
     brightness_temperature_12_27 : ndarray of float
         The brightness temperature (Kelvin) of each pixel of an image scanned over the
         12.27 micrometer wavelength. In the GOES data this corresponds to band 15.
+    thresholds : Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
 
     Returns
     -------
     np.ndarray of bool
     """
-    condition_1 = (reflectance_factor_0_64 + reflectance_factor_0_87) >= 1.2
-    condition_2 = brightness_temperature_12_27 <= 265
-    condition_3 = ((reflectance_factor_0_64 + reflectance_factor_0_87) >= 0.5) & (
-        brightness_temperature_12_27 <= 285
+    reflectance = reflectance_factor_0_64 + reflectance_factor_0_87
+    condition_1 = reflectance >= thresholds.cloud_reflectance
+    condition_2 = brightness_temperature_12_27 <= thresholds.cloud_temperature
+    condition_3 = (reflectance >= thresholds.warm_cloud_reflectance) & (
+        brightness_temperature_12_27 <= thresholds.warm_cloud_temperature
     )
     return condition_1 | condition_2 | condition_3
 
 
-def is_water_pixel(reflectance_factor_2_25):
+def is_water_pixel(reflectance_factor_2_25, thresholds=DEFAULT_THRESHOLDS):
     """Classiify the pixels of an image as whether they are in water.
 
     Parameters
@@ -107,15 +282,19 @@ def is_water_pixel(reflectance_factor_2_25):
     reflectance_factor_2_25 : ndarray of float
         The reflectance factor of each pixel of an image scanned over the 2.25 micrometer
         wavelength. In the GOES data this corresponds to band 6.
+    thresholds : Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
 
     Returns
     -------
     np.ndarray of bool
     """
-    return reflectance_factor_2_25 <= 0.03
+    return reflectance_factor_2_25 <= thresholds.water_reflectance
 
 
-def is_night_pixel(reflectance_factor_0_64, reflectance_factor_0_87):
+def is_night_pixel(
+    reflectance_factor_0_64, reflectance_factor_0_87, thresholds=DEFAULT_THRESHOLDS
+):
     """Classiify the pixels of an image as whether they are in an image taken at night.
 
     Parameters
@@ -126,13 +305,15 @@ def is_night_pixel(reflectance_factor_0_64, reflectance_factor_0_87):
     reflectance_factor_0_87 : ndarray of float
         The reflectance factor of each pixel of an image scanned over the 0.87 micrometer
         wavelength. In the GOES data this corresponds to band 3.
+    thresholds : Thresholds, optional
+        By default `DEFAULT_THRESHOLDS`.
 
     Returns
     -------
     np.ndarray of bool
     """
-    condition_1 = np.abs(reflectance_factor_0_64) < 0.008
-    condition_2 = np.abs(reflectance_factor_0_87) < 0.008
+    condition_1 = np.abs(reflectance_factor_0_64) < thresholds.night_reflectance
+    condition_2 = np.abs(reflectance_factor_0_87) < thresholds.night_reflectance
     return condition_1 | condition_2
 
 
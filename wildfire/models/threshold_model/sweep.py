@@ -0,0 +1,413 @@
+"""Sweep the thresholds of the threshold model over features computed once per scan.
+
+Tuning the thresholds by re-running `predict goes-threshold` for each setting repeats the
+expensive part, reading, calibrating and rescaling scans, per setting. Instead:
+    1. `extract_features` computes the continuous `Features` of each scan once, and
+       persists them as float32 arrays in compressed .npz files.
+    2. `sweep` counts the detections of every setting of a `ThresholdGrid` in a single
+       pass over those files.
+
+Since each feature is compared to a threshold, the comparison of a pixel to every value
+of a threshold follows from the rank of the pixel's feature among those values (found
+with `np.searchsorted`). Only pixels that are hot with the loosest hot thresholds can be
+detected, and those few are reduced to a joint histogram of their ranks, so that every
+setting is evaluated against the histogram, not the pixels.
+
+Counts of scans are accumulated in a `SweepCounts`, which can be merged with those of
+other scans, e.g. across workers.
+
+Examples
+--------
+```
+feature_filepaths = sweep.extract_features(scan_filepaths, features_directory)
+grid = sweep.ThresholdGrid(hot_sigma=[1.5, 2, 2.5], water_reflectance=[0.01, 0.03])
+sweep.sweep(feature_filepaths, grid).to_dataframe()
+```
+"""
+import logging
+import math
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+
+from wildfire import instrumentation, multiprocessing
+from wildfire.data import goes_level_1
+from . import goes_level_1_wildfires
+from . import model as threshold_model
+
+FEATURES_FILENAME = "features_{satellite}_{region}_s{scan_time}.npz"
+DATETIME_FORMAT = "%Y%m%dT%H%M%S%f"
+# settings evaluated at once against the histogram of a scan, to bound memory
+SETTINGS_CHUNK_SIZE = 4096
+# most chunks of scans swept at once, bounding the counts held by the client
+MAX_CHUNKS = 1024
+# per comparison, the side of `np.searchsorted` giving the rank of a feature among the
+# values of a threshold, and whether the values passed are those below the rank
+RANKS = {
+    operator.gt: ("left", True),
+    operator.ge: ("right", True),
+    operator.le: ("left", False),
+    operator.lt: ("right", False),
+}
+
+_logger = logging.getLogger(__name__)
+
+
+class ThresholdGrid:
+    """Cartesian product of values of each threshold.
+
+    Parameters
+    ----------
+    **values
+        Values of each threshold, keyed by the fields of
+        `wildfire.models.threshold_model.Thresholds`. Thresholds not given keep their
+        value in `DEFAULT_THRESHOLDS`.
+    """
+
+    def __init__(self, **values):
+        unknown = set(values) - set(threshold_model.Thresholds._fields)
+        if unknown:
+            raise ValueError(
+                f"Unknown thresholds {sorted(unknown)}. Must be in "
+                f"{threshold_model.Thresholds._fields}."
+            )
+        self.values = {
+            name: np.unique(
+                np.asarray(
+                    values.get(name, getattr(threshold_model.DEFAULT_THRESHOLDS, name)),
+                    dtype=np.float64,
+                )
+            )
+            for name in threshold_model.Thresholds._fields
+        }
+        self.shape = tuple(len(values) for values in self.values.values())
+
+    def __len__(self):
+        """Get the number of settings."""
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, index):
+        """Get the `Thresholds` of the setting at `index`, in C order of `shape`."""
+        indices = np.unravel_index(index, self.shape)
+        return threshold_model.Thresholds(
+            *(
+                values[value_index]
+                for values, value_index in zip(self.values.values(), indices)
+            )
+        )
+
+    def __repr__(self):
+        """Represent a ThresholdGrid as a string."""
+        return f"ThresholdGrid({len(self)} settings of {self.shape})"
+
+    def get_indices(self, start=0, stop=None):
+        """Get the index into `values` of each threshold for settings `start:stop`.
+
+        Returns
+        -------
+        dict
+            Of the form {threshold: np.ndarray of int}.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        indices = np.unravel_index(np.arange(start, stop), self.shape)
+        return dict(zip(self.values, indices))
+
+
+class SweepCounts:
+    """Counts of detections of each setting of a `ThresholdGrid`, over some scans.
+
+    Parameters
+    ----------
+    grid : ThresholdGrid
+
+    Attributes
+    ----------
+    pixel_counts : np.ndarray of int
+        Number of pixels detected as wildfires by each setting.
+    scan_counts : np.ndarray of int
+        Number of scans with at least one wildfire pixel by each setting.
+    num_pixels : int
+    num_scans : int
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.pixel_counts = np.zeros(len(grid), dtype=np.int64)
+        self.scan_counts = np.zeros(len(grid), dtype=np.int64)
+        self.num_pixels = 0
+        self.num_scans = 0
+
+    def update(self, features):
+        """Add the detections in the `Features` of one scan.
+
+        Parameters
+        ----------
+        features : wildfire.models.threshold_model.Features
+        """
+        ranks, counts = get_rank_histogram(features=features, grid=self.grid)
+        self.num_pixels += features.hot_3_89.size
+        self.num_scans += 1
+        if counts.size == 0:
+            return
+
+        for start in range(0, len(self.grid), SETTINGS_CHUNK_SIZE):
+            indices = self.grid.get_indices(start=start, stop=start + SETTINGS_CHUNK_SIZE)
+
+            def is_exceeded(name, indices=indices):
+                is_greater = RANKS[threshold_model.COMPARISONS[name][1]][1]
+                setting_indices = indices[name][:, np.newaxis]
+                if is_greater:
+                    return setting_indices < ranks[name][np.newaxis, :]
+                return setting_indices >= ranks[name][np.newaxis, :]
+
+            model_features = threshold_model.combine(is_exceeded=is_exceeded)
+            predictions = threshold_model.predict(*model_features)
+            pixel_counts = predictions.astype(np.int64) @ counts
+            stop = start + len(pixel_counts)
+            self.pixel_counts[start:stop] += pixel_counts
+            self.scan_counts[start:stop] += pixel_counts > 0
+
+    def merge(self, other):
+        """Add the counts of `other`, over the same grid, to these counts.
+
+        Parameters
+        ----------
+        other : SweepCounts
+
+        Returns
+        -------
+        SweepCounts
+            self
+        """
+        if other.grid.values.keys() != self.grid.values.keys() or any(
+            not np.array_equal(values, other.grid.values[name])
+            for name, values in self.grid.values.items()
+        ):
+            raise ValueError("Can only merge counts over the same grid.")
+        self.pixel_counts += other.pixel_counts
+        self.scan_counts += other.scan_counts
+        self.num_pixels += other.num_pixels
+        self.num_scans += other.num_scans
+        return self
+
+    def to_dataframe(self):
+        """Tabulate the thresholds and counts of each setting.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per setting, with a column per threshold, and the columns
+            "pixel_count", "pixel_rate", "scan_count" and "scan_rate".
+        """
+        dataframe = pd.DataFrame(
+            {
+                name: self.grid.values[name][indices]
+                for name, indices in self.grid.get_indices().items()
+            }
+        )
+        dataframe["pixel_count"] = self.pixel_counts
+        dataframe["pixel_rate"] = self.pixel_counts / max(self.num_pixels, 1)
+        dataframe["scan_count"] = self.scan_counts
+        dataframe["scan_rate"] = self.scan_counts / max(self.num_scans, 1)
+        return dataframe
+
+
+def get_rank_histogram(features, grid):  # pylint: disable=too-many-locals
+    """Get the joint histogram of ranks of the pixels that may be detected in `grid`.
+
+    The rank of a pixel for a threshold is the number of values of the threshold in
+    `grid` that its feature passes (or fails, for thresholds passed from below, e.g.
+    "cloud_temperature"), such that the pixel passes the threshold's i-th value if and
+    only if i < rank (or i >= rank).
+
+    Parameters
+    ----------
+    features : wildfire.models.threshold_model.Features
+    grid : ThresholdGrid
+
+    Returns
+    -------
+    tuple of (dict, np.ndarray)
+        The ranks of each unique combination, of the form {threshold: np.ndarray of int},
+        and the number of pixels of each combination.
+    """
+    loosest = grid[0]  # hot thresholds are passed from above, so the lowest is loosest
+    with np.errstate(invalid="ignore"):
+        is_candidate = threshold_model.compare(
+            features=features, thresholds=loosest, name="hot_sigma"
+        ) & threshold_model.compare(
+            features=features, thresholds=loosest, name="hot_difference_sigma"
+        )
+    candidates = {
+        name: np.asarray(feature)[is_candidate]
+        for name, feature in features._asdict().items()
+    }
+
+    ranks = []
+    for name, values in grid.values.items():
+        feature_name, comparison = threshold_model.COMPARISONS[name]
+        side, is_greater = RANKS[comparison]
+        feature = candidates[feature_name]
+        rank = np.searchsorted(values, feature, side=side)
+        if is_greater:
+            rank[np.isnan(feature)] = 0  # nan passes no threshold, but sorts last
+        ranks.append(rank)
+
+    if not ranks[0].size:
+        return (
+            dict.fromkeys(grid.values, np.empty(0, dtype=np.int64)),
+            np.empty(0, dtype=np.int64),
+        )
+    unique_ranks, counts = np.unique(np.stack(ranks, axis=1), axis=0, return_counts=True)
+    return dict(zip(grid.values, unique_ranks.T)), counts
+
+
+def save_features(features, filepath):
+    """Persist `features` compactly, as float32 in a compressed .npz file.
+
+    Parameters
+    ----------
+    features : wildfire.models.threshold_model.Features
+    filepath : str
+    """
+    arrays = {
+        name: np.asarray(feature, dtype=np.float32)
+        for name, feature in features._asdict().items()
+    }
+    with instrumentation.timer("persist"):
+        np.savez_compressed(filepath, **arrays)
+    instrumentation.add_bytes(stage="persist", nbytes=os.path.getsize(filepath))
+
+
+def load_features(filepath):
+    """Load features persisted with `save_features`.
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    wildfire.models.threshold_model.Features
+    """
+    with np.load(filepath) as arrays:
+        return threshold_model.Features(
+            **{name: arrays[name] for name in threshold_model.Features._fields}
+        )
+
+
+def extract_features(scan_filepaths, features_directory, pbs=False, **cluster_kwargs):
+    """Compute and persist the `Features` of each scan.
+
+    Parameters
+    ----------
+    scan_filepaths : list of list of str
+        The filepaths of the 16 bands of each scan, as returned by
+        `wildfire.data.goes_level_1.utilities.group_filepaths_into_scans`.
+    features_directory : str
+        Directory in which to persist the features of each scan.
+    pbs : bool, optional
+        Whether or not to launch and parallize using PBS, by default False
+
+    Returns
+    -------
+    list of str
+        Filepaths of the persisted features, one per well formed scan.
+    """
+    memory = None
+    if scan_filepaths:
+        region = goes_level_1.utilities.parse_filename(filename=scan_filepaths[0][0])[0]
+        memory = goes_level_1.utilities.estimate_scan_memory(region=region)
+    filepaths = multiprocessing.map_function(
+        function=_extract_scan_features,
+        function_args=[scan_filepaths, [features_directory] * len(scan_filepaths)],
+        pbs=pbs,
+        memory=memory,
+        retries=goes_level_1_wildfires.SCAN_RETRIES,
+        **cluster_kwargs,
+    )
+    filepaths = list(filter(None, filepaths))
+    _logger.info("Persisted the features of %d scans.", len(filepaths))
+    return filepaths
+
+
+def _extract_scan_features(filepaths, features_directory):
+    try:
+        goes_scan = goes_level_1.scan.read_netcdfs(
+            local_filepaths=filepaths, max_workers=1
+        )
+    except ValueError as error_message:
+        _logger.warning(
+            "\nSkipping malformed goes_scan comprised of %s.\nError: %s",
+            filepaths,
+            error_message,
+        )
+        return None
+
+    features_filepath = os.path.join(
+        features_directory,
+        FEATURES_FILENAME.format(
+            satellite=goes_scan.satellite,
+            region=goes_scan.region,
+            scan_time=goes_scan.scan_time_utc.strftime(DATETIME_FORMAT),
+        ),
+    )
+    with instrumentation.timer("model"):
+        features = goes_level_1_wildfires.get_features(goes_scan=goes_scan)
+    goes_scan.release()
+    save_features(features=features, filepath=features_filepath)
+    return features_filepath
+
+
+def sweep(features_filepaths, grid, pbs=False, **cluster_kwargs):
+    """Count the detections of every setting of `grid` over persisted features.
+
+    The files are split into at most `MAX_CHUNKS` chunks, whose counts are merged on the
+    workers, so that the client only gathers one `SweepCounts` per chunk.
+
+    Parameters
+    ----------
+    features_filepaths : list of str
+        As returned by `extract_features`.
+    grid : ThresholdGrid
+    pbs : bool, optional
+        Whether or not to launch and parallize using PBS, by default False
+
+    Returns
+    -------
+    SweepCounts
+    """
+    scans_per_chunk = max(1, math.ceil(len(features_filepaths) / MAX_CHUNKS))
+    chunks = [
+        features_filepaths[start : start + scans_per_chunk]
+        for start in range(0, len(features_filepaths), scans_per_chunk)
+    ]
+    _logger.info(
+        "Sweeping %s over %d scans in %d chunks...",
+        grid,
+        len(features_filepaths),
+        len(chunks),
+    )
+    sweep_counts = SweepCounts(grid=grid)
+    for chunk_counts in multiprocessing.map_function(
+        function=_count_detections,
+        function_args=[chunks, [grid] * len(chunks)],
+        pbs=pbs,
+        **cluster_kwargs,
+    ):
+        sweep_counts.merge(chunk_counts)
+    return sweep_counts
+
+
+def _count_detections(features_filepaths, grid):
+    sweep_counts = SweepCounts(grid=grid)
+    for features_filepath in features_filepaths:
+        with instrumentation.timer(
+            "read_features", nbytes=os.path.getsize(features_filepath)
+        ):
+            features = load_features(filepath=features_filepath)
+        with instrumentation.timer("sweep"):
+            sweep_counts.update(features=features)
+    return sweep_counts
@@ -1,22 +1,140 @@
-"""Utilities for multiprocessing."""
-from contextlib import contextmanager
+"""Utilities for multiprocessing.
+
+`map_function` runs on one of the backends registered in `BACKENDS`:
+    serial
+        A plain loop in the calling process. For debugging and tiny inputs.
+    threads
+        A `concurrent.futures.ThreadPoolExecutor`. For I/O like globbing and listing.
+    processes
+        A `concurrent.futures.ProcessPoolExecutor`. `function` and its arguments must be
+        picklable.
+    dask
+        A `dask.distributed.LocalCluster` of threads (the default).
+    pbs
+        A `dask_jobqueue.PBSCluster`, as with `pbs=True`.
+    mpi
+        A dask cluster started with `dask_mpi.initialize` across the ranks of an
+        `mpiexec` launch, by `initialize_mpi`. Requires the optional `dask-mpi` and
+        `mpi4py` packages.
+
+Tasks can declare the memory each needs (see `map_function`), so that only as many run
+at once on a worker as fit in its memory: the thread and process backends limit their
+number of workers, and the dask backends request a `MEMORY` worker resource, which
+`dask_client` advertises on every worker.
+
+The default backend is taken from the environment variable `WILDFIRE_BACKEND`, then the
+dask config key `wildfire.backend` (e.g. in `dask_config/dask.yaml`), and can be
+overridden with `set_default_backend` or the `--backend` option of the CLI.
+
+`dask_jobqueue` and `dask_mpi` are imported on first use, so that importing this module
+(and starting the CLIs) stays fast. So is `dask.distributed`, though xarray may already
+have imported it.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+import importlib.util
 import logging
+import os
+import shutil
+import tempfile
 import time
+import uuid
 
-from dask.distributed import Client, LocalCluster, progress
-from dask_jobqueue import PBSCluster
+import dask
 import numpy as np
+import xarray as xr
+
+from wildfire import instrumentation, precision, profiling
+
+# Must be readable by the client and writable by every worker (e.g. /nobackup on NAS).
+SHARED_DIRECTORY = os.environ.get("WILDFIRE_SHARED_DIRECTORY", tempfile.gettempdir())
+SHARED_ARRAY_MIN_BYTES = 2 ** 20
+# adaptive clusters request enough workers to finish the backlog in about this long
+ADAPT_TARGET_DURATION = "30m"
+# name of the worker resource holding a worker's memory in bytes
+MEMORY_RESOURCE = "MEMORY"
+
+SharedArray = namedtuple("SharedArray", ("filepath", "dtype", "shape"))
+SharedDataArray = namedtuple(
+    "SharedDataArray", ("data", "dims", "coords", "attrs", "name")
+)
+SharedDataset = namedtuple("SharedDataset", ("data_vars", "coords", "attrs"))
+
+BACKENDS = {}
+_DEFAULT_BACKEND = os.environ.get(
+    "WILDFIRE_BACKEND", dask.config.get("wildfire.backend", default="dask")
+)
+_MPI_CLIENT = None
 
 _logger = logging.getLogger(__name__)
 
 
-def map_function(function, function_args, pbs=False, **cluster_kwargs):
+def register_backend(name):  # noqa: D202 (black puts a blank line before a nested def)
+    """Register the decorated function as the backend `name` of `map_function`.
+
+    The function must be of the form
+    f(function, function_args, memory=None, retries=0, **cluster_kwargs) -> list,
+    where `function_args` is a list of argument lists as taken by built-in `map`, and
+    `memory` and `retries` are as taken by `map_function`.
+
+    Parameters
+    ----------
+    name : str
+    """
+
+    def decorator(backend):
+        BACKENDS[name] = backend
+        return backend
+
+    return decorator
+
+
+def get_default_backend():
+    """Get the name of the backend used by `map_function` when none is given."""
+    return _DEFAULT_BACKEND
+
+
+def set_default_backend(name):
+    """Set the backend used by `map_function` when none is given.
+
+    Parameters
+    ----------
+    name : str
+        Must be in `BACKENDS`.
+    """
+    global _DEFAULT_BACKEND  # pylint: disable=global-statement
+    _check_backend(name=name)
+    _DEFAULT_BACKEND = name
+
+
+def _check_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}. Must be one of {sorted(BACKENDS)}.")
+
+
+def map_function(  # pylint: disable=too-many-arguments
+    function,
+    function_args,
+    pbs=False,
+    share_results=False,
+    backend=None,
+    batch_size=None,
+    memory=None,
+    retries=0,
+    **cluster_kwargs,
+):
     """Parallize `function` over `function_args` across available CPUs.
 
     Utilizes dask.distributed.Client.map which follows the implementation of built-in
     `map`. See https://docs.python.org/3/library/functions.html#map and
     https://distributed.dask.org/en/latest/client.html.
 
+    The records of `wildfire.instrumentation` made by each task are merged into those of
+    the calling thread, and a sample of tasks are profiled if `wildfire.profiling` is
+    enabled.
+
     Examples
     --------
     ```
@@ -38,30 +156,223 @@ def map_function(function, function_args, pbs=False, **cluster_kwargs):
         f(x1, x2) => y, then `function_args` should be `[all_x1, all_x2]`.
     pbs : bool, optional
         Whether or not to create a PBS job over whose cluster to parallize, by default
-        False.
+        False. Equivalent to `backend="pbs"`.
+    share_results : bool, optional
+        Whether to return large arrays in the results of `function` through memory-mapped
+        files in `SHARED_DIRECTORY` instead of pickling them back to the client, by
+        default False. See `share_arrays`. The files are written to a directory of their
+        own, which is removed once the results are loaded or the map fails. Has no effect
+        on the serial and threads backends, which share memory with the caller.
+    backend : str, optional
+        One of `BACKENDS`. By default `None`, which uses `get_default_backend()`.
+    batch_size : int, optional
+        Number of elements to run in each task, looping over them on the worker. By
+        default `None`, which runs one task per element. Batches that each take about a
+        second keep the overhead of scheduling (~1ms per task) and of pickling small,
+        for many cheap elements. Results are returned in order either way.
+    memory : int, optional
+        Estimated bytes of memory needed by each call of `function`, by default `None`,
+        which runs as many calls at once as there are workers. Otherwise no more calls
+        run at once than fit in memory, e.g. a few Full Disk scans per node. The threads
+        and processes backends use fewer workers, and the dask backends request
+        `memory` of the `MEMORY_RESOURCE` of their workers.
+    retries : int, optional
+        Number of times to retry a call that failed, by default 0. The processes backend
+        retries calls whose worker died, e.g. killed by the operating system for running
+        out of memory, with half as many workers each time. The dask backends retry calls
+        that raised. Their scheduler re-runs calls whose worker died, e.g. restarted by
+        the nanny for running out of memory, whatever `retries`, up to the
+        `distributed.scheduler.allowed-failures` of `dask_config/distributed.yaml`.
+    **cluster_kwargs
+        Passed to the backend. The dask backends pass them to `dask_client`, and the
+        threads and processes backends take `max_workers`, by default `os.cpu_count()`.
 
     Returns
     -------
     list
     """
+    backend = "pbs" if pbs else (backend if backend is not None else _DEFAULT_BACKEND)
+    _check_backend(name=backend)
+    function_args = _to_argument_lists(function_args=function_args)
     _logger.info(
-        "Running %s in parallel with args of shape %s",
-        function.__name__,
-        np.shape(function_args),
+        "Running %s on the %s backend over %d elements",
+        getattr(function, "__name__", repr(function)),
+        backend,
+        len(function_args[0]),
     )
-    with dask_client(pbs=pbs, **cluster_kwargs) as client:
-        if len(np.shape(function_args)) == 1:
-            function_args = [function_args]
+    if batch_size is not None and batch_size > 1:
+        _logger.info("Running in batches of %d elements", batch_size)
+        function = _BatchFunction(function=function)
+        function_args = [
+            [
+                args[start : start + batch_size]
+                for start in range(0, len(args), batch_size)
+            ]
+            for args in function_args
+        ]
+    else:
+        batch_size = None
 
-        futures = client.map(function, *function_args)
-        progress(futures)
-        return_values = client.gather(futures)
+    if profiling.is_enabled():
+        function = profiling.ProfiledFunction(function=function)
+    instrument = backend != "serial"  # the serial backend records in this thread
+    if instrument:
+        function = instrumentation.InstrumentedFunction(function=function)
+    shared_directory = None
+    if share_results and backend not in ("serial", "threads"):
+        # one directory per call, removed even if the gather fails part way
+        shared_directory = tempfile.mkdtemp(
+            prefix="wildfire_shared_", dir=SHARED_DIRECTORY
+        )
+        function = _SharedResultFunction(function=function, directory=shared_directory)
 
+    try:
+        return_values = BACKENDS[backend](
+            function, function_args, memory=memory, retries=retries, **cluster_kwargs
+        )
+        if shared_directory is not None:
+            return_values = [load_shared_arrays(value) for value in return_values]
+    finally:
+        if shared_directory is not None:
+            shutil.rmtree(shared_directory, ignore_errors=True)
+    if instrument:
+        return_values = instrumentation.unpack(return_values)
+    if batch_size is not None:
+        return_values = [value for batch in return_values for value in batch]
     return return_values
 
 
+def _to_argument_lists(function_args):
+    """Make `function_args` a list of argument lists, as taken by built-in `map`."""
+    try:
+        is_single_argument = len(np.shape(function_args)) == 1
+    except ValueError:  # ragged, so already a list of argument lists
+        is_single_argument = False
+    if is_single_argument:
+        return [list(function_args)]
+    return [list(args) for args in function_args]
+
+
+@register_backend("serial")
+def _map_serial(function, function_args, **_):
+    return list(map(function, *function_args))
+
+
+@register_backend("threads")
+def _map_threads(function, function_args, max_workers=None, memory=None, **_):
+    max_workers = _limit_workers(max_workers=max_workers, memory=memory)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, *function_args))
+
+
+@register_backend("processes")
+def _map_processes(
+    function, function_args, max_workers=None, memory=None, retries=0, **_
+):
+    max_workers = _limit_workers(max_workers=max_workers, memory=memory)
+    return_values = [None] * len(function_args[0])
+    remaining = list(range(len(return_values)))
+    for attempt in range(retries + 1):
+        failed = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                (idx, executor.submit(function, *[args[idx] for args in function_args]))
+                for idx in remaining
+            ]
+            for idx, future in futures:
+                try:
+                    return_values[idx] = future.result()
+                except BrokenProcessPool:
+                    failed.append(idx)
+        if not failed:
+            return return_values
+        if attempt < retries:
+            max_workers = max(max_workers // 2, 1)
+            _logger.warning(
+                "A worker died. Retrying %d elements on %d workers...",
+                len(failed),
+                max_workers,
+            )
+        remaining = failed
+    raise BrokenProcessPool(f"Workers died running {len(remaining)} elements.")
+
+
+def _limit_workers(max_workers, memory):
+    """Limit `max_workers` to as many as fit `memory` bytes each in system memory."""
+    max_workers = max_workers or os.cpu_count()
+    if memory is None:
+        return max_workers
+    from distributed import system  # pylint: disable=import-outside-toplevel
+
+    return max(min(max_workers, system.MEMORY_LIMIT // memory), 1)
+
+
+@register_backend("dask")
+def _map_dask(function, function_args, memory=None, retries=0, **cluster_kwargs):
+    with dask_client(pbs=False, **cluster_kwargs) as client:
+        return _map_client(client, function, function_args, memory, retries)
+
+
+@register_backend("pbs")
+def _map_pbs(function, function_args, memory=None, retries=0, **cluster_kwargs):
+    with dask_client(pbs=True, **cluster_kwargs) as client:
+        return _map_client(client, function, function_args, memory, retries)
+
+
+def initialize_mpi():
+    """Start a dask cluster across the ranks of an `mpiexec` launch for the mpi backend.
+
+    Must be called before any other work, since only rank 1 returns, to go on running
+    the caller: rank 0 runs the scheduler and the other ranks a worker each, until rank
+    1 exits. The CLIs call it with `--backend=mpi`, e.g.
+    `mpiexec -n 4 predict --backend=mpi goes-threshold ...`.
+    """
+    global _MPI_CLIENT  # pylint: disable=global-statement
+    # pylint: disable=import-outside-toplevel
+    import dask_mpi
+    from dask.distributed import Client
+
+    dask_mpi.initialize()
+    _MPI_CLIENT = Client()
+    _logger.info("Dask Client: %s", _MPI_CLIENT)
+
+
+@register_backend("mpi")
+def _map_mpi(function, function_args, memory=None, retries=0, **cluster_kwargs):
+    """Map over the cluster of MPI ranks started by `initialize_mpi`.
+
+    The size of the cluster is fixed by `mpiexec`, so `cluster_kwargs` are ignored.
+    """
+    if _MPI_CLIENT is None:
+        raise RuntimeError("Call initialize_mpi before using the mpi backend.")
+    if cluster_kwargs:
+        _logger.info("Ignoring %s on the mpi backend.", sorted(cluster_kwargs))
+    return _map_client(_MPI_CLIENT, function, function_args, memory, retries)
+
+
+def _map_client(client, function, function_args, memory=None, retries=0):
+    resources = None
+    if memory is not None:
+        worker_memory = [
+            worker.get("resources", {}).get(MEMORY_RESOURCE, 0)
+            for worker in client.scheduler_info()["workers"].values()
+        ]
+        if max(worker_memory, default=0) > 0:
+            # a task needing more than any worker has would never run
+            resources = {MEMORY_RESOURCE: min(memory, max(worker_memory))}
+        else:
+            _logger.warning(
+                "Workers do not advertise %s. Ignoring memory.", MEMORY_RESOURCE
+            )
+    from dask.distributed import progress  # pylint: disable=import-outside-toplevel
+
+    futures = client.map(function, *function_args, resources=resources, retries=retries)
+    progress(futures)
+    return client.gather(futures)
+
+
 @contextmanager
-def dask_client(pbs=False, **cluster_kwargs):
+def dask_client(pbs=False, adapt=None, **cluster_kwargs):
     """Context manager surrounding a dask client. Handles closing upon completion.
 
     Examples
@@ -69,12 +380,21 @@ def dask_client(pbs=False, **cluster_kwargs):
     ```
     with dask_client() as client:
         client.do_something()
+
+    with dask_client(pbs=True, adapt={"minimum": 1, "maximum": 20}) as client:
+        client.do_something()
     ```
 
     Parameters
     ----------
     pbs: bool, optional
         Whether or not dask should submit a PBS job over whose cluster to operate.
+    adapt : dict, optional
+        Arguments to `cluster.adapt`, namely `minimum` and `maximum` number of workers
+        (one per PBS job). By default `None`, which does not scale adaptively. Adaptive
+        clusters request workers as the backlog of tasks grows, based on the measured
+        duration of each task, and release them as it drains. `target_duration` defaults
+        to `ADAPT_TARGET_DURATION`.
     **cluster_kwargs:
         Arguments to either `PBSCluster` or `LocalCluster` which are pretty much the
         same. Some usefule arguments include:
@@ -83,13 +403,29 @@ def dask_client(pbs=False, **cluster_kwargs):
             - interface
             - memory
             - walltime
+
+    Every worker advertises its memory in bytes as the resource `MEMORY_RESOURCE`, so
+    that tasks can request a share of it (see `map_function`). If `wildfire.profiling` is
+    enabled, the dask performance report of the client is written to the profile
+    directory.
     """
+    # pylint: disable=import-outside-toplevel
+    from dask.distributed import Client, LocalCluster
+
     if pbs:
+        from dask_jobqueue import PBSCluster  # also sets the defaults of jobqueue.pbs
+
+        cluster_kwargs = _get_pbs_cluster_kwargs(cluster_kwargs=cluster_kwargs)
         cluster = PBSCluster(**cluster_kwargs)
-        if "n_workers" not in cluster_kwargs:
+        if "n_workers" not in cluster_kwargs and adapt is None:
             cluster.scale(1)
     else:
+        worker_memory = _get_worker_memory(pbs=False, cluster_kwargs=cluster_kwargs)
+        cluster_kwargs.setdefault("resources", {MEMORY_RESOURCE: worker_memory})
         cluster = LocalCluster(processes=False, **cluster_kwargs)
+    if adapt is not None:
+        adapt = {"minimum": 1, "target_duration": ADAPT_TARGET_DURATION, **adapt}
+        cluster.adapt(**adapt)
 
     client = Client(cluster)
 
@@ -98,13 +434,255 @@ def dask_client(pbs=False, **cluster_kwargs):
 
     try:
         _logger.info("Dask Cluster: %s\nDask Client: %s", cluster, client)
-        yield client
+        with _performance_report():
+            yield client
 
     finally:
         client.close()
         cluster.close()
         _logger.info("Closed client and cluster")
 
+
+def _performance_report():
+    # pylint: disable=import-outside-toplevel
+    if not profiling.is_enabled():
+        return nullcontext()
+    if importlib.util.find_spec("bokeh") is None:
+        _logger.warning("Install bokeh to write the dask performance report.")
+        return nullcontext()
+    from dask.distributed import performance_report
+
+    return performance_report(filename=profiling.get_report_filepath())
+
+
+def _get_pbs_cluster_kwargs(cluster_kwargs):
+    """Add the `MEMORY_RESOURCE` of each worker to the arguments of a `PBSCluster`.
+
+    Also exports the `wildfire.precision` in use to the jobs, which do not inherit the
+    environment of this process.
+    """
+    worker_memory = _get_worker_memory(pbs=True, cluster_kwargs=cluster_kwargs)
+    extra = cluster_kwargs.get("extra", dask.config.get("jobqueue.pbs.extra", None))
+    env_extra = cluster_kwargs.get(
+        "env_extra", dask.config.get("jobqueue.pbs.env-extra", None)
+    )
+    return {
+        **cluster_kwargs,
+        "extra": list(extra or [])
+        + ["--resources", f"{MEMORY_RESOURCE}={worker_memory}"],
+        "env_extra": list(env_extra or [])
+        + [f"export {precision.ENVIRONMENT_VARIABLE}={precision.get_precision()}"],
+    }
+
+
+def _get_worker_processes(cluster_kwargs):
+    """Get the number of worker processes of each PBS job, as `dask_jobqueue` does.
+
+    Given by `processes`, or `jobqueue.pbs.processes` of the dask config, and otherwise
+    about the square root of the `cores` of the job.
+    """
+    processes = cluster_kwargs.get(
+        "processes", dask.config.get("jobqueue.pbs.processes", default=None)
+    )
+    if processes is None:
+        cores = cluster_kwargs.get(
+            "cores", dask.config.get("jobqueue.pbs.cores", default=None)
+        )
+        if cores is None:
+            return 1
+        # pylint: disable=import-outside-toplevel
+        from distributed.deploy.local import nprocesses_nthreads
+
+        processes, _ = nprocesses_nthreads(cores)
+    return max(int(processes), 1)
+
+
+def _get_worker_memory(pbs, cluster_kwargs):
+    """Get the bytes of memory of each worker of a cluster made with `cluster_kwargs`.
+
+    That of a PBS job is given by `memory`, or `jobqueue.pbs.memory` of the dask config,
+    shared between the worker processes of the job (see `_get_worker_processes`). That
+    of a local worker is given by `memory_limit`, or its share of the system's memory.
+    """
+    if pbs:
+        memory = cluster_kwargs.get(
+            "memory", dask.config.get("jobqueue.pbs.memory", default=None)
+        )
+        num_workers = _get_worker_processes(cluster_kwargs=cluster_kwargs)
+    else:
+        memory = cluster_kwargs.get("memory_limit")
+        num_workers = 1
+    if memory is None or memory == "auto":
+        from distributed import system  # pylint: disable=import-outside-toplevel
+
+        return system.MEMORY_LIMIT // max(cluster_kwargs.get("n_workers") or 1, 1)
+    memory = dask.utils.parse_bytes(memory) if isinstance(memory, str) else int(memory)
+    return memory // num_workers
+
+
+def estimate_node_hours(num_tasks, seconds_per_task, cores_per_job=None):
+    """Estimate the node-hours a PBS cluster needs to run `num_tasks` tasks.
+
+    Parameters
+    ----------
+    num_tasks : int
+    seconds_per_task : float
+        Seconds of a single core for each task.
+    cores_per_job : int, optional
+        By default `None`, which uses `jobqueue.pbs.cores` of the dask config (see
+        `dask_config/jobqueue.yaml`).
+
+    Returns
+    -------
+    float
+    """
+    if cores_per_job is None:
+        cores_per_job = dask.config.get("jobqueue.pbs.cores", default=None) or 1
+    return num_tasks * seconds_per_task / 3600 / cores_per_job
+
+
+def share_arrays(  # pylint: disable=too-many-return-statements
+    obj, directory=None, min_bytes=SHARED_ARRAY_MIN_BYTES
+):
+    """Replace the large arrays in `obj` with handles to memory-mapped files.
+
+    Only the handles need to be pickled when sending `obj` between processes. The
+    receiving process rebuilds `obj` with `load_shared_arrays`. Recurses into `dict`,
+    `list` and `tuple`, and handles `np.ndarray`, `xr.DataArray` and `xr.Dataset`.
+
+    Parameters
+    ----------
+    obj : object
+    directory : str, optional
+        Directory in which to write the memory-mapped files. Must be accessible by the
+        process loading `obj`. By default `None`, which uses `SHARED_DIRECTORY`.
+    min_bytes : int, optional
+        Arrays smaller than this are left in place, since pickling them is cheaper than
+        writing a file.
+
+    Returns
+    -------
+    object
+        `obj`, with arrays of at least `min_bytes` replaced by `SharedArray`.
+    """
+    directory = directory if directory is not None else SHARED_DIRECTORY
+
+    def _share(value):
+        return share_arrays(value, directory=directory, min_bytes=min_bytes)
+
+    if isinstance(obj, np.ndarray):
+        if obj.nbytes < min_bytes or obj.dtype.hasobject:
+            return obj
+        filepath = os.path.join(directory, f"wildfire_shared_{uuid.uuid4().hex}.npy")
+        memmap = np.lib.format.open_memmap(
+            filepath, mode="w+", dtype=obj.dtype, shape=obj.shape
+        )
+        memmap[...] = obj
+        memmap.flush()
+        return SharedArray(filepath=filepath, dtype=obj.dtype.str, shape=obj.shape)
+    if isinstance(obj, xr.Dataset):
+        return SharedDataset(
+            data_vars={
+                name: (variable.dims, _share(variable.values), variable.attrs)
+                for name, variable in obj.data_vars.items()
+            },
+            coords={
+                name: (coord.dims, _share(coord.values), coord.attrs)
+                for name, coord in obj.coords.items()
+            },
+            attrs=obj.attrs,
+        )
+    if isinstance(obj, xr.DataArray):
+        return SharedDataArray(
+            data=_share(obj.values),
+            dims=obj.dims,
+            coords={
+                name: (coord.dims, _share(coord.values), coord.attrs)
+                for name, coord in obj.coords.items()
+            },
+            attrs=obj.attrs,
+            name=obj.name,
+        )
+    if isinstance(obj, dict):
+        return {key: _share(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_share(value) for value in obj]
+    if isinstance(obj, tuple) and not hasattr(obj, "_fields"):
+        return tuple(_share(value) for value in obj)
+    return obj
+
+
+def load_shared_arrays(obj):  # pylint: disable=too-many-return-statements
+    """Rebuild an object returned by `share_arrays`.
+
+    Arrays are opened as read-only memory maps and their backing files are removed, so
+    that the disk space is released as soon as the arrays are garbage collected.
+
+    Parameters
+    ----------
+    obj : object
+
+    Returns
+    -------
+    object
+    """
+    if isinstance(obj, SharedArray):
+        array = np.load(obj.filepath, mmap_mode="r")
+        os.remove(obj.filepath)
+        return array
+    if isinstance(obj, SharedDataset):
+        return xr.Dataset(
+            data_vars=_load_variables(obj.data_vars),
+            coords=_load_variables(obj.coords),
+            attrs=obj.attrs,
+        )
+    if isinstance(obj, SharedDataArray):
+        return xr.DataArray(
+            data=load_shared_arrays(obj.data),
+            dims=obj.dims,
+            coords=_load_variables(obj.coords),
+            attrs=obj.attrs,
+            name=obj.name,
+        )
+    if isinstance(obj, dict):
+        return {key: load_shared_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [load_shared_arrays(value) for value in obj]
+    if isinstance(obj, tuple) and not hasattr(obj, "_fields"):
+        return tuple(load_shared_arrays(value) for value in obj)
+    return obj
+
+
+def _load_variables(variables):
+    return {
+        name: (dims, load_shared_arrays(values), attrs)
+        for name, (dims, values, attrs) in variables.items()
+    }
+
+
+class _BatchFunction:  # pylint: disable=too-few-public-methods
+    """Wrap `function` to run over batches of its arguments, returning a list."""
+
+    def __init__(self, function):
+        self.function = function
+        self.__name__ = getattr(function, "__name__", repr(function))
+
+    def __call__(self, *batch_args):
+        return [self.function(*args) for args in zip(*batch_args)]
+
+
+class _SharedResultFunction:  # pylint: disable=too-few-public-methods
+    """Wrap `function` so that its return value is passed through `share_arrays`."""
+
+    def __init__(self, function, directory=None):
+        self.function = function
+        self.directory = directory if directory is not None else SHARED_DIRECTORY
+        self.__name__ = getattr(function, "__name__", repr(function))
+
+    def __call__(self, *args, **kwargs):
+        return share_arrays(self.function(*args, **kwargs), directory=self.directory)
+
+
 def flatten_array(arr):
     """Flatten an array by 1 dimension."""
     shape = np.array(arr).shape
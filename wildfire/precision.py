@@ -0,0 +1,77 @@
+"""Floating point precision of the calibrated data, model features and training data.
+
+By default, calibration (`GoesBand.reflectance_factor` and `brightness_temperature`) and
+everything derived from it is computed in float64. With a precision of float32, those
+arrays, and so every intermediate of the pipelines (rescaled scans, normalized bands,
+model features and training patches), take half the memory. Calibrated data then has a
+relative error below 1e-6, and normalized bands an absolute error below 1e-4 (see
+`tests/unit/test_precision.py`).
+
+The precision is taken from the environment variable `WILDFIRE_PRECISION` (float32 or
+float64), and can be changed with `set_precision`, which also sets the variable, so that
+it is inherited by the worker processes started afterwards, and exported to the PBS jobs
+by `wildfire.multiprocessing.dask_client`. Workers already running keep their precision.
+"""
+from contextlib import contextmanager
+import os
+
+import numpy as np
+
+PRECISIONS = ("float32", "float64")
+ENVIRONMENT_VARIABLE = "WILDFIRE_PRECISION"
+
+_PRECISION = os.environ.get(ENVIRONMENT_VARIABLE, "float64")
+
+
+def get_precision():
+    """Get the name of the precision in use, one of `PRECISIONS`."""
+    return _PRECISION
+
+
+def get_dtype():
+    """Get the floating point dtype of the precision in use.
+
+    Returns
+    -------
+    np.dtype
+    """
+    return np.dtype(_PRECISION)
+
+
+def set_precision(name):
+    """Set the precision of the calibrated data and everything derived from it.
+
+    Also sets `ENVIRONMENT_VARIABLE`, for the workers started afterwards.
+
+    Parameters
+    ----------
+    name : str
+        Must be in `PRECISIONS`.
+    """
+    global _PRECISION  # pylint: disable=global-statement
+    if name not in PRECISIONS:
+        raise ValueError(f"Unknown precision {name}. Must be one of {PRECISIONS}.")
+    _PRECISION = name
+    os.environ[ENVIRONMENT_VARIABLE] = name
+
+
+@contextmanager
+def using(name):
+    """Use the precision `name` within the surrounded block.
+
+    The precision and `ENVIRONMENT_VARIABLE` are restored as they were afterwards.
+
+    Parameters
+    ----------
+    name : str
+        Must be in `PRECISIONS`.
+    """
+    previous = _PRECISION
+    previous_environment = os.environ.get(ENVIRONMENT_VARIABLE)
+    set_precision(name=name)
+    try:
+        yield
+    finally:
+        set_precision(name=previous)
+        if previous_environment is None:
+            del os.environ[ENVIRONMENT_VARIABLE]
@@ -0,0 +1,112 @@
+"""Opt-in profiling of the tasks run by `wildfire.multiprocessing.map_function`.
+
+Profiling is off by default. Once enabled with `enable` (e.g. by the `--profile` option of
+the CLIs), a sample of the tasks of `map_function` are profiled with either `cProfile` or
+the optional `pyinstrument`, and each profile is written to the profile directory, along
+with the performance report of every dask cluster (see
+https://distributed.dask.org/en/latest/diagnosing-performance.html).
+
+cProfile profiles (.prof) can be read with `python -m pstats` or `snakeviz`, and
+pyinstrument and dask profiles (.html) with a browser.
+"""
+import cProfile
+import datetime
+import logging
+import os
+import random
+import uuid
+
+PROFILERS = ("cprofile", "pyinstrument")
+DEFAULT_SAMPLE_RATE = 0.1
+
+_SETTINGS = {
+    "directory": None,
+    "sample_rate": DEFAULT_SAMPLE_RATE,
+    "profiler": "cprofile",
+}
+
+_logger = logging.getLogger(__name__)
+
+
+def enable(directory, sample_rate=DEFAULT_SAMPLE_RATE, profiler="cprofile"):
+    """Profile a sample of the tasks run from now on.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write profiles. Must be writable by every worker.
+    sample_rate : float, optional
+        Fraction of tasks to profile, by default `DEFAULT_SAMPLE_RATE`.
+    profiler : str, optional
+        One of `PROFILERS`, by default "cprofile". pyinstrument is a sampling profiler
+        with less overhead, but must be installed separately.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler}. Must be one of {PROFILERS}.")
+    os.makedirs(directory, exist_ok=True)
+    _SETTINGS.update(directory=directory, sample_rate=sample_rate, profiler=profiler)
+    _logger.info(
+        "Profiling %.0f%% of tasks with %s into %s",
+        100 * sample_rate,
+        profiler,
+        directory,
+    )
+
+
+def disable():
+    """Stop profiling tasks."""
+    _SETTINGS["directory"] = None
+
+
+def is_enabled():
+    """Whether tasks are being profiled."""
+    return _SETTINGS["directory"] is not None
+
+
+def get_report_filepath():
+    """Get a new filepath for a dask performance report in the profile directory."""
+    now = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    return os.path.join(_SETTINGS["directory"], f"dask_report_{now}.html")
+
+
+class ProfiledFunction:  # pylint: disable=too-few-public-methods
+    """Wrap `function` to profile a sample of its calls, writing each profile to a file.
+
+    The settings of `enable` are captured when wrapping, so that they travel with the
+    function to the workers.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.__name__ = getattr(function, "__name__", repr(function))
+        self.directory = _SETTINGS["directory"]
+        self.sample_rate = _SETTINGS["sample_rate"]
+        self.profiler = _SETTINGS["profiler"]
+
+    def __call__(self, *args, **kwargs):
+        """Call `function`, profiling the call with probability `sample_rate`."""
+        if random.random() >= self.sample_rate:
+            return self.function(*args, **kwargs)
+
+        filepath = os.path.join(
+            self.directory, f"{self.__name__}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        )
+        if self.profiler == "pyinstrument":
+            import pyinstrument  # pylint: disable=import-outside-toplevel
+
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                return self.function(*args, **kwargs)
+            finally:
+                profiler.stop()
+                with open(f"{filepath}.html", "w") as buffer:
+                    buffer.write(profiler.output_html())
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{filepath}.prof")